@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Race-partitioned index of a card's tables for the handicapping loop.
+
+A CardIndex groups the rows of one table (current race info or past starts)
+by race once. Looking up a race returns only that race's rows, so the
+per-race steps (contender isolation, grouping, situational adjustments,
+reporting) never scan the whole card. Processed files are written ordered by track and race, so a
+race's rows are usually one contiguous slice and the lookup copies nothing.
+"""
+import logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# (track code without padding, race number)
+RaceKey = Tuple[str, int]
+
+def race_key(track: Any, race: Any) -> RaceKey:
+    return str(track).strip().upper(), int(race)
+
+def _rows(df: pd.DataFrame, positions: np.ndarray) -> pd.DataFrame:
+    if len(positions) and positions[-1] - positions[0] + 1 == len(positions):
+        return df.iloc[positions[0]:positions[-1] + 1]
+    return df.iloc[positions]
+
+class CardIndex:
+    """The rows of one card table, partitioned by race (track, race)."""
+
+    def __init__(self, df: pd.DataFrame, track_col: str = 'track', race_col: str = 'race'):
+        self.df = df
+        self.positions: Dict[RaceKey, np.ndarray] = {}
+        # Without race columns every lookup returns the whole table.
+        self.indexed = track_col in df.columns and race_col in df.columns
+        if not self.indexed:
+            logger.warning(f"Table has no '{track_col}'/'{race_col}' columns; race lookups return every row.")
+            return
+        keys = pd.DataFrame({
+            'track': df[track_col].astype(str).str.strip().str.upper().to_numpy(),
+            'race': df[race_col].to_numpy(),
+        })
+        for (track, race), positions in keys.groupby(['track', 'race'], sort=False).indices.items():
+            self.positions[race_key(track, race)] = positions
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __contains__(self, key: RaceKey) -> bool:
+        return key in self.positions
+
+    def keys(self) -> List[RaceKey]:
+        """The races of the card, in order of first appearance."""
+        return list(self.positions)
+
+    def race(self, track: Any, race: Any) -> pd.DataFrame:
+        """The rows of one race (none if the card does not have it)."""
+        if not self.indexed:
+            return self.df
+        positions = self.positions.get(race_key(track, race))
+        return self.df.iloc[0:0] if positions is None else _rows(self.df, positions)
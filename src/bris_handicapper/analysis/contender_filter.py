@@ -6,8 +6,11 @@ This script implements Step 2 of the Adapted Handicapping Process, filtering
 the field to identify legitimate contenders based on a set of predefined rules.
 """
 import logging
+import numpy as np
 import pandas as pd
-from typing import List, Set
+from typing import Dict, List, Optional, Set
+
+from bris_handicapper.analysis.horse_features import HORSE_COLUMN, RACE_COLUMNS, build_horse_features
 
 logger = logging.getLogger(__name__)
 
@@ -16,84 +19,106 @@ PRIME_POWER_RANK_THRESHOLD = 4
 COMPETITIVE_SPEED_POINT_DIFFERENCE = 5
 PACE_FIGURE_RANK_THRESHOLD = 3
 PEDIGREE_RATING_IMPROVEMENT_THRESHOLD = 5
-RECENT_RACE_COUNT = 3
-
-def get_top_last_race_speed(race_df: pd.DataFrame, past_starts_df: pd.DataFrame) -> float:
+# Horse feature of each pace figure for Rule 3
+PACE_FEATURES = ['best_2f_pace', 'best_4f_pace', 'best_late_pace']
+
+# Feature table column of each rule (set by flag_contenders) -> its log label
+CONTENDER_RULES: Dict[str, str] = {
+    'rule_prime_power': 'Rule 1 (Prime Power)',
+    'rule_competitive_speed': 'Rule 2 (Competitive Speed)',
+    'rule_pace': f'Rule 3 (Top {PACE_FIGURE_RANK_THRESHOLD} Pace Figure)',
+    'rule_pedigree': 'Rule 4 (Pedigree)',
+}
+
+def get_top_last_race_speed(features: pd.DataFrame) -> float:
     """
     Finds the highest Brisnet Speed Rating from any horse's most recent race.
     """
-    race_horses = race_df['program_number_if_available'].unique()
-    relevant_pps = past_starts_df[past_starts_df['pp_post_position'].isin(race_horses)]
-    if relevant_pps.empty:
+    if features['last_speed'].isnull().all():
         return 0
-    last_races = relevant_pps.loc[relevant_pps.groupby('pp_post_position')['pp_race_date'].idxmax()]
-    if 'pp_bris_speed_rating' in last_races.columns and not last_races['pp_bris_speed_rating'].isnull().all():
-        return last_races['pp_bris_speed_rating'].max()
-    return 0
+    return features['last_speed'].max()
 
-def isolate_contenders(race_df: pd.DataFrame, past_starts_df: pd.DataFrame) -> pd.DataFrame:
+def flag_contenders(current_races_df: pd.DataFrame, features: pd.DataFrame) -> pd.DataFrame:
+    """
+    Evaluates the four contender rules for every race of current_races_df (a
+    whole card or one race) in one pass: per-race ranks for Prime Power and
+    the pace figures, a per-race max for the speed benchmark and column
+    algebra for the pedigree switches. features is the horse feature table of
+    current_races_df (same rows, same order). Returns it with one boolean
+    column per rule (CONTENDER_RULES).
+    """
+    if len(features) != len(current_races_df):
+        raise ValueError(f"Horse features have {len(features)} rows for {len(current_races_df)} horses")
+    values = features.reset_index(drop=True)
+    race_columns = [c for c in RACE_COLUMNS if c in current_races_df.columns]
+    if race_columns:
+        race_ids = current_races_df.groupby(race_columns, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    else:
+        race_ids = np.zeros(len(values), dtype=int)
+
+    def top(series: pd.Series, n: int, eligible: Optional[pd.Series] = None) -> pd.Series:
+        # As nlargest per race: ties go to the horse listed first, and horses
+        # without a value fill the places left after those with one.
+        keep = np.ones(len(series), dtype=bool) if eligible is None else eligible.to_numpy()
+        ranks = series[keep].groupby(race_ids[keep], sort=False).rank(method='first', ascending=False, na_option='bottom')
+        return (ranks <= n).reindex(series.index, fill_value=False)
+
+    prime_power = pd.Series(current_races_df['bris_prime_power_rating'].to_numpy(), index=values.index)
+    benchmark = values['last_speed'].groupby(race_ids, sort=False).transform('max').fillna(0)
+    surface = pd.Series(current_races_df['surface'].to_numpy(), index=values.index)
+    turf_switch = ((surface == 'T') & ~values['has_turf_start']
+                   & (values['turf_pedigree_edge'] > PEDIGREE_RATING_IMPROVEMENT_THRESHOLD))
+    wet_switch = (values['wet_today'] & ~values['has_wet_start']
+                  & (values['mud_pedigree_edge'] > PEDIGREE_RATING_IMPROVEMENT_THRESHOLD))
+
+    flags = {
+        'rule_prime_power': top(prime_power, PRIME_POWER_RANK_THRESHOLD),
+        'rule_competitive_speed': values['best_recent_speed'] >= benchmark - COMPETITIVE_SPEED_POINT_DIFFERENCE,
+        # Only horses with past starts are ranked on their pace figures; those
+        # without a figure still fill the places left after the rated ones.
+        'rule_pace': np.logical_or.reduce([top(values[f], PACE_FIGURE_RANK_THRESHOLD, values['n_starts'] > 0)
+                                           for f in PACE_FEATURES]),
+        'rule_pedigree': turf_switch | wet_switch,
+    }
+    return features.assign(**{rule: np.asarray(flag, dtype=bool) for rule, flag in flags.items()})
+
+def contender_mask(current_races_df: pd.DataFrame, features: pd.DataFrame) -> pd.Series:
+    """True for the contenders of every race of current_races_df, on its index."""
+    flagged = flag_contenders(current_races_df, features)
+    return pd.Series(flagged[list(CONTENDER_RULES)].to_numpy().any(axis=1), index=current_races_df.index)
+
+def isolate_contenders(race_df: pd.DataFrame, past_starts_df: pd.DataFrame,
+                       features: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Filters a race's full field to identify and return only legitimate contenders.
+    past_starts_df holds the race's past starts (see analysis.card_index);
+    features is the race's horse feature table, built from them when not
+    given. Rules already flagged on it (flag_contenders over the whole card)
+    are used as they are.
     """
     race_num = race_df['race'].iloc[0]
     logger.info(f"--- Isolating Contenders for Race {race_num} ---")
     if race_df.empty:
         logger.warning("Input race_df is empty. Cannot identify contenders.")
         return pd.DataFrame()
+    if features is None:
+        features = build_horse_features(race_df, past_starts_df)
+    if not set(CONTENDER_RULES).issubset(features.columns):
+        features = flag_contenders(race_df, features)
 
     contenders = set()
-
-    # Rule 1: Top Tier Prime Power
-    top_prime_power = race_df.nlargest(PRIME_POWER_RANK_THRESHOLD, 'bris_prime_power_rating')
-    new_contenders = set(top_prime_power['program_number_if_available'].unique()) - contenders
-    if new_contenders:
-        logger.debug(f"Rule 1 (Prime Power) adds: {new_contenders}")
-        contenders.update(new_contenders)
-
-    # Rule 2: Competitive Speed
-    top_speed_benchmark = get_top_last_race_speed(race_df, past_starts_df)
-    speed_threshold = top_speed_benchmark - COMPETITIVE_SPEED_POINT_DIFFERENCE
-    race_horses = race_df['program_number_if_available'].unique()
-    relevant_pps = past_starts_df[past_starts_df['pp_post_position'].isin(race_horses)]
-    last_three_races = relevant_pps.groupby('pp_post_position').tail(RECENT_RACE_COUNT)
-    competitive_speed_horses = last_three_races[last_three_races['pp_bris_speed_rating'] >= speed_threshold]
-    new_contenders = set(competitive_speed_horses['program_number_if_available'].unique()) - contenders
-    if new_contenders:
-        logger.debug(f"Rule 2 (Competitive Speed >= {speed_threshold}) adds: {new_contenders}")
-        contenders.update(new_contenders)
-
-    # Rule 3: Pace Advantage
-    pace_figures = ['pp_bris_pace_2f', 'pp_bris_pace_4f', 'pp_bris_late_pace']
-    for fig in pace_figures:
-        if fig in relevant_pps.columns:
-            best_pace_per_horse = relevant_pps.groupby('program_number_if_available')[fig].max().nlargest(PACE_FIGURE_RANK_THRESHOLD)
-            new_contenders = set(best_pace_per_horse.index) - contenders
-            if new_contenders:
-                logger.debug(f"Rule 3 (Top {PACE_FIGURE_RANK_THRESHOLD} in {fig}) adds: {new_contenders}")
-                contenders.update(new_contenders)
-
-    # Rule 4: Pedigree Potential
-    for _, horse in race_df.iterrows():
-        prog_num = horse['program_number_if_available']
-        horse_pps = past_starts_df[past_starts_df['pp_post_position'] == prog_num]
-        # Turf Switch
-        if horse['surface'] == 'T' and not (horse_pps['pp_surface'] == 'T').any():
-            if horse['bris_turf_pedigree_rating'] > horse.get('bris_dirt_pedigree_rating', 0) + PEDIGREE_RATING_IMPROVEMENT_THRESHOLD:
-                if prog_num not in contenders:
-                    logger.debug(f"Rule 4 (Pedigree) adds #{prog_num} for Turf switch.")
-                    contenders.add(prog_num)
-        # Wet Track Switch
-        if horse['surface'] in ['M', 'S'] and not (horse_pps['pp_track_condition'].isin(['M', 'S', 'SY'])).any():
-            if horse['bris_mud_pedigree_rating'] > horse.get('bris_dirt_pedigree_rating', 0) + PEDIGREE_RATING_IMPROVEMENT_THRESHOLD:
-                if prog_num not in contenders:
-                    logger.debug(f"Rule 4 (Pedigree) adds #{prog_num} for Wet Track.")
-                    contenders.add(prog_num)
+    horses = race_df[HORSE_COLUMN].to_numpy()
+    for rule, label in CONTENDER_RULES.items():
+        new_contenders = set(horses[features[rule].to_numpy()]) - contenders
+        if new_contenders:
+            logger.debug(f"{label} adds: {new_contenders}")
+            contenders.update(new_contenders)
 
     if not contenders:
         logger.warning(f"No contenders were identified for Race {race_num} based on the rules.")
         return pd.DataFrame()
 
-    final_contenders_df = race_df[race_df['pp_post_position'].isin(contenders)].copy()
+    final_contenders_df = race_df[features[list(CONTENDER_RULES)].to_numpy().any(axis=1)].copy()
     logger.info(f"Identified {len(final_contenders_df)} contenders for Race {race_num}: {sorted(list(contenders))}")
     logger.info("--- Contender Isolation Complete ---")
     return final_contenders_df
@@ -106,6 +131,7 @@ if __name__ == '__main__':
         'track': ['TEST']*6,
         'race': [5]*6,
         'program_number_if_available': ['1', '2', '3', '4', '5', '6'],
+        'post_position': [1, 2, 3, 4, 5, 6],
         'horse_name': ['Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo', 'Foxtrot'],
         'bris_prime_power_rating': [145, 142, 140, 135, 130, 128],
         'surface': ['D', 'D', 'T', 'M', 'D', 'T'],
@@ -116,11 +142,13 @@ if __name__ == '__main__':
     mock_race_df = pd.DataFrame(mock_race_data)
 
     mock_past_starts_data = {
-        'pp_post_position': ['1', '1', '1', '2', '2', '2', '3', '3', '4', '4', '5', '5', '6', '6'],
+        'track': ['TEST']*14,
+        'race': [5]*14,
+        'post_position': [1, 1, 1, 2, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6],
         'pp_race_date': pd.to_datetime(['2024-01-01', '2024-02-01', '2024-03-01', '2024-01-15', '2024-02-15', '2024-03-15', '2024-01-20', '2024-02-20', '2024-01-10', '2024-02-10', '2024-01-25', '2024-02-25', '2024-01-18', '2024-02-18']),
         'pp_bris_speed_rating': [95, 92, 98, 90, 94, 91, 85, 88, 89, 92, 80, 82, 70, 75],
-        'pp_bris_pace_2f': [90, 92, 91, 99, 86, 84, 80, 82, 81, 83, 75, 76, 98, 97],
-        'pp_bris_pace_4f': [88, 89, 90, 92, 93, 91, 95, 96, 94, 95, 85, 86, 88, 87],
+        'pp_bris_2f_pace': [90, 92, 91, 99, 86, 84, 80, 82, 81, 83, 75, 76, 98, 97],
+        'pp_bris_4f_pace': [88, 89, 90, 92, 93, 91, 95, 96, 94, 95, 85, 86, 88, 87],
         'pp_bris_late_pace': [93, 94, 95, 85, 86, 87, 98, 99, 90, 91, 92, 93, 80, 81],
         'pp_surface': ['D', 'D', 'D', 'D', 'D', 'D', 'D', 'D', 'D', 'D', 'D', 'D', 'D', 'D'],
         'pp_track_condition': ['FT', 'FT', 'FT', 'FT', 'FT', 'FT', 'FT', 'FT', 'FT', 'FT', 'FT', 'FT', 'SY', 'M']
@@ -132,6 +160,6 @@ if __name__ == '__main__':
     print("\n--- TEST RESULTS ---")
     if not contenders.empty:
         print("Identified Contenders:")
-        print(contenders[['pp_post_position', 'horse_name']])
+        print(contenders[['program_number_if_available', 'horse_name']])
     else:
         print("No contenders identified.")
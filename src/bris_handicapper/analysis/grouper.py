@@ -8,11 +8,14 @@ of key performance indicators.
 """
 import logging
 import pandas as pd
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+from bris_handicapper.analysis.horse_features import build_horse_features, by_horse
 
 logger = logging.getLogger(__name__)
 
 # --- Configuration for Grouping Analysis ---
+# 'past' factors are horse features (analysis.horse_features.BEST_FIGURES) of the same name.
 FACTOR_MATRIX_CONFIG = {
     'bris_prime_power_rating': {
         'source_col': 'bris_prime_power_rating',
@@ -25,12 +28,12 @@ FACTOR_MATRIX_CONFIG = {
         'higher_is_better': True
     },
     'best_2f_pace': {
-        'source_col': 'pp_bris_pace_2f',
+        'source_col': 'pp_bris_2f_pace',
         'source_df': 'past',
         'higher_is_better': True
     },
     'best_4f_pace': {
-        'source_col': 'pp_bris_pace_4f',
+        'source_col': 'pp_bris_4f_pace',
         'source_df': 'past',
         'higher_is_better': True
     },
@@ -54,9 +57,11 @@ GAP_PENALTY = 3
 GROUP_1_SIZE = 2
 GROUP_2_SIZE = 2
 
-def group_contenders(contenders_df: pd.DataFrame, past_starts_df: pd.DataFrame) -> Dict[str, List[Any]]:
+def group_contenders(contenders_df: pd.DataFrame, past_starts_df: pd.DataFrame,
+                     features: Optional[pd.DataFrame] = None) -> Dict[str, List[Any]]:
     """
     Stratifies contenders into Groups 1, 2, and 3 based on gap analysis.
+    features is the race's horse feature table, built when not given.
     """
     race_num = contenders_df['race'].iloc[0]
     logger.info(f"--- Grouping Contenders for Race {race_num} ---")
@@ -65,15 +70,16 @@ def group_contenders(contenders_df: pd.DataFrame, past_starts_df: pd.DataFrame)
         logger.warning("Not enough contenders to perform grouping. Assigning all to Group 1.")
         return {"Group 1": contenders_df['program_number_if_available'].tolist(), "Group 2": [], "Group 3": []}
 
+    if features is None:
+        features = build_horse_features(contenders_df, past_starts_df)
+    horse_features = by_horse(features)
     factor_matrix = pd.DataFrame(index=contenders_df['program_number_if_available'])
 
     for factor, config in FACTOR_MATRIX_CONFIG.items():
-        source_col = config['source_col']
         if config['source_df'] == 'current':
-            factor_values = contenders_df.set_index('program_number_if_available')[source_col]
+            factor_values = contenders_df.set_index('program_number_if_available')[config['source_col']]
         else:
-            relevant_pps = past_starts_df[past_starts_df['pp_post_position'].isin(factor_matrix.index)]
-            factor_values = relevant_pps.groupby('program_number_if_available')[source_col].max() if not relevant_pps.empty else pd.Series(dtype=float)
+            factor_values = horse_features[factor]
         factor_matrix[factor] = factor_values
 
     factor_matrix['grouping_score'] = 0
@@ -92,9 +98,11 @@ def group_contenders(contenders_df: pd.DataFrame, past_starts_df: pd.DataFrame)
             factor_matrix.loc[horses_with_gap, 'grouping_score'] += GAP_PENALTY
 
     sorted_scores = factor_matrix['grouping_score'].sort_values(ascending=True)
-    logger.debug(f"Factor Matrix and Scores for Race {race_num}:\n{factor_matrix.to_string()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Factor Matrix and Scores for Race {race_num}:\n{factor_matrix.to_string()}")
 
-    favorite_prog_num = contenders_df.sort_values(by='morning_line_odds').iloc[0]['program_number_if_available']
+    favorite = contenders_df.sort_values(by='morn_line_odds_if_available', key=lambda odds: pd.to_numeric(odds, errors='coerce'))
+    favorite_prog_num = favorite.iloc[0]['program_number_if_available']
 
     group1_candidates = set(sorted_scores.head(GROUP_1_SIZE).index)
     group1_candidates.add(favorite_prog_num)
@@ -119,17 +127,20 @@ if __name__ == '__main__':
         'track': ['TEST'] * 5,
         'race': [5] * 5,
         'program_number_if_available': ['1', '2', '3', '4', '5'],
+        'post_position': [1, 2, 3, 4, 5],
         'horse_name': ['Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo'],
-        'morning_line_odds': [2.0, 3.0, 10.0, 5.0, 12.0],
+        'morn_line_odds_if_available': ['2.00', '3.00', '10.00', '5.00', '12.00'],
         'bris_prime_power_rating': [145.0, 148.0, 130.0, 144.0, 125.0],
     }
     mock_contenders_df = pd.DataFrame(mock_contenders_data)
 
     mock_pp_data = {
-        'pp_post_position': ['1', '1', '2', '2', '3', '3', '4', '4', '5', '5'],
+        'track': ['TEST'] * 10,
+        'race': [5] * 10,
+        'post_position': [1, 1, 2, 2, 3, 3, 4, 4, 5, 5],
         'pp_bris_speed_rating': [95, 100, 98, 99, 85, 86, 96, 97, 80, 82],
-        'pp_bris_pace_2f': [90, 92, 95, 96, 80, 81, 88, 89, 75, 76],
-        'pp_bris_pace_4f': [100, 101, 98, 99, 90, 91, 95, 96, 85, 86],
+        'pp_bris_2f_pace': [90, 92, 95, 96, 80, 81, 88, 89, 75, 76],
+        'pp_bris_4f_pace': [100, 101, 98, 99, 90, 91, 95, 96, 85, 86],
         'pp_bris_late_pace': [95, 96, 96.5, 97.5, 85, 86, 91.5, 92.5, 80, 81]
     }
     mock_pp_df = pd.DataFrame(mock_pp_data)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Per-horse feature table shared by the handicapping steps.
+
+build_horse_features computes, once per card, one row per entered horse
+with everything the contender filter, grouper, situational analyzer and
+reporter need from its past starts and its current race row:
+
+    last_speed                 BRIS speed rating of its most recent start
+    best_recent_speed          best speed rating over its last RECENT_RACE_COUNT starts
+    best_<figure>              best value of each BEST_FIGURES column
+    n_starts                   past starts on file
+    has_turf_start             has raced on turf
+    has_wet_start              has raced on a wet track (WET_TRACK_CONDITIONS)
+    wet_today                  today's race is on a wet surface (WET_SURFACES) or
+                               a late change set a wet track condition (CONDITION_COLUMN)
+    turf_pedigree_edge         turf minus dirt pedigree rating
+    mud_pedigree_edge          mud minus dirt pedigree rating
+    tj_combo_roi_365d, tj_combo_starts_365d   trainer/jockey statistics
+
+All of it comes from vectorised groupbys over the card's past starts, so
+every step sees the same values and none of them rescans the past starts.
+The steps identify a horse by its program number (HORSE_COLUMN); its past
+starts, which carry no program number, are matched on HORSE_KEY_COLUMNS.
+"""
+import logging
+from typing import Dict, List
+
+import pandas as pd
+
+from bris_handicapper.data_processing.window_features import REDUCER_LAST, REDUCER_MAX, WindowFeature, add_window_features
+
+logger = logging.getLogger(__name__)
+
+# Identifies a horse to the handicapping steps
+HORSE_COLUMN = 'program_number_if_available'
+RACE_COLUMNS = ['track', 'race']
+# Identifies a horse in both the current race rows and its past starts
+HORSE_KEY_COLUMNS = RACE_COLUMNS + ['post_position']
+
+SPEED_COLUMN = 'pp_bris_speed_rating'
+RECENT_RACE_COUNT = 3
+TURF_SURFACE = 'T'
+# Wet track condition codes: sloppy, muddy, sealed, heavy and wet fast
+WET_TRACK_CONDITIONS = ['M', 'S', 'SY', 'MY', 'SL', 'HY', 'WF']
+WET_SURFACES = ['M', 'S']
+# Today's track condition, when a late change sets one (see late_changes)
+CONDITION_COLUMN = 'track_condition'
+
+# Best (largest) value of each past start figure, by feature name
+BEST_FIGURES: Dict[str, str] = {
+    'best_bris_speed_rating': 'pp_bris_speed_rating',
+    'best_2f_pace': 'pp_bris_2f_pace',
+    'best_4f_pace': 'pp_bris_4f_pace',
+    'best_late_pace': 'pp_bris_late_pace',
+}
+
+RECENT_SPEED_FEATURES: List[WindowFeature] = [
+    WindowFeature('last_speed', SPEED_COLUMN, 1, REDUCER_LAST),
+    WindowFeature('best_recent_speed', SPEED_COLUMN, RECENT_RACE_COUNT, REDUCER_MAX),
+]
+
+# Current race columns carried into the table (as numbers), by feature name
+CURRENT_RACE_FEATURES: Dict[str, str] = {
+    'tj_combo_roi_365d': 't_j_combo_2_roi_365d',
+    'tj_combo_starts_365d': 't_j_combo_starts_365d',
+}
+
+def pedigree_rating(values: pd.Series) -> pd.Series:
+    """BRIS pedigree ratings as numbers; the '*' marking a rating on limited data is dropped."""
+    return pd.to_numeric(values.astype(str).str.strip().str.rstrip('*'), errors='coerce')
+
+def _past_start_features(past_starts_df: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """One row per horse (keys) with the features of its past starts."""
+    pps = past_starts_df.dropna(subset=keys)
+    grouped = pps.groupby(keys, sort=False, observed=True)
+    figures = {name: column for name, column in BEST_FIGURES.items() if column in pps.columns}
+    features = grouped[list(dict.fromkeys(figures.values()))].max() if figures else grouped.size().to_frame()[[]]
+    features = pd.DataFrame({name: features[column].astype('float64') for name, column in figures.items()}, index=features.index)
+    features['n_starts'] = grouped.size()
+    if 'pp_surface' in pps.columns:
+        features['has_turf_start'] = (pps['pp_surface'] == TURF_SURFACE).groupby([pps[k] for k in keys], sort=False, observed=True).any()
+    if 'pp_track_condition' in pps.columns:
+        features['has_wet_start'] = pps['pp_track_condition'].isin(WET_TRACK_CONDITIONS).groupby([pps[k] for k in keys], sort=False, observed=True).any()
+    if SPEED_COLUMN in pps.columns and 'pp_race_date' in pps.columns:
+        recent = add_window_features(pps[keys + ['pp_race_date', SPEED_COLUMN]], keys, 'pp_race_date', RECENT_SPEED_FEATURES)
+        recent = recent.drop_duplicates(keys).set_index(keys)
+        for feature in RECENT_SPEED_FEATURES:
+            features[feature.name] = recent[feature.name]
+    return features.reset_index()
+
+def build_horse_features(current_races_df: pd.DataFrame, past_starts_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The feature table of the horses in current_races_df (a card or one
+    race), in its row order: the race columns, HORSE_COLUMN, the horse key
+    columns and the features. Horses without past starts get null figures,
+    zero starts and False history flags.
+    """
+    keys = [c for c in HORSE_KEY_COLUMNS if c in current_races_df.columns and c in past_starts_df.columns]
+    race_columns = [c for c in RACE_COLUMNS if c in current_races_df.columns]
+    table = current_races_df[list(dict.fromkeys(race_columns + [HORSE_COLUMN] + keys))].reset_index(drop=True)
+
+    ratings = {surface: pedigree_rating(current_races_df[f'bris_{surface}_pedigree_rating']).to_numpy()
+               if f'bris_{surface}_pedigree_rating' in current_races_df.columns else float('nan')
+               for surface in ('dirt', 'turf', 'mud')}
+    for surface in ('turf', 'mud'):
+        table[f'{surface}_pedigree_edge'] = ratings[surface] - ratings['dirt']
+    wet_today = (current_races_df['surface'].isin(WET_SURFACES) if 'surface' in current_races_df.columns
+                 else pd.Series(False, index=current_races_df.index))
+    if CONDITION_COLUMN in current_races_df.columns:
+        condition = current_races_df[CONDITION_COLUMN].astype('string').str.strip().str.upper()
+        wet_today |= condition.isin(WET_TRACK_CONDITIONS).fillna(False)
+    table['wet_today'] = wet_today.to_numpy(dtype=bool)
+    for name, column in CURRENT_RACE_FEATURES.items():
+        table[name] = (pd.to_numeric(current_races_df[column], errors='coerce').to_numpy()
+                       if column in current_races_df.columns else float('nan'))
+
+    if HORSE_KEY_COLUMNS[-1] in keys and not past_starts_df.empty:
+        table = table.merge(_past_start_features(past_starts_df, keys), on=keys, how='left')
+    else:
+        logger.warning(f"No past starts with '{HORSE_KEY_COLUMNS[-1]}'; horse features have no past start figures.")
+    for name in list(BEST_FIGURES) + [f.name for f in RECENT_SPEED_FEATURES]:
+        if name not in table.columns:
+            table[name] = float('nan')
+    table['n_starts'] = table['n_starts'].fillna(0).astype(int) if 'n_starts' in table.columns else 0
+    for flag in ('has_turf_start', 'has_wet_start'):
+        table[flag] = table[flag].fillna(False).astype(bool) if flag in table.columns else False
+    return table
+
+def by_horse(features: pd.DataFrame) -> pd.DataFrame:
+    """A race's feature rows indexed by HORSE_COLUMN (one row per horse)."""
+    return features.drop_duplicates(HORSE_COLUMN).set_index(HORSE_COLUMN)
@@ -9,7 +9,9 @@ jockey statistics.
 """
 import logging
 import pandas as pd
-from typing import Dict, List, Any, Set, Tuple
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+from bris_handicapper.analysis.horse_features import build_horse_features, by_horse
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +19,6 @@ logger = logging.getLogger(__name__)
 EARLY_RUN_STYLES = ['E', 'E/P']
 PRESSING_RUN_STYLES = ['P', 'S']
 TURF_SURFACE = 'T'
-WET_SURFACES = ['M', 'S']
-WET_TRACK_CONDITIONS = ['M', 'S', 'SY']
 PEDIGREE_IMPROVEMENT_THRESHOLD = 10
 TJ_COMBO_ROI_THRESHOLD = 2.0
 TJ_COMBO_MIN_STARTS = 10
@@ -43,11 +43,16 @@ def analyze_pace_scenario(contenders_df: pd.DataFrame) -> str:
         logger.info("Pace Scenario: Unclear (no dominant front-runners).")
         return 'Unclear'
 
-def get_situational_adjustments(contenders_df: pd.DataFrame, past_starts_df: pd.DataFrame, pace_scenario: str) -> Dict[str, Dict[Any, str]]:
+def get_situational_adjustments(contenders_df: pd.DataFrame, past_starts_df: pd.DataFrame, pace_scenario: str,
+                                features: Optional[pd.DataFrame] = None) -> Dict[str, Dict[Any, str]]:
     """
     Determines which horses should be upgraded or downgraded and why.
+    features is the race's horse feature table, built when not given.
     """
     adjustments = {'upgrade': {}, 'downgrade': {}}
+    if features is None:
+        features = build_horse_features(contenders_df, past_starts_df)
+    horse_features = by_horse(features)
     for _, horse in contenders_df.iterrows():
         prog_num = horse['program_number_if_available']
         run_style = horse['bris_run_style_designation']
@@ -58,19 +63,20 @@ def get_situational_adjustments(contenders_df: pd.DataFrame, past_starts_df: pd.
         elif pace_scenario == 'Pace Duel' and run_style in EARLY_RUN_STYLES:
             adjustments['downgrade'][prog_num] = "Disadvantaged by Pace Duel scenario"
 
-        horse_pps = past_starts_df[past_starts_df['program_number_if_available'] == prog_num]
-        if horse['surface'] == TURF_SURFACE and not (horse_pps['pp_surface'] == TURF_SURFACE).any():
-            if horse['bris_turf_pedigree_rating'] > horse.get('bris_dirt_pedigree_rating', 0) + PEDIGREE_IMPROVEMENT_THRESHOLD:
+        history = horse_features.loc[prog_num]
+        if horse['surface'] == TURF_SURFACE and not history['has_turf_start']:
+            if history['turf_pedigree_edge'] > PEDIGREE_IMPROVEMENT_THRESHOLD:
                 adjustments['upgrade'][prog_num] = f"Strong turf pedigree ({horse['bris_turf_pedigree_rating']}) for first turf start"
-        if horse['surface'] in WET_SURFACES and not (horse_pps['pp_track_condition'].isin(WET_TRACK_CONDITIONS)).any():
-            if horse['bris_mud_pedigree_rating'] > horse.get('bris_dirt_pedigree_rating', 0) + PEDIGREE_IMPROVEMENT_THRESHOLD:
+        if history['wet_today'] and not history['has_wet_start']:
+            if history['mud_pedigree_edge'] > PEDIGREE_IMPROVEMENT_THRESHOLD:
                 adjustments['upgrade'][prog_num] = f"Strong mud pedigree ({horse['bris_mud_pedigree_rating']}) for first wet track start"
 
-        if horse.get('tj_combo_roi_365d', 0) > TJ_COMBO_ROI_THRESHOLD and horse.get('tj_combo_starts_365d', 0) >= TJ_COMBO_MIN_STARTS:
-            adjustments['upgrade'][prog_num] = f"High ROI T/J Combo ({horse['tj_combo_roi_365d']})"
+        if history['tj_combo_roi_365d'] > TJ_COMBO_ROI_THRESHOLD and history['tj_combo_starts_365d'] >= TJ_COMBO_MIN_STARTS:
+            adjustments['upgrade'][prog_num] = f"High ROI T/J Combo ({history['tj_combo_roi_365d']})"
     return adjustments
 
-def adjust_groups_for_situation(initial_groups: Dict[str, List[Any]], contenders_df: pd.DataFrame, past_starts_df: pd.DataFrame) -> Tuple[Dict[str, List[Any]], Dict[str, Dict[Any, str]]]:
+def adjust_groups_for_situation(initial_groups: Dict[str, List[Any]], contenders_df: pd.DataFrame, past_starts_df: pd.DataFrame,
+                                features: Optional[pd.DataFrame] = None) -> Tuple[Dict[str, List[Any]], Dict[str, Dict[Any, str]]]:
     """
     Adjusts contender groups based on pace, pedigree, and form analysis.
     Returns both the adjusted groups and the adjustments made.
@@ -80,7 +86,7 @@ def adjust_groups_for_situation(initial_groups: Dict[str, List[Any]], contenders
 
     final_groups = {k: list(v) for k, v in initial_groups.items()}
     pace_scenario = analyze_pace_scenario(contenders_df)
-    adjustments = get_situational_adjustments(contenders_df, past_starts_df, pace_scenario)
+    adjustments = get_situational_adjustments(contenders_df, past_starts_df, pace_scenario, features)
 
     for prog_num, reason in adjustments['upgrade'].items():
         if prog_num in final_groups['Group 2']:
@@ -115,19 +121,21 @@ if __name__ == '__main__':
 
     mock_contenders_data = {
         'program_number_if_available': ['1', '2', '3', '4', '5'],
+        'post_position': [1, 2, 3, 4, 5],
         'race': [5, 5, 5, 5, 5],
         'bris_run_style_designation': ['E', 'P', 'S', 'E/P', 'P'],
         'surface': ['D', 'T', 'D', 'D', 'M'],
         'bris_dirt_pedigree_rating': [100, 80, 95, 90, 85],
         'bris_turf_pedigree_rating': [85, 105, 90, 88, 80],
         'bris_mud_pedigree_rating': [90, 85, 92, 91, 110],
-        'tj_combo_roi_365d': [1.5, 0.8, 2.5, -0.5, 1.2],
-        'tj_combo_starts_365d': [10, 12, 15, 20, 5]
+        't_j_combo_2_roi_365d': [1.5, 0.8, 2.5, -0.5, 1.2],
+        't_j_combo_starts_365d': [10, 12, 15, 20, 5]
     }
     mock_contenders_df = pd.DataFrame(mock_contenders_data)
 
     mock_pp_data = {
-        'program_number_if_available': ['1', '2', '3', '4', '5'],
+        'race': [5, 5, 5, 5, 5],
+        'post_position': [1, 2, 3, 4, 5],
         'pp_surface': ['D', 'D', 'D', 'D', 'D'],
         'pp_track_condition': ['FT', 'FT', 'FT', 'FT', 'FT']
     }
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Historical card archive for the BrisHandicapper project.
+
+Appends each processed card's current race info, past starts and workouts to
+Hive-partitioned Parquet datasets (ARCHIVE_DIR/<dataset>/race_date=YYYY-MM-DD/
+track=XXX/), and reads them back through pyarrow.dataset. Date and track
+filters prune whole partitions before any file is opened; surface and distance
+filters are pushed down to the Parquet scan, so row groups whose statistics
+cannot match are skipped.
+"""
+import csv
+import logging
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from config import settings
+from bris_handicapper.data_processing.bris_spec_new import BRISNET_DATE_FORMAT, DRF_ENCODING
+from bris_handicapper.data_processing.drf_source import DrfInput, as_drf_source, read_first_line
+from bris_handicapper.data_processing.projection import read_table, to_frame
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PARTITION_SCHEMA = pa.schema([("race_date", pa.date32()), ("track", pa.string())])
+
+# Archived datasets and the columns their surface/distance filters apply to.
+ARCHIVE_DATASETS: Dict[str, Dict[str, Optional[str]]] = {
+    "current_race_info": {"surface": "surface", "distance": "distance_in_yards"},
+    "past_starts": {"surface": "pp_surface", "distance": "pp_distance"},
+    "workouts": {"surface": None, "distance": "work_distance"},
+}
+
+def _partitioning() -> ds.Partitioning:
+    return ds.partitioning(ARCHIVE_PARTITION_SCHEMA, flavor="hive")
+
+def card_race_date(drf_path: DrfInput) -> date:
+    """Reads the race date (Field 2) from the first line of a DRF card."""
+    first_line = read_first_line(drf_path).decode(DRF_ENCODING)
+    first_row = next(csv.reader([first_line], skipinitialspace=True), None)
+    if not first_row or len(first_row) < 2:
+        raise ValueError(f"Cannot read the race date from {drf_path.name}: file is empty or malformed")
+    return datetime.strptime(first_row[1].strip(), BRISNET_DATE_FORMAT).date()
+
+def _with_partition_columns(table: pa.Table, race_date: date) -> pa.Table:
+    """Adds race_date and a trimmed track code; drops pandas metadata that would no longer match."""
+    table = table.replace_schema_metadata(None)
+    track = pc.utf8_trim_whitespace(table["track"].cast(pa.string()))
+    table = table.set_column(table.schema.get_field_index("track"), "track", track)
+    if "race_date" in table.column_names:
+        table = table.drop_columns(["race_date"])
+    return table.append_column("race_date", pa.array([race_date] * table.num_rows, type=pa.date32()))
+
+def archive_card(drf_path: DrfInput, outputs: Dict[str, Path], archive_dir: Path = settings.ARCHIVE_DIR) -> Dict[str, int]:
+    """
+    Writes a processed card into the archive datasets. Re-archiving a card
+    replaces its race_date/track partitions, so the operation is idempotent.
+    Returns the number of rows archived per dataset.
+    """
+    drf_path = as_drf_source(drf_path)
+    race_date = card_race_date(drf_path)
+    archived: Dict[str, int] = {}
+    for name in ARCHIVE_DATASETS:
+        source = outputs.get(name)
+        if source is None or not Path(source).exists():
+            logger.warning(f"No '{name}' output for card {drf_path.stem}; not archived.")
+            continue
+        table = _with_partition_columns(read_table(source), race_date)
+        ds.write_dataset(
+            table, archive_dir / name, format="parquet", partitioning=_partitioning(),
+            basename_template=f"{drf_path.stem}-{{i}}.parquet",
+            existing_data_behavior="delete_matching",
+        )
+        archived[name] = table.num_rows
+    logger.info(f"Archived card {drf_path.stem} ({race_date}) to {archive_dir}: {archived}")
+    return archived
+
+def archive_filter(
+    dataset_name: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    tracks: Optional[Iterable[str]] = None,
+    surfaces: Optional[Iterable[str]] = None,
+    min_distance: Optional[float] = None,
+    max_distance: Optional[float] = None,
+) -> Optional[ds.Expression]:
+    """Builds the dataset filter for an archive query (dates inclusive, distances in yards)."""
+    columns = ARCHIVE_DATASETS[dataset_name]
+    conditions: List[ds.Expression] = []
+    if start_date is not None:
+        conditions.append(ds.field("race_date") >= pa.scalar(start_date, pa.date32()))
+    if end_date is not None:
+        conditions.append(ds.field("race_date") <= pa.scalar(end_date, pa.date32()))
+    if tracks is not None:
+        conditions.append(ds.field("track").isin([t.strip() for t in tracks]))
+    if surfaces is not None:
+        if columns["surface"] is None:
+            raise ValueError(f"The '{dataset_name}' archive has no surface column to filter on.")
+        conditions.append(ds.field(columns["surface"]).isin(list(surfaces)))
+    if min_distance is not None:
+        conditions.append(ds.field(columns["distance"]) >= min_distance)
+    if max_distance is not None:
+        conditions.append(ds.field(columns["distance"]) <= max_distance)
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+def query_archive(
+    dataset_name: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    tracks: Optional[Iterable[str]] = None,
+    surfaces: Optional[Iterable[str]] = None,
+    min_distance: Optional[float] = None,
+    max_distance: Optional[float] = None,
+    columns: Optional[List[str]] = None,
+    archive_dir: Path = settings.ARCHIVE_DIR,
+) -> pd.DataFrame:
+    """
+    Loads the archived rows of one dataset matching the given filters.
+
+    Only files in matching race_date/track partitions are opened, and their
+    schemas are unified (e.g. int64 vs float64 for a column that had nulls on
+    some cards) before the filtered scan.
+    """
+    if dataset_name not in ARCHIVE_DATASETS:
+        raise ValueError(f"Unknown archive dataset '{dataset_name}'. Expected one of {list(ARCHIVE_DATASETS)}")
+    base_dir = archive_dir / dataset_name
+    if not base_dir.exists():
+        raise FileNotFoundError(f"No archive found at {base_dir}")
+    expression = archive_filter(dataset_name, start_date, end_date, tracks, surfaces, min_distance, max_distance)
+
+    dataset = ds.dataset(base_dir, format="parquet", partitioning=_partitioning())
+    fragments = list(dataset.get_fragments(filter=expression))
+    logger.info(f"Archive query on '{dataset_name}' touches {len(fragments)} of {len(dataset.files)} files.")
+    if not fragments:
+        return pd.DataFrame(columns=columns or dataset.schema.names)
+
+    schema = pa.unify_schemas([f.physical_schema for f in fragments], promote_options="permissive")
+    for field in ARCHIVE_PARTITION_SCHEMA:
+        if field.name not in schema.names:
+            schema = schema.append(field)
+    selected = ds.dataset([f.path for f in fragments], schema=schema, format="parquet",
+                          partitioning=_partitioning(), partition_base_dir=str(base_dir))
+    return to_frame(selected.to_table(columns=columns, filter=expression))
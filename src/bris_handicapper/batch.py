@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Batch ingest for the BrisHandicapper project.
+
+Processes every DRF card in the raw data directory (or a supplied list) in a
+process pool. Zip bundles contribute one card per DRF member, and gzipped
+cards are read in place. Each card is parsed and transformed into its own folder under
+settings.CARD_OUTPUT_DIR, and the per-card outputs are then merged into the
+standard processed files used by the handicapping step.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import settings
+from bris_handicapper.data_processing.compact import concat_frames
+from bris_handicapper.data_processing.drf_source import DrfInput, DrfSource, expand_drf_paths, find_drf_sources, unique_cards
+from bris_handicapper.data_processing.projection import read_columns, write_frame
+from bris_handicapper.manifest import IngestManifest, run_if_changed
+from bris_handicapper.pipeline import run_card_stages
+from bris_handicapper import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Per-card output files, named like their merged counterparts.
+MERGED_OUTPUTS: Dict[str, Path] = {
+    "current_race_info": settings.CURRENT_RACE_INFO_FILE,
+    "past_starts": settings.PAST_STARTS_LONG_FILE,
+    "workouts": settings.WORKOUTS_LONG_FILE,
+}
+
+def find_drf_files(raw_dir: Path = settings.RAW_DATA_DIR, pattern: str = settings.DRF_PATTERN) -> List[DrfSource]:
+    """Finds every DRF card in the raw data directory, including those in .zip/.gz bundles, sorted by name."""
+    if not raw_dir.exists():
+        raise FileNotFoundError(f"Raw data directory does not exist: {raw_dir}")
+    drf_files = find_drf_sources(raw_dir, pattern)
+    if not drf_files:
+        raise FileNotFoundError(f"No DRF files found matching pattern '{pattern}' in {raw_dir}")
+    logger.info(f"Found {len(drf_files)} DRF cards in {raw_dir}: {[p.name for p in drf_files]}")
+    return drf_files
+
+def card_output_paths(card_id: str, card_root: Path = settings.CARD_OUTPUT_DIR) -> Dict[str, Path]:
+    """Returns the per-card output paths for a card (the DRF file stem)."""
+    card_dir = card_root / card_id
+    paths = {"parsed": card_dir / settings.PARSED_RACE_DATA_FILE.name}
+    paths.update({key: card_dir / merged.name for key, merged in MERGED_OUTPUTS.items()})
+    return paths
+
+def process_card(drf_path: DrfSource, streaming: bool = settings.STREAMING_PARSE, force: bool = False,
+                 in_memory: bool = settings.IN_MEMORY_HANDOFF, archive: bool = settings.ARCHIVE_CARDS) -> Dict[str, Any]:
+    """
+    Runs the parse and transform stages for a single card.
+    Intended to be executed in a worker process; never raises. Stages that
+    ran are returned under "manifest", and their telemetry records under
+    "metrics", for the parent process to record.
+    """
+    card_id = drf_path.stem
+    outputs = card_output_paths(card_id)
+    result: Dict[str, Any] = {"card": card_id, "drf": str(drf_path), "status": "failed",
+                              "outputs": {}, "ran": [], "manifest": {}}
+    manifest = IngestManifest() if settings.USE_INGEST_MANIFEST else None
+    with telemetry.collecting() as metrics:
+        try:
+            with telemetry.measure("card", card=card_id):
+                stages = run_card_stages(drf_path, outputs, manifest, streaming=streaming, force=force,
+                                         in_memory=in_memory, archive=archive)
+            result["ran"] = stages["ran"]
+            result["outputs"] = {key: str(path) for key, path in stages["outputs"].items()}
+            result["status"] = "ok"
+        except Exception as e:
+            logger.error(f"Card {card_id} failed: {e}", exc_info=True)
+            result["error"] = str(e)
+    result["metrics"] = metrics.records
+    if manifest is not None:
+        result["manifest"] = {k: v for k, v in manifest.entries.items()
+                              if any(k.startswith(f"{stage}:") for stage in result["ran"])}
+    return result
+
+def _concat_card_files(card_files: Sequence[Path], output_path: Path) -> Path:
+    merged_df = concat_frames([read_columns(p) for p in card_files])
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    write_frame(merged_df, output_path)
+    telemetry.annotate(output_rows=len(merged_df), output_columns=len(merged_df.columns))
+    logger.info(f"Merged {len(card_files)} cards into {output_path} ({len(merged_df)} rows).")
+    return output_path
+
+def merge_card_outputs(results: Sequence[Dict[str, Any]], manifest: Optional[IngestManifest] = None,
+                       force: bool = False) -> Dict[str, Path]:
+    """Concatenates the per-card outputs into the standard processed files."""
+    merged: Dict[str, Path] = {}
+    for key, merged_path in MERGED_OUTPUTS.items():
+        card_files = [Path(r["outputs"][key]) for r in results if key in r.get("outputs", {})]
+        if not card_files:
+            logger.warning(f"No per-card '{key}' outputs to merge.")
+            continue
+        with telemetry.measure(f"merge_{key}"):
+            ran, saved = run_if_changed(manifest, f"merge_{key}", _concat_card_files, card_files, [merged_path],
+                                        force=force, card_files=card_files, output_path=merged_path)
+            if not ran:
+                telemetry.annotate(status="up_to_date")
+        if saved is not None:
+            merged[key] = saved
+    return merged
+
+def run_batch(
+    drf_files: Optional[Sequence[DrfInput]] = None,
+    max_workers: Optional[int] = settings.BATCH_MAX_WORKERS,
+    streaming: bool = settings.STREAMING_PARSE,
+    force: bool = False,
+    in_memory: bool = settings.IN_MEMORY_HANDOFF,
+    archive: bool = settings.ARCHIVE_CARDS,
+) -> List[Dict[str, Any]]:
+    """
+    Parses and transforms many cards in parallel, then merges the outputs.
+    Returns one result record per card, in input order.
+    """
+    drf_files = unique_cards(expand_drf_paths(drf_files)) if drf_files else find_drf_files()
+    workers = min(len(drf_files), max_workers or os.cpu_count() or 1)
+    logger.info(f"Batch ingest of {len(drf_files)} cards using {workers} worker process(es).")
+
+    if workers == 1:
+        results = [process_card(p, streaming, force, in_memory, archive) for p in drf_files]
+    else:
+        by_path: Dict[DrfSource, Dict[str, Any]] = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_card, p, streaming, force, in_memory, archive): p for p in drf_files}
+            for future in as_completed(futures):
+                by_path[futures[future]] = future.result()
+                logger.info(f"Card {futures[future].stem} finished: {by_path[futures[future]]['status']}")
+        results = [by_path[p] for p in drf_files]
+
+    collector = telemetry.active()
+    if collector is not None:
+        for r in results:
+            collector.extend(r.get("metrics", []))
+    failed = [r["card"] for r in results if r["status"] != "ok"]
+    if failed:
+        logger.error(f"{len(failed)} card(s) failed: {failed}")
+    manifest = IngestManifest() if settings.USE_INGEST_MANIFEST else None
+    if manifest is not None:
+        for r in results:
+            manifest.update(r.get("manifest", {}))
+    merge_card_outputs([r for r in results if r["status"] == "ok"], manifest, force)
+    if manifest is not None:
+        manifest.save()
+    return results
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Regression checks for the DRF parser that need a generated card.
+
+    mixed_batch_streaming  a card whose integer field only holds decimal
+                           values in its second half is streamed in
+                           small batches; every batch must get the same
+                           types so the whole card is written.
+
+Usage: python -m bris_handicapper.benchmarks.checks
+"""
+import logging
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bris_handicapper.benchmarks.synthetic_drf import generate_card, split_drf_line
+from bris_handicapper.data_processing.bris_spec_new import DRF_ENCODING, parse_and_write_streaming
+from bris_handicapper.data_processing.schema import CompiledSchema, load_compiled_schema
+
+logger = logging.getLogger(__name__)
+
+# Integer field (1-based, as in bris_dict.txt) given decimal values in the
+# second half of the card: 224, days since last race.
+MIXED_BATCH_FIELD = 224
+MIXED_BATCH_ROWS = 10
+
+def _write_mixed_card(path: Path) -> int:
+    """Writes a card with whole numbers in MIXED_BATCH_FIELD for its first half and decimals after; returns its line count."""
+    generate_card(path, tracks=2)
+    with open(path, encoding=DRF_ENCODING) as f:
+        rows = [split_drf_line(line) for line in f.read().splitlines()]
+    for i, row in enumerate(rows):
+        row[MIXED_BATCH_FIELD - 1] = "12" if i < len(rows) // 2 else "12.5"
+    with open(path, 'w', encoding=DRF_ENCODING, newline='\n') as f:
+        f.writelines(",".join(row) + "\n" for row in rows)
+    return len(rows)
+
+def check_mixed_batch_streaming(work_dir: Path, schema: CompiledSchema) -> List[str]:
+    """Problems found streaming a card whose batches hold different kinds of value in one column."""
+    card = work_dir / "MIX0101.DRF"
+    lines = _write_mixed_card(card)
+    if lines < 4 * MIXED_BATCH_ROWS:
+        return [f"generated card has only {lines} lines; it needs more than one batch"]
+    output = work_dir / "MIX0101.parquet"
+    written = parse_and_write_streaming(card, schema, output, chunk_rows=MIXED_BATCH_ROWS)
+    if written is None:
+        return ["nothing was written"]
+    problems = []
+    if written[0] != lines:
+        problems.append(f"wrote {written[0]} of {lines} rows")
+    label = schema.fields[MIXED_BATCH_FIELD - 1]["label"]
+    column = pq.read_table(output, columns=[label])[label]
+    if not pa.types.is_floating(column.type):
+        problems.append(f"'{label}' was written as {column.type}, expected float64")
+    elif column[-1].as_py() != 12.5:
+        problems.append(f"'{label}' lost its decimal values: last row is {column[-1].as_py()}")
+    return problems
+
+CHECKS: Dict[str, Callable[[Path, CompiledSchema], List[str]]] = {
+    "mixed_batch_streaming": check_mixed_batch_streaming,
+}
+
+def run(argv: Optional[Sequence[str]] = None) -> int:
+    """Runs every check; returns 1 if any found a problem, else 0."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        stream=sys.stdout)
+    schema = load_compiled_schema()
+    if schema is None:
+        logger.error("Cannot run the checks: failed to load the compiled schema.")
+        return 1
+    failed = False
+    for name, check in CHECKS.items():
+        with tempfile.TemporaryDirectory() as work_dir:
+            problems = check(Path(work_dir), schema)
+        for problem in problems:
+            logger.error(f"{name}: {problem}")
+        logger.info(f"{name}: {'FAILED' if problems else 'ok'}")
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(run())
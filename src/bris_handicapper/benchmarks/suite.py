@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for the BrisHandicapper processing steps.
+
+Generates synthetic cards (see synthetic_drf) at multiples of the template
+card's size, then runs each processing step on them under
+bris_handicapper.telemetry:
+
+    parse_csv            CSV reader over the DRF file, typed per the schema
+    type_conversion      schema decoding, race filtering and Arrow -> pandas
+    current_race_info    the current race info stage
+    melt_workouts        wide -> long reshape of the 12 workout blocks
+    melt_past_starts     wide -> long reshape of the 10 past performance blocks
+    past_start_features  cleaning and feature engineering on the past starts
+    handicap_loop        the per-race handicapping steps and reports
+
+Each scale runs in a fresh worker process, so its peak RSS is its own. With
+--repeat N every step keeps its fastest wall/CPU time. Results are written to
+BENCHMARK_DIR/results/ and compared with the saved baseline; the command
+exits with status 1 when a step has failed or regressed. A run with a
+failed step is never saved as the baseline.
+
+Usage: python -m bris_handicapper.benchmarks.suite [--scales 1 10 100] [--save-baseline]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import settings
+from config.data_mappings import COLUMN_CATALOG
+from bris_handicapper.benchmarks.synthetic_drf import generate_card
+from bris_handicapper.data_processing.bris_spec_new import (
+    decode_table, finalize_race_table, get_race_column_label, read_raw_drf_table,
+)
+from bris_handicapper.data_processing.current_race_info import main as create_current_info
+from bris_handicapper.data_processing.long_format_transformer import (
+    ID_VARIABLES, PAST_RACE_METRIC_DTYPES, PAST_RACE_METRIC_MAP, WORKOUT_METRIC_DTYPES, WORKOUT_METRIC_MAP,
+    add_past_start_features,
+)
+from bris_handicapper.data_processing.projection import read_columns, to_frame
+from bris_handicapper.data_processing.reshape import reshape_plan, wide_to_long
+from bris_handicapper.data_processing.schema import load_compiled_schema
+from bris_handicapper.handicap import handicap_card
+from bris_handicapper import telemetry
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_STEPS = [
+    "parse_csv", "type_conversion", "current_race_info", "melt_workouts",
+    "melt_past_starts", "past_start_features", "handicap_loop",
+]
+
+def card_path(scale: int, seed: int = settings.BENCHMARK_SEED) -> Path:
+    return settings.BENCHMARK_DIR / "cards" / f"SYNx{scale}_s{seed}.DRF"
+
+def ensure_card(scale: int, seed: int = settings.BENCHMARK_SEED, regenerate: bool = False) -> Path:
+    """The synthetic card for a scale (scale copies of the template card), generated if missing."""
+    path = card_path(scale, seed)
+    if regenerate or not path.exists():
+        generate_card(path, tracks=scale, seed=seed)
+    return path
+
+def _run_steps(card: Path, work_dir: Path, errors: Dict[str, str]) -> None:
+    """Runs every benchmark step once on a card; each step is one telemetry record."""
+    schema = load_compiled_schema()
+    if schema is None:
+        raise RuntimeError("Failed to load the compiled schema.")
+    spec_df = schema.spec_df
+
+    with telemetry.measure("parse_csv"):
+        raw = read_raw_drf_table(card, schema)
+        if raw is None:
+            raise RuntimeError(f"Failed to parse {card}")
+        table, lenient_cols = raw
+        telemetry.annotate(output_rows=table.num_rows, output_columns=table.num_columns)
+    with telemetry.measure("type_conversion"):
+        table = finalize_race_table(decode_table(table, schema, lenient_cols), get_race_column_label(spec_df))
+        wide_df = to_frame(table)
+        del table
+        telemetry.annotate(output_rows=len(wide_df), output_columns=len(wide_df.columns))
+    current_path = work_dir / settings.CURRENT_RACE_INFO_FILE.name
+    with telemetry.measure("current_race_info"):
+        if create_current_info(wide_df=wide_df, output_path=current_path) is None:
+            raise RuntimeError("The current race info stage saved nothing.")
+    with telemetry.measure("melt_workouts"):
+        workouts = wide_to_long(wide_df, reshape_plan(schema, WORKOUT_METRIC_MAP, "workout_num", 12, WORKOUT_METRIC_DTYPES), ID_VARIABLES)
+        telemetry.annotate(output_rows=len(workouts), output_columns=len(workouts.columns))
+        del workouts
+    with telemetry.measure("melt_past_starts"):
+        past_long = wide_to_long(wide_df, reshape_plan(schema, PAST_RACE_METRIC_MAP, "past_race_num", 10, PAST_RACE_METRIC_DTYPES), ID_VARIABLES)
+        past_long = past_long.sort_values(ID_VARIABLES + ["past_race_num"], kind="stable", ignore_index=True)
+        telemetry.annotate(output_rows=len(past_long), output_columns=len(past_long.columns))
+    with telemetry.measure("past_start_features"):
+        past_starts = add_past_start_features(past_long, wide_df)
+        telemetry.annotate(output_rows=len(past_starts), output_columns=len(past_starts.columns))
+    del past_long, wide_df
+
+    current_df = read_columns(current_path, COLUMN_CATALOG["handicap_current_race"])
+    past_starts = past_starts[[c for c in COLUMN_CATALOG["handicap_past_starts"] if c in past_starts.columns]]
+    try:
+        with telemetry.measure("handicap_loop"):
+            handicap_card(current_df, past_starts, reports_dir=work_dir / "reports")
+    except Exception as e:
+        # Reported as a failed step rather than losing the scale's other results.
+        errors["handicap_loop"] = f"{type(e).__name__}: {e}"
+
+def benchmark_card(card: Path, work_dir: Path, repeat: int = 1) -> Dict[str, Any]:
+    """
+    Runs the benchmark steps repeat times on one card and returns, per step,
+    the fastest wall and CPU time, the peak RSS and the output shape.
+    Intended to run in a fresh worker process.
+    """
+    # Keep the per-race INFO logs of the stages out of the benchmark output.
+    logging.getLogger().setLevel(logging.WARNING)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    errors: Dict[str, str] = {}
+    with telemetry.collecting() as metrics:
+        for _ in range(repeat):
+            _run_steps(card, work_dir, errors)
+    steps: Dict[str, Dict[str, Any]] = {}
+    for record in metrics.records:
+        if "parent" in record or record["stage"] not in BENCHMARK_STEPS:
+            continue
+        step = steps.setdefault(record["stage"], {"wall_s": record["wall_s"], "cpu_s": record["cpu_s"],
+                                                  "peak_rss_mb": record["peak_rss_mb"], "status": "ok"})
+        step["wall_s"] = min(step["wall_s"], record["wall_s"])
+        step["cpu_s"] = min(step["cpu_s"], record["cpu_s"])
+        if record["peak_rss_mb"] is not None:
+            step["peak_rss_mb"] = max(step["peak_rss_mb"] or 0, record["peak_rss_mb"])
+        for key in ("output_rows", "output_columns"):
+            if key in record:
+                step[key] = record[key]
+        if record["status"] == "failed":
+            step["status"] = "failed"
+    for name, error in errors.items():
+        steps[name]["error"] = error
+    return {"steps": {name: steps[name] for name in BENCHMARK_STEPS if name in steps}}
+
+def run_suite(scales: Sequence[int] = settings.BENCHMARK_SCALES, repeat: int = 1,
+              seed: int = settings.BENCHMARK_SEED, regenerate: bool = False) -> Dict[str, Any]:
+    """Benchmarks each scale in its own worker process and returns the combined results."""
+    results: Dict[str, Any] = {
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "seed": seed,
+        "repeat": repeat,
+        "scales": {},
+    }
+    context = multiprocessing.get_context("spawn")
+    for scale in scales:
+        card = ensure_card(scale, seed, regenerate)
+        with open(card, 'rb') as f:
+            horses = sum(1 for _ in f)
+        logger.info(f"Benchmarking scale {scale}x: {card.name} ({horses} horses, {card.stat().st_size / 1e6:.1f} MB)")
+        work_dir = settings.BENCHMARK_DIR / "work" / f"x{scale}"
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            scale_result = pool.submit(benchmark_card, card, work_dir, repeat).result()
+        scale_result.update({"card": card.name, "horses": horses, "card_mb": round(card.stat().st_size / 1e6, 2)})
+        results["scales"][str(scale)] = scale_result
+    return results
+
+def failed_steps(results: Dict[str, Any]) -> List[str]:
+    """Describes every step that failed, at any scale."""
+    return [f"{scale}x {name}: {step.get('error', 'see log')}"
+            for scale, scale_result in results["scales"].items()
+            for name, step in scale_result["steps"].items() if step["status"] == "failed"]
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Describes every step that is slower, uses more memory or fails where the baseline did not."""
+    regressions: List[str] = []
+    for scale, scale_result in results["scales"].items():
+        base_steps = baseline.get("scales", {}).get(scale, {}).get("steps", {})
+        for name, step in scale_result["steps"].items():
+            base = base_steps.get(name)
+            if base is None:
+                continue
+            where = f"{scale}x {name}"
+            if step["status"] == "failed" and base.get("status") != "failed":
+                regressions.append(f"{where}: failed ({step.get('error', 'see log')})")
+                continue
+            slower = step["wall_s"] - base["wall_s"]
+            if (slower > settings.BENCHMARK_MIN_TIME_DELTA_S
+                    and step["wall_s"] > base["wall_s"] * (1 + settings.BENCHMARK_TIME_TOLERANCE)):
+                regressions.append(f"{where}: wall {base['wall_s']:.3f}s -> {step['wall_s']:.3f}s")
+            if step.get("peak_rss_mb") is not None and base.get("peak_rss_mb") is not None:
+                grown = step["peak_rss_mb"] - base["peak_rss_mb"]
+                if (grown > settings.BENCHMARK_MIN_MEMORY_DELTA_MB
+                        and step["peak_rss_mb"] > base["peak_rss_mb"] * (1 + settings.BENCHMARK_MEMORY_TOLERANCE)):
+                    regressions.append(f"{where}: peak RSS {base['peak_rss_mb']:.0f} MB -> {step['peak_rss_mb']:.0f} MB")
+    return regressions
+
+def format_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> str:
+    """One row per scale and step, with the change in wall time against the baseline if given."""
+    header = f"{'scale':>6}  {'step':<22}{'wall s':>9}{'cpu s':>9}{'peak MB':>9}{'rows out':>11}{'vs base':>9}  status"
+    lines = [header, "-" * len(header)]
+    for scale, scale_result in results["scales"].items():
+        base_steps = (baseline or {}).get("scales", {}).get(scale, {}).get("steps", {})
+        for name, step in scale_result["steps"].items():
+            base = base_steps.get(name)
+            change = f"{(step['wall_s'] / base['wall_s'] - 1) * 100:+.0f}%" if base and base["wall_s"] else "-"
+            rows, peak = step.get("output_rows"), step.get("peak_rss_mb")
+            lines.append(
+                f"{scale + 'x':>6}  {name:<22}{step['wall_s']:>9.3f}{step['cpu_s']:>9.3f}"
+                f"{('-' if peak is None else f'{peak:.0f}'):>9}"
+                f"{('-' if rows is None else f'{rows:,}'):>11}{change:>9}  {step['status']}"
+            )
+    return "\n".join(lines)
+
+def load_baseline(path: Path = settings.BENCHMARK_BASELINE) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_results(results: Dict[str, Any], path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the processing steps on synthetic cards.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(settings.BENCHMARK_SCALES),
+                        help="Card sizes as multiples of the template card (default: %(default)s).")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scale; the fastest is kept (default 1).")
+    parser.add_argument("--seed", type=int, default=settings.BENCHMARK_SEED, help="Seed for the synthetic cards.")
+    parser.add_argument("--regenerate", action="store_true", help="Regenerate the synthetic cards even if they exist.")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"Store these results as the baseline ({settings.BENCHMARK_BASELINE}).")
+    return parser.parse_args(argv)
+
+def run(argv: Optional[Sequence[str]] = None) -> int:
+    """Runs the suite; returns 1 if any step failed or regressed against the baseline, else 0."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        stream=sys.stdout)
+    args = parse_args(argv)
+    results = run_suite(args.scales, args.repeat, args.seed, args.regenerate)
+    saved = save_results(results, settings.BENCHMARK_DIR / "results" / f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    baseline = load_baseline()
+    logger.info(f"Benchmark results ({saved}):\n{format_results(results, baseline)}")
+
+    failures = failed_steps(results)
+    for failure in failures:
+        logger.error(f"Failed step: {failure}")
+    if args.save_baseline:
+        if failures:
+            logger.error("Not saving these results as the baseline: some steps failed.")
+            return 1
+        save_results(results, settings.BENCHMARK_BASELINE)
+        logger.info(f"Saved baseline to {settings.BENCHMARK_BASELINE}")
+        return 0
+    if baseline is None:
+        logger.info("No baseline to compare with; run with --save-baseline to record one.")
+        return 1 if failures else 0
+    regressions = compare_to_baseline(results, baseline)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    if not regressions:
+        logger.info("No regressions against the baseline.")
+    return 1 if regressions or failures else 0
+
+if __name__ == "__main__":
+    sys.exit(run())
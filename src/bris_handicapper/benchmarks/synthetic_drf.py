@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic Brisnet DRF cards of any size, for benchmarks and load tests.
+
+A card is laid out by the compiled schema (bris_spec.pkl + bris_dict.txt):
+one line per horse with every numbered field in place. Values come from a
+template card (by default the first card in the raw data directory) so their
+distributions match real data:
+
+- each generated race takes its race-level fields (distance, surface, class,
+  purse, conditions, pars, wagers, ...) and its field size from one template
+  race;
+- each horse is a template horse line, so its record, past performances and
+  workouts stay internally consistent (fractions match distances, call
+  positions match margins, and so on);
+- track, race number, post position and program number are renumbered, and
+  horse names are kept unique within a race.
+
+Without a template, values are drawn from each field's declared kind and
+format, with a random number of past performances (0-10) and workouts (0-12)
+per horse. Such cards parse and transform like real ones but are not
+realistic enough for the handicapping figures to mean anything.
+
+Usage: python -m bris_handicapper.benchmarks.synthetic_drf --tracks 10 -o SYN0628.DRF
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import re
+import string
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from config.settings import RAW_DATA_DIR
+from bris_handicapper.data_processing.bris_spec_new import BRISNET_DATE_FORMAT, DRF_ENCODING
+from bris_handicapper.data_processing.drf_source import DrfInput, find_drf_sources, open_drf
+from bris_handicapper.data_processing.long_format_transformer import PAST_RACE_METRIC_MAP, WORKOUT_METRIC_MAP
+from bris_handicapper.data_processing.schema import CompiledSchema, load_compiled_schema
+
+logger = logging.getLogger(__name__)
+
+# One DRF field: a double-quoted string (commas allowed inside) or bare text.
+_DRF_TOKEN = re.compile(r'("[^"]*"|[^,]*)(?:,|$)')
+
+# Field numbers (1-based, as in bris_dict.txt) of the identifying fields.
+TRACK_FIELD, DATE_FIELD, RACE_FIELD, POST_FIELD = 1, 2, 3, 4
+DISTANCE_FIELD, SURFACE_FIELD = 6, 7
+PROGRAM_NUMBER_FIELD, HORSE_NAME_FIELD = 43, 45
+
+# Fields that describe the race rather than the horse; every horse in a race
+# carries the same values.
+RACE_LEVEL_FIELDS: Set[int] = (
+    set(range(1, 28)) - {POST_FIELD, 5, 14, 24}
+    | set(range(214, 219)) | set(range(225, 231)) | set(range(240, 249))
+    | {1374, 1418, 1429}
+)
+
+MAX_PAST_STARTS = 10
+MAX_WORKOUTS = 12
+SYNTHETIC_DISTANCES = (1100, 1210, 1320, 1430, 1540, 1650, 1760, 1830, 1870, 1980)
+SYNTHETIC_RACES_PER_TRACK = 10
+SYNTHETIC_FIELD_SIZES = (5, 12)
+
+def split_drf_line(line: str) -> List[str]:
+    """Splits a DRF line into its raw field texts, keeping quotes and padding as written."""
+    return [m.group(1) for m in _DRF_TOKEN.finditer(line)]
+
+def _unquote(token: str) -> str:
+    return token[1:-1] if len(token) >= 2 and token[0] == token[-1] == '"' else token
+
+def _quote(text: str) -> str:
+    return f'"{text}"'
+
+def synthetic_track_code(index: int, first: str = "SYN") -> str:
+    """Track code of the index-th track on a card: the template's own for 0, then S01, S02, ... SZZ."""
+    if index == 0:
+        return first
+    digits = string.digits + string.ascii_uppercase
+    return "S" + digits[(index // 36) % 36] + digits[index % 36]
+
+class TemplateCard:
+    """The raw field texts of a real card, grouped into its races."""
+
+    def __init__(self, rows: List[List[str]]):
+        self.rows = rows
+        self.races: List[List[int]] = []
+        by_race: Dict[Tuple[str, str], List[int]] = {}
+        for i, row in enumerate(rows):
+            key = (row[TRACK_FIELD - 1], row[RACE_FIELD - 1].strip())
+            if key not in by_race:
+                by_race[key] = []
+                self.races.append(by_race[key])
+            by_race[key].append(i)
+
+    @property
+    def track(self) -> str:
+        return _unquote(self.rows[0][TRACK_FIELD - 1]).strip()
+
+    @classmethod
+    def read(cls, drf: DrfInput, field_count: int) -> "TemplateCard":
+        """Reads a card, keeping the lines that have exactly field_count fields."""
+        with open_drf(drf) as stream:
+            text = stream.read().decode(DRF_ENCODING)
+        rows = []
+        for line in text.splitlines():
+            tokens = split_drf_line(line)
+            if len(tokens) == field_count:
+                rows.append(tokens)
+        if not rows:
+            raise ValueError(f"No {field_count}-field lines in template card {drf}")
+        logger.info(f"Template card {drf}: {len(rows)} horses in {len(set(r[RACE_FIELD - 1] for r in rows))} races")
+        return cls(rows)
+
+def default_template() -> Optional[DrfInput]:
+    """The first card in the raw data directory, if there is one."""
+    sources = find_drf_sources(RAW_DATA_DIR) if RAW_DATA_DIR.exists() else []
+    return sources[0] if sources else None
+
+def _block_fields(metric_map: Dict[str, int], count: int) -> List[List[int]]:
+    """Field numbers of each numbered block (past start k, workout k), k = 1..count."""
+    return [[base + k for base in metric_map.values()] for k in range(count)]
+
+def _unique_names(rows: List[List[str]]) -> None:
+    """Appends a counter to repeated horse names so (race, name) stays unique."""
+    seen: Dict[str, int] = {}
+    for row in rows:
+        name = _unquote(row[HORSE_NAME_FIELD - 1])
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            row[HORSE_NAME_FIELD - 1] = _quote(f"{name} {seen[name]}")
+
+def _renumber(row: List[str], track: str, race: int, post: int) -> None:
+    row[TRACK_FIELD - 1] = _quote(f"{track:<3}")
+    row[RACE_FIELD - 1] = f"{race:2d}"
+    row[POST_FIELD - 1] = f"{post:2d}"
+    row[PROGRAM_NUMBER_FIELD - 1] = _quote(str(post))
+
+def _template_rows(template: TemplateCard, tracks: int, races: Optional[int], horses: Optional[int],
+                   rng: random.Random) -> Iterator[List[str]]:
+    race_fields = [n - 1 for n in sorted(RACE_LEVEL_FIELDS)]
+    races_per_track = races or len(template.races)
+    for t in range(tracks):
+        track = synthetic_track_code(t, template.track)
+        for race in range(1, races_per_track + 1):
+            source_race = template.races[(race - 1) % len(template.races)] if races is None else rng.choice(template.races)
+            size = horses or len(source_race)
+            if size <= len(template.rows):
+                picks = rng.sample(range(len(template.rows)), size)
+            else:
+                picks = rng.choices(range(len(template.rows)), k=size)
+            race_row = template.rows[source_race[0]]
+            rows = []
+            for post, pick in enumerate(picks, start=1):
+                row = list(template.rows[pick])
+                for i in race_fields:
+                    row[i] = race_row[i]
+                _renumber(row, track, race, post)
+                rows.append(row)
+            _unique_names(rows)
+            yield from rows
+
+class _FieldSampler:
+    """Draws a field value from its kind and format in the compiled schema."""
+
+    def __init__(self, schema: CompiledSchema, race_date: date, rng: random.Random):
+        self.fields = {f["field_number"]: f for f in schema.fields}
+        self.race_date = race_date
+        self.rng = rng
+
+    def value(self, field_number: int) -> str:
+        field = self.fields[field_number]
+        kind, rng = field["kind"], self.rng
+        if kind == "reserved":
+            return ""
+        if kind == "numeric":
+            fmt = field.get("format") or "99"
+            whole, _, decimals = fmt.partition(".")
+            high = min(10 ** len(whole) - 1, 999)
+            if decimals:
+                return f"{rng.uniform(0, high):.{len(decimals)}f}"
+            return str(rng.randint(0, high))
+        if kind == "date":
+            return _quote((self.race_date - timedelta(days=rng.randint(7, 720))).strftime(BRISNET_DATE_FORMAT))
+        length = field.get("max_length") or rng.randint(4, 12)
+        return _quote("".join(rng.choice(string.ascii_uppercase) for _ in range(min(length, 12))))
+
+def _sampled_rows(schema: CompiledSchema, tracks: int, races: Optional[int], horses: Optional[int],
+                  race_date: date, rng: random.Random) -> Iterator[List[str]]:
+    sampler = _FieldSampler(schema, race_date, rng)
+    field_numbers = [f["field_number"] for f in schema.fields]
+    past_blocks = _block_fields(PAST_RACE_METRIC_MAP, MAX_PAST_STARTS)
+    work_blocks = _block_fields(WORKOUT_METRIC_MAP, MAX_WORKOUTS)
+    block_fields = {n for block in past_blocks + work_blocks for n in block}
+    for t in range(tracks):
+        track = synthetic_track_code(t)
+        for race in range(1, (races or SYNTHETIC_RACES_PER_TRACK) + 1):
+            race_values = {n: sampler.value(n) for n in RACE_LEVEL_FIELDS if n in sampler.fields}
+            race_values[DATE_FIELD] = _quote(race_date.strftime(BRISNET_DATE_FORMAT))
+            race_values[DISTANCE_FIELD] = str(rng.choice(SYNTHETIC_DISTANCES))
+            race_values[SURFACE_FIELD] = _quote(rng.choice("DDDT"))
+            rows = []
+            for post in range(1, (horses or rng.randint(*SYNTHETIC_FIELD_SIZES)) + 1):
+                values = {n: "" if n in block_fields else race_values.get(n) or sampler.value(n) for n in field_numbers}
+                for blocks, used in ((past_blocks, rng.randint(0, MAX_PAST_STARTS)), (work_blocks, rng.randint(0, MAX_WORKOUTS))):
+                    for block in blocks[:used]:
+                        values.update({n: sampler.value(n) for n in block if n in sampler.fields})
+                values[HORSE_NAME_FIELD] = _quote(f"SYNTHETIC {t:02d}{race:02d}{post:02d}")
+                row = [values[n] for n in field_numbers]
+                _renumber(row, track, race, post)
+                rows.append(row)
+            yield from rows
+
+def generate_card(
+    output_path: Path,
+    tracks: int = 1,
+    races: Optional[int] = None,
+    horses: Optional[int] = None,
+    template: Optional[DrfInput] = None,
+    use_template: bool = True,
+    seed: int = 0,
+    race_date: Optional[date] = None,
+) -> Path:
+    """
+    Writes a synthetic card of tracks x races x horses lines to output_path.
+    races and horses default to the template's races and field sizes (or
+    SYNTHETIC_RACES_PER_TRACK and a random field size without a template).
+    The same arguments and seed always produce the same file.
+    """
+    schema = load_compiled_schema()
+    if schema is None:
+        raise RuntimeError("Cannot generate a DRF card: failed to load the compiled schema.")
+    rng = random.Random(seed)
+    template = (template or default_template()) if use_template else None
+    if template is not None:
+        rows = _template_rows(TemplateCard.read(template, len(schema.fields)), tracks, races, horses, rng)
+    else:
+        rows = _sampled_rows(schema, tracks, races, horses, race_date or date.today(), rng)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with open(output_path, 'w', encoding=DRF_ENCODING, newline='\n') as f:
+        for row in rows:
+            f.write(",".join(row) + "\n")
+            written += 1
+    logger.info(f"Wrote synthetic card {output_path} ({written} horses, {tracks} track(s)).")
+    return output_path
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate a synthetic Brisnet DRF card.")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="DRF file to write.")
+    parser.add_argument("--tracks", type=int, default=1, help="Tracks on the card (default 1).")
+    parser.add_argument("--races", type=int, help="Races per track (default: as in the template).")
+    parser.add_argument("--horses", type=int, help="Horses per race (default: the template's field sizes).")
+    parser.add_argument("--template", type=Path, help="Card to draw values from (default: first card in data/raw).")
+    parser.add_argument("--no-template", action="store_true", help="Draw values from the field formats only.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default 0).")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[Sequence[str]] = None) -> Optional[Path]:
+    args = parse_args(argv)
+    return generate_card(args.output, args.tracks, args.races, args.horses, args.template,
+                         use_template=not args.no_template, seed=args.seed)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
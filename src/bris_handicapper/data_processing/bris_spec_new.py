@@ -2,8 +2,8 @@
 """
 Parses a Brisnet comma-delimited race data file (e.g., CDX0502.DRF)
 using column names derived from the Brisnet specification dictionary,
-attempts type conversions based on bris_dict.txt, keeps all parsed
-columns (except 'reserved'), and saves the final DataFrame to an
+decodes each field at read time to the type declared in bris_dict.txt,
+keeps all parsed columns (except 'reserved'), and saves the result to an
 Apache Parquet file.
 """
 from __future__ import annotations
@@ -11,18 +11,27 @@ from __future__ import annotations
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Tuple, Any, Final, Optional, Set
+from typing import AbstractSet, List, Dict, Tuple, Any, Final, Optional, Set, Iterator
 import re  # For parsing bris_dict.txt
 import logging  # Import logging
 import sys
 
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
 from config.settings import (
     BRIS_SPEC_CACHE,
     BRIS_DICT,
     PARSED_RACE_DATA,
     PROCESSED_DATA_DIR,
     CACHE_DIR,
+    STREAMING_PARSE,
+    DRF_STREAM_CHUNK_ROWS,
 )
+from .drf_source import DrfInput, open_drf
+from .projection import open_table_writer, write_table
+from .schema import CompiledSchema, load_compiled_schema
 
 # Default DRF if run directly and no argument is passed, can be overridden by main's argument
 # RACE_DATA_FILENAME_DEFAULT: Final[str] = "PIM0509.DRF"
@@ -31,6 +40,14 @@ SPEC_CACHE_FILE_PATH_BRIS: Final[Path] = BRIS_SPEC_CACHE
 BRIS_DICT_FILE_PATH_BRIS: Final[Path] = BRIS_DICT
 OUTPUT_PARQUET_FILE_PATH_BRIS: Final[Path] = PARSED_RACE_DATA
 
+DRF_ENCODING: Final[str] = 'iso-8859-1'
+BRISNET_DATE_FORMAT: Final[str] = '%Y%m%d'
+SPRINT_MAX_YARDS: Final[int] = 1540  # 7 furlongs
+NUMERIC_TEXT_PATTERN: Final[str] = r"^[+-]?(\d+\.?\d*|\.\d+)$"
+# Numbers (or nothing) after leading blanks: the padding skipinitialspace used
+# to drop from unquoted fields, which the Arrow reader keeps.
+PADDED_NUMBER_PATTERN: Final[str] = r"^\s+([+-]?(\d+\.?\d*|\.\d+))?\s*$"
+
 # --- Helper Functions (load_specification_cache, parse_bris_dict_types, etc. remain the same) ---
 def load_specification_cache(spec_cache_path: Path) -> Optional[pd.DataFrame]:
     """Loads the column label specification DataFrame from the cache file."""
@@ -95,9 +112,7 @@ def identify_column_types_from_spec(spec_df: pd.DataFrame, field_type_map: Dict[
     if not field_type_map:
         logger.warning("Warning: Field type map is empty. Cannot reliably identify types.")
         return numeric_cols, date_cols
-    for _, row in spec_df.iterrows():
-        field_num = row.get('field_number')
-        label = row.get('label')
+    for field_num, label in zip(spec_df['field_number'].tolist(), spec_df['label'].tolist()):
         if label is None or field_num is None or label.startswith("reserved"): continue
         field_type = field_type_map.get(field_num)
         if field_type == 'NUMERIC': numeric_cols.add(label)
@@ -106,69 +121,344 @@ def identify_column_types_from_spec(spec_df: pd.DataFrame, field_type_map: Dict[
     logger.info(f"Identified {len(date_cols)} date columns using spec.")
     return numeric_cols, date_cols
 
-def parse_brisnet_csv_data(data_file_to_parse: Path, column_names_all: List[str]) -> Optional[pd.DataFrame]:
-    """Parses a comma-delimited Brisnet data file."""
+def label_dist(d):
+    """Labels a distance in yards as 'Sprint' (<= 7f) or 'Route'."""
+    try: val = float(d)
+    except Exception: return np.nan
+    return "Sprint" if val <= SPRINT_MAX_YARDS else "Route"
+
+def decode_column_types(schema: CompiledSchema, lenient_cols: AbstractSet[str] = frozenset()) -> Dict[str, pa.DataType]:
+    """
+    Maps each non-reserved column to the type the CSV reader decodes it as.
+    Dates are read as timestamps (the only type the reader parses with a
+    strptime format) and narrowed to date32 afterwards; lenient columns are
+    read as strings and coerced by coerce_lenient_column.
+    """
+    column_types: Dict[str, pa.DataType] = {}
+    for field in schema.arrow_schema:
+        if field.name in lenient_cols:
+            column_types[field.name] = pa.string()
+        elif pa.types.is_date(field.type):
+            column_types[field.name] = pa.timestamp('s')
+        else:
+            column_types[field.name] = field.type
+    return column_types
+
+def _skip_bad_line(row: Any) -> str:
+    # row.number is only known to the serial (streaming) reader.
+    where = f"line {row.number}" if row.number is not None else f"line starting {row.text[:40]!r}"
+    logging.getLogger(__name__).warning(
+        f"Skipping malformed {where}: expected {row.expected_columns} fields, got {row.actual_columns}.")
+    return 'skip'
+
+def drf_csv_options(schema: CompiledSchema, lenient_cols: AbstractSet[str] = frozenset(),
+                    block_size: Optional[int] = None) -> Tuple[pa_csv.ReadOptions, pa_csv.ParseOptions, pa_csv.ConvertOptions]:
+    """Builds the pyarrow CSV reader options for a DRF file typed by the compiled schema."""
+    read_kwargs: Dict[str, Any] = {"column_names": schema.labels, "encoding": DRF_ENCODING}
+    if block_size:
+        read_kwargs["block_size"] = block_size
+    read_options = pa_csv.ReadOptions(**read_kwargs)
+    parse_options = pa_csv.ParseOptions(quote_char='"', invalid_row_handler=_skip_bad_line)
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=schema.arrow_schema.names,
+        column_types=decode_column_types(schema, lenient_cols),
+        timestamp_parsers=[BRISNET_DATE_FORMAT],
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=True,
+    )
+    return read_options, parse_options, convert_options
+
+def lenient_columns(schema: CompiledSchema) -> Set[str]:
+    """The typed (numeric and date) columns, read as text by a lenient re-read."""
+    return set(schema.numeric_cols | schema.date_cols) & set(schema.arrow_schema.names)
+
+def lenient_type(target: pa.DataType) -> pa.DataType:
+    """
+    The type a column takes in a lenient re-read. Integer columns are widened
+    to float64 so values with a fraction are kept; this depends only on the
+    schema, so every batch of a streamed file gets the same types.
+    """
+    return pa.float64() if pa.types.is_integer(target) else target
+
+def coerce_lenient_column(values: pa.ChunkedArray, target: pa.DataType) -> pa.ChunkedArray:
+    """
+    Decodes a column the reader could not type directly. Values that do not
+    parse become null, as with errors='coerce'. Numbers are returned as
+    float64.
+    """
+    values = pc.utf8_trim_whitespace(values)
+    if pa.types.is_date(target):
+        return pc.strptime(values, format=BRISNET_DATE_FORMAT, unit='s', error_is_null=True).cast(target)
+    if pa.types.is_integer(target) or pa.types.is_floating(target):
+        valid = pc.match_substring_regex(values, NUMERIC_TEXT_PATTERN)
+        return pc.if_else(valid, values, pa.scalar(None, pa.string())).cast(pa.float64())
+    return values
+
+def _cast_clean_column(values: pa.ChunkedArray, target: pa.DataType) -> Optional[pa.ChunkedArray]:
+    """
+    Casts a numeric column of a lenient re-read straight to its type, or
+    returns None if any value does not parse. Most columns of a re-read are
+    clean and take this path.
+    """
+    if not (pa.types.is_integer(target) or pa.types.is_floating(target)):
+        return None
+    values = pc.utf8_trim_whitespace(values)
+    try:
+        return pc.if_else(pc.equal(values, ""), pa.scalar(None, pa.string()), values).cast(target)
+    except pa.ArrowInvalid:
+        return None
+
+def _invalid_count(raw: pa.ChunkedArray, decoded: pa.ChunkedArray) -> int:
+    """Values present in the text of a column that did not decode."""
+    present = pc.not_equal(pc.utf8_trim_whitespace(raw), "")
+    return pc.sum(pc.and_(pc.fill_null(present, False), pc.is_null(decoded))).as_py() or 0
+
+def strip_number_padding(values: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Trims padding from space-padded numbers in untyped columns; all-blank values become null."""
+    padded = pc.match_substring_regex(values, PADDED_NUMBER_PATTERN)
+    if not pc.any(padded).as_py():
+        return values
+    trimmed = pc.utf8_trim_whitespace(values)
+    trimmed = pc.if_else(pc.equal(trimmed, ""), pa.scalar(None, pa.string()), trimmed)
+    return pc.if_else(padded, trimmed, values)
+
+def decode_table(table: pa.Table, schema: CompiledSchema, lenient_cols: AbstractSet[str] = frozenset()) -> pa.Table:
+    """Narrows the reader's output to the compiled schema types."""
+    logger = logging.getLogger(__name__)
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        target = schema.arrow_schema.field(name).type
+        if name in lenient_cols:
+            target = lenient_type(target)
+            decoded = _cast_clean_column(column, target)
+            if decoded is None:
+                decoded = coerce_lenient_column(column, target)
+                invalid = _invalid_count(column, decoded)
+                if invalid:
+                    logger.warning(f"Column '{name}': {invalid} value(s) do not match its declared type and became null.")
+            column = decoded
+        elif pa.types.is_date(target):
+            column = column.cast(target)
+        elif pa.types.is_string(target):
+            column = strip_number_padding(column)
+        columns.append(column)
+    return pa.Table.from_arrays(columns, names=table.column_names)
+
+def _lenient_retry(error: Exception, schema: CompiledSchema, lenient_cols: AbstractSet[str],
+                   file_name: str) -> Optional[Set[str]]:
+    """
+    The columns to read as text on the next attempt after a conversion error:
+    every typed column, once. None when the error is not a conversion error or
+    the read was already lenient.
+    """
+    if not isinstance(error, pa.ArrowInvalid) or lenient_cols:
+        return None
+    logging.getLogger(__name__).warning(
+        f"{file_name} holds values that do not match their declared types ({error}); "
+        f"re-reading its numeric and date fields leniently (invalid values become null).")
+    return lenient_columns(schema)
+
+def read_raw_drf_table(data_file_to_parse: DrfInput, schema: CompiledSchema) -> Optional[Tuple[pa.Table, Set[str]]]:
+    """
+    Runs the CSV reader over a DRF file with the schema's column types.
+    Returns the reader's table and the columns that had to be read leniently
+    (as text), which decode_table still has to convert.
+    """
     logger = logging.getLogger(__name__)
     if not data_file_to_parse.exists():
         logger.error(f"Error: Race data file not found at {data_file_to_parse}")
         return None
-    column_names_filtered = [name for name in column_names_all if not name.startswith("reserved")]
-    cols_to_use_indices = [i for i, name in enumerate(column_names_all) if not name.startswith("reserved")]
-    if not column_names_filtered:
-        logger.error("Error: No non-reserved columns found in the specification.")
-        return None
     logger.info(f"\nAttempting to parse {data_file_to_parse.name} as comma-delimited...")
-    logger.info(f"Excluding columns starting with 'reserved'. Using {len(column_names_filtered)} out of {len(column_names_all)} columns.")
-    try:
-        df = pd.read_csv(
-            data_file_to_parse, sep=',', header=None, names=column_names_filtered,
-            usecols=cols_to_use_indices, dtype=str, quotechar='"',
-            on_bad_lines='warn', low_memory=False, encoding='iso-8859-1',
-            skipinitialspace=True
-        )
-        logger.info(f"Parsing successful. Read {len(df)} lines from {data_file_to_parse.name}.")
-        return df
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during parsing of {data_file_to_parse.name}: {e}", exc_info=True)
+    logger.info(f"Excluding columns starting with 'reserved'. Using {len(schema.arrow_schema)} out of {len(schema.labels)} columns.")
+    # Strict typed read first; one lenient re-read if a field does not decode.
+    lenient_cols: Set[str] = set()
+    while True:
+        try:
+            with open_drf(data_file_to_parse) as stream:
+                table = pa_csv.read_csv(stream, *drf_csv_options(schema, lenient_cols))
+            break
+        except pa.ArrowInvalid as e:
+            retry = _lenient_retry(e, schema, lenient_cols, data_file_to_parse.name)
+            if retry is None:
+                logger.error(f"An unexpected error occurred during parsing of {data_file_to_parse.name}: {e}", exc_info=True)
+                return None
+            lenient_cols = retry
+    logger.info(f"Parsing successful. Read {table.num_rows} lines from {data_file_to_parse.name}.")
+    return table, lenient_cols
+
+def read_drf_table(data_file_to_parse: DrfInput, schema: CompiledSchema) -> Optional[pa.Table]:
+    """
+    Parses a comma-delimited Brisnet data file straight into typed Arrow
+    columns: numerics as nullable int64/float64, dates as date32 and short
+    code fields as dictionary-encoded strings.
+    """
+    raw = read_raw_drf_table(data_file_to_parse, schema)
+    if raw is None:
         return None
+    table, lenient_cols = raw
+    return decode_table(table, schema, lenient_cols)
 
-def convert_data_types(df: pd.DataFrame, numeric_cols_labels: Set[str], date_cols_labels: Set[str]) -> pd.DataFrame:
-    """Attempts to convert columns to appropriate numeric and date types."""
+def get_race_column_label(spec_df: pd.DataFrame) -> str:
+    """Returns the label for Field 3 (Race #), falling back to 'race'."""
     logger = logging.getLogger(__name__)
-    logger.info("\nAttempting data type conversions...")
-    df_copy = df.copy()
-    numeric_cols_present = [col for col in numeric_cols_labels if col in df_copy.columns]
-    logger.info(f"Converting {len(numeric_cols_present)} columns to numeric...")
-    converted_numeric_count = 0
-    for col in numeric_cols_present:
-        try:
-            df_copy[col] = pd.to_numeric(df_copy[col], errors='coerce')
-            converted_numeric_count += 1
-        except Exception as e:
-            logger.warning(f"  - Warning: Failed to convert column '{col}' to numeric: {e}")
-    logger.info(f"Successfully converted {converted_numeric_count} numeric columns.")
-    date_cols_present = [col for col in date_cols_labels if col in df_copy.columns]
-    logger.info(f"Converting {len(date_cols_present)} columns to datetime...")
-    converted_date_count = 0
-    brisnet_date_format = '%Y%m%d'
-    for col in date_cols_present:
+    try:
+        return spec_df[spec_df['field_number'] == 3]['label'].iloc[0]
+    except (KeyError, IndexError):
+        logger.warning("Warning: Could not find label for Field 3 (Race #) in spec cache. Using default 'race'.")
+        return 'race'
+
+def distance_type_labels(yards: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Vectorised label_dist: 'Sprint' for <= 7f, otherwise 'Route'."""
+    if not (pa.types.is_integer(yards.type) or pa.types.is_floating(yards.type)):
+        yards = coerce_lenient_column(yards, pa.float64())
+    # Missing distances compare False and fall through to 'Route', as in label_dist.
+    is_sprint = pc.fill_null(pc.less_equal(yards, SPRINT_MAX_YARDS), False)
+    return pc.if_else(is_sprint, "Sprint", "Route")
+
+def finalize_race_table(table: pa.Table, race_col_label: str) -> pa.Table:
+    """
+    Drops rows without a valid race number and adds the Sprint/Route
+    'distance_type' labels for today's race and past races 1-10.
+    """
+    logger = logging.getLogger(__name__)
+    # 7. Basic Integrity Check
+    if race_col_label not in table.column_names:
+        logger.warning(f"\nWarning: Race column ('{race_col_label}') not found. Output may lack structure.")
+    elif pa.types.is_integer(table.schema.field(race_col_label).type) or pa.types.is_floating(table.schema.field(race_col_label).type):
+        original_rows = table.num_rows
+        table = table.filter(pc.is_valid(table[race_col_label]))
+        race_index = table.schema.get_field_index(race_col_label)
+        table = table.set_column(race_index, race_col_label, pc.cast(table[race_col_label], pa.int64(), safe=False))
+        if table.num_rows < original_rows:
+            logger.info(f"\nNote: Removed {original_rows - table.num_rows} rows with invalid/missing '{race_col_label}' values.")
+    else:
+        logger.warning(f"\nWarning: '{race_col_label}' was not identified as numeric, skipping integrity check.")
+
+    # 9/10. Label today's race as Sprint vs. Route
+    if "distance_in_yards" in table.column_names:
+        table = table.append_column("distance_type", distance_type_labels(table["distance_in_yards"]))
+    else:
+        logger.error("No 'distance_in_yards' column found in DataFrame. Cannot create 'distance_type'.")
+
+    # 11. prior races 1–10
+    for i in range(1, 11):
+        yard_col = f"distance_in_yards_{i}"
+        type_col = f"distance_type_{i}"
+        if yard_col in table.column_names: # Check if column exists
+            table = table.append_column(type_col, distance_type_labels(table[yard_col]))
+        else:
+            logger.warning(f"Column '{yard_col}' not found for past race {i}. '{type_col}' will not be created or will be all NaN.")
+    return table
+
+def stream_block_size(data_file_to_parse: DrfInput, chunk_rows: int = DRF_STREAM_CHUNK_ROWS) -> int:
+    """Estimates the reader block size (bytes) that holds about chunk_rows lines."""
+    with open_drf(data_file_to_parse) as f:
+        sample = f.read(1 << 20)
+    line_bytes = len(sample) // max(sample.count(b'\n'), 1)
+    return max(line_bytes * chunk_rows, 1 << 16)
+
+def iter_drf_batches(data_file_to_parse: DrfInput, schema: CompiledSchema, chunk_rows: int = DRF_STREAM_CHUNK_ROWS,
+                     lenient_cols: AbstractSet[str] = frozenset()) -> Iterator[pa.Table]:
+    """
+    Streams a comma-delimited Brisnet data file as typed tables of roughly
+    chunk_rows lines, decoded exactly as read_drf_table decodes the whole file.
+    """
+    options = drf_csv_options(schema, lenient_cols, stream_block_size(data_file_to_parse, chunk_rows))
+    with open_drf(data_file_to_parse) as stream, pa_csv.open_csv(stream, *options) as reader:
+        for batch in reader:
+            yield decode_table(pa.Table.from_batches([batch]), schema, lenient_cols)
+
+def parse_and_write_streaming(data_file_to_parse: DrfInput, schema: CompiledSchema, output_path: Path,
+                              chunk_rows: int = DRF_STREAM_CHUNK_ROWS) -> Optional[Tuple[int, int]]:
+    """
+    Parses and writes a DRF file one batch at a time, appending a Parquet row
+    group per batch so peak memory is bounded by the chunk size rather than
+    the size of the file.
+
+    Returns (rows, columns) written, or None if nothing was written.
+    """
+    logger = logging.getLogger(__name__)
+    if not data_file_to_parse.exists():
+        logger.error(f"Error: Race data file not found at {data_file_to_parse}")
+        return None
+    race_col_label = get_race_column_label(schema.spec_df)
+    logger.info(f"\nStreaming {data_file_to_parse.name} in batches of ~{chunk_rows:,} lines...")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix(".tmp" + output_path.suffix)
+    lenient_cols: Set[str] = set()
+    while True:
+        writer = None
+        total_rows = column_count = 0
         try:
-            df_copy[col] = pd.to_datetime(df_copy[col], format=brisnet_date_format, errors='coerce')
-            converted_date_count += 1
+            for batch_num, table in enumerate(iter_drf_batches(data_file_to_parse, schema, chunk_rows, lenient_cols), start=1):
+                table = finalize_race_table(table, race_col_label)
+                if table.num_rows == 0:
+                    continue
+                if writer is None:
+                    writer = open_table_writer(tmp_path, table.schema)
+                    column_count = table.num_columns
+                writer.write_table(table)
+                total_rows += table.num_rows
+                logger.info(f"  - Wrote row group {batch_num} ({table.num_rows} rows, {total_rows} total).")
+            break
         except Exception as e:
-            try:
-                 logger.info(f"  - Retrying datetime conversion for '{col}' without specific format.")
-                 df_copy[col] = pd.to_datetime(df_copy[col], errors='coerce')
-            except Exception as e2:
-                 logger.warning(f"  - Warning: Failed to convert column '{col}' to datetime: {e2}")
-    logger.info(f"Successfully converted {converted_date_count} date columns.")
-    return df_copy
+            if writer is not None:
+                writer.close()
+            tmp_path.unlink(missing_ok=True)
+            retry = _lenient_retry(e, schema, lenient_cols, data_file_to_parse.name)
+            if retry is None:
+                logger.error(f"An unexpected error occurred while streaming {data_file_to_parse.name}: {e}", exc_info=True)
+                return None
+            lenient_cols = retry
+
+    if writer is None:
+        logger.warning("\nNo data parsed from the streamed file. Cannot save Parquet file.")
+        return None
+    writer.close()
+    tmp_path.replace(output_path)
+    logger.info(f"\nSuccessfully streamed final data to: {output_path}")
+    return total_rows, column_count
+
+def parse_drf(drf_file_path: DrfInput) -> Optional[pa.Table]:
+    """
+    Parses a DRF file into the final typed wide table without saving it, so
+    an orchestrating caller can hand it straight to the downstream stages.
+    """
+    logger = logging.getLogger(__name__)
+    schema = load_compiled_schema(BRIS_DICT_FILE_PATH_BRIS, SPEC_CACHE_FILE_PATH_BRIS)
+    if schema is None:
+        logger.error(f"Cannot parse {drf_file_path.name}: failed to load the spec cache.")
+        return None
+    race_table = read_drf_table(drf_file_path, schema)
+    if race_table is None or race_table.num_rows == 0:
+        logger.warning("\nNo data parsed or DataFrame is empty after initial parsing. Cannot save Parquet file.")
+        return None
+    return finalize_race_table(race_table, get_race_column_label(schema.spec_df))
+
+def save_parsed_table(race_table: pa.Table, output_path: Path = OUTPUT_PARQUET_FILE_PATH_BRIS) -> Optional[Path]:
+    """Writes the parsed wide table to Parquet. Returns the path, or None on failure."""
+    logger = logging.getLogger(__name__)
+    logger.info(f"\nSaving the processed data to Parquet file: {output_path}")
+    try:
+        # Ensure the output directory exists
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        write_table(race_table, output_path)
+    except Exception as e:
+        logger.error(f"\nError saving final data to Parquet file {output_path}: {e}", exc_info=True)
+        return None
+    logger.info(f"\nSuccessfully saved final data to: {output_path}")
+    logger.info(f"Final DataFrame shape: {race_table.shape}")
+    return output_path
 
 # --- NEW Main Function ---
-def main(drf_file_path_arg: Optional[Path] = None):
+def main(drf_file_path_arg: Optional[DrfInput] = None, streaming: bool = STREAMING_PARSE,
+         output_path: Path = OUTPUT_PARQUET_FILE_PATH_BRIS) -> Optional[Path]:
     """
     Main processing logic for parsing a DRF file.
-    Accepts a DRF file path as an argument.
+    Accepts a DRF file path as an argument. With streaming=True the file is
+    parsed in bounded-size batches and written one row group at a time.
+    Returns the path of the saved Parquet file, or None if nothing was saved.
     """
     # Get a logger specific to this module (or use a globally configured one)
     logger = logging.getLogger(__name__) # Ensures this main function uses logging
@@ -191,104 +481,35 @@ def main(drf_file_path_arg: Optional[Path] = None):
         # If run directly, it might need to find the file or use a hardcoded default.
         # The find_latest_drf_file logic is better placed in run_pipeline.py.
         logger.error("DRF file path argument (drf_file_path_arg) is required for bris_spec_new.main().")
-        return # Or raise an error
+        return None
 
-    # 1. Load the column name specification cache (Field# -> Label)
-    spec_df = load_specification_cache(SPEC_CACHE_FILE_PATH_BRIS)
-    if spec_df is None:
+    # 1-2. Load the compiled schema (Field# -> Label, Field# -> Type), built
+    # from bris_spec.pkl and bris_dict.txt only when either has changed
+    schema = load_compiled_schema(BRIS_DICT_FILE_PATH_BRIS, SPEC_CACHE_FILE_PATH_BRIS)
+    if schema is None:
         logger.error("Aborting bris_spec_new.main() due to failure in loading spec cache.")
-        return # Or exit(1)
-
-    # 2. Parse the bris_dict.txt file to get Field# -> Type mapping
-    field_type_map = parse_bris_dict_types(BRIS_DICT_FILE_PATH_BRIS)
+        return None
+    spec_df = schema.spec_df
+    field_type_map = schema.field_types
     if not field_type_map:
         logger.warning("Could not parse field types from bris_dict.txt. Type conversion may be inaccurate.")
-        # Decide if this is a critical error that should stop execution
-        # For now, it proceeds with a warning.
-
-    # 3. Extract the full ordered list of labels (column names) from the cache
-    all_ordered_column_labels = spec_df['label'].tolist()
 
-    # 4. Parse the actual race data file, excluding only reserved columns
-    # Use the determined DRF file path
-    race_data_df = parse_brisnet_csv_data(current_drf_file_to_process, all_ordered_column_labels)
+    if streaming:
+        result = parse_and_write_streaming(current_drf_file_to_process, schema, output_path)
+        if result is not None:
+            logger.info(f"Final DataFrame shape: {result}")
+        logger.info("--- bris_spec_new.main() finished ---")
+        return output_path if result is not None else None
 
-    if race_data_df is not None and not race_data_df.empty:
-        # 5. Identify numeric and date columns using the parsed spec info
-        numeric_labels, date_labels = identify_column_types_from_spec(spec_df, field_type_map)
+    # 3-11. Parse the race data file straight into the compiled schema's types
+    # (excluding only reserved columns), check the race column, add Sprint/Route labels
+    race_table = parse_drf(current_drf_file_to_process)
 
-        # 6. Perform Type Conversions
-        race_data_df = convert_data_types(race_data_df, numeric_labels, date_labels)
-
-        # 7. Basic Integrity Check
-        RACE_COL = 'race' 
-        try:
-             race_col_label = spec_df[spec_df['field_number'] == 3]['label'].iloc[0]
-        except (KeyError, IndexError):
-             logger.warning("Warning: Could not find label for Field 3 (Race #) in spec cache. Using default 'race'.")
-             race_col_label = RACE_COL
-        if race_col_label not in race_data_df.columns:
-            logger.warning(f"\nWarning: Race column ('{race_col_label}') not found. Output may lack structure.")
-        else:
-            original_rows = len(race_data_df)
-            if race_col_label in numeric_labels:
-                 race_data_df = race_data_df.dropna(subset=[race_col_label])
-                 if not race_data_df.empty:
-                     race_data_df[race_col_label] = race_data_df[race_col_label].astype(int)
-                 rows_after_dropna = len(race_data_df)
-                 if rows_after_dropna < original_rows:
-                     logger.info(f"\nNote: Removed {original_rows - rows_after_dropna} rows with invalid/missing '{race_col_label}' values.")
-            else:
-                 logger.warning(f"\nWarning: '{race_col_label}' was not identified as numeric, skipping integrity check.")
-        
-        #9. Label each race as Sprint vs. Route
-        def label_dist(d):
-            try: val = float(d)
-            except Exception: return np.nan
-            return "Sprint" if val <= 1540 else "Route"
-
-        # 10. current race
-        if "distance_in_yards" in race_data_df.columns:
-            race_data_df["distance_type"] = race_data_df["distance_in_yards"].apply(label_dist)
-        else:
-            logger.error("No 'distance_in_yards' column found in DataFrame. Cannot create 'distance_type'.")
-            # Decide if this is critical. For now, it would raise KeyError later if not handled.
-            # To prevent error, you could add: race_data_df["distance_type"] = np.nan
-            # or raise a more controlled error here.
-            # For now, let's allow the KeyError to be caught by run_pipeline.py's general error handler if it occurs.
-
-        # 11. prior races 1–10
-        for i in range(1, 11):
-            yard_col = f"distance_in_yards_{i}"
-            type_col = f"distance_type_{i}"
-            if yard_col in race_data_df.columns: # Check if column exists
-                race_data_df[type_col] = race_data_df[yard_col].apply(label_dist)
-            else:
-                # If column doesn't exist, create it with NaNs or log warning
-                logger.warning(f"Column '{yard_col}' not found for past race {i}. '{type_col}' will not be created or will be all NaN.")
-                # race_data_df[type_col] = np.nan # Optionally create it as NaN
-
-        # 8. Save the final DataFrame to Parquet
-        logger.info(f"\nSaving the processed data to Parquet file: {OUTPUT_PARQUET_FILE_PATH_BRIS}")
-        try:
-            # Ensure the output directory exists
-            OUTPUT_PARQUET_FILE_PATH_BRIS.parent.mkdir(parents=True, exist_ok=True)
-            race_data_df.to_parquet(OUTPUT_PARQUET_FILE_PATH_BRIS, index=False, engine='pyarrow')
-            logger.info(f"\nSuccessfully saved final data to: {OUTPUT_PARQUET_FILE_PATH_BRIS}")
-            logger.info(f"Final DataFrame shape: {race_data_df.shape}")
-            logger.info("Final DataFrame Info:")
-            # Redirect .info() to logger if possible, or capture and log
-            # For simplicity, if run directly, it prints to stdout. If imported, this print might be hidden.
-            # race_data_df.info(verbose=False) 
-        except ImportError:
-            logger.error("\nError: 'pyarrow' library not found. Cannot save to Parquet.")
-            logger.error("Please install it: pip install pyarrow")
-        except Exception as e:
-            logger.error(f"\nError saving final data to Parquet file {OUTPUT_PARQUET_FILE_PATH_BRIS}: {e}", exc_info=True)
-    else:
-        logger.warning("\nNo data parsed or DataFrame is empty after initial parsing. Cannot save Parquet file.")
+    # 8. Save the final table to Parquet
+    saved_path = save_parsed_table(race_table, output_path) if race_table is not None else None
     
     logger.info("--- bris_spec_new.main() finished ---")
+    return saved_path
 
 
 # --- Main Execution (for direct script run) ---
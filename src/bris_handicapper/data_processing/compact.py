@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Compact representation of the long-format tables.
+
+A CompactSpec declares how a table is narrowed before it is written (and so
+how every stage that reads it back holds it in memory):
+
+    small ints    null-free id and counter columns as int8/int16
+    category      low-cardinality code columns (track, surface, condition,
+                  race type, run style, flags) as categoricals
+    float32       every other float column, except the ones the spec keeps
+                  at float64 (unbounded amounts such as purses)
+
+Categories come from a shared vocabulary (settings.CATEGORY_VOCABULARY): one
+append-only list of values per code set, seeded with the Brisnet code lists
+and extended with each value the first time a card has it. Every card is
+written with the same dictionaries, so card files concatenate as
+categoricals; concat_frames unions the categories of any that still differ.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config.settings import CATEGORY_VOCABULARY
+
+COMPACT_INT8 = "int8"
+COMPACT_INT16 = "int16"
+
+# Known values of each shared code set; values a card adds are appended after these.
+SEED_VOCABULARY: Dict[str, Tuple[str, ...]] = {
+    "surface": ("D", "T", "d", "t", "s", "h"),
+    "track_condition": ("FT", "GD", "SY", "MY", "SL", "HY", "FR", "WF", "FM", "GF", "YL", "SF", "HD", "TF"),
+    "race_type": ("G1", "G2", "G3", "N", "A", "R", "T", "C", "CO", "S", "M", "AO", "MO", "NO"),
+    # As stored: the run style field is three characters wide.
+    "run_style": ("E  ", "E/P", "P  ", "S  ", "NA "),
+    "distance_type": ("Sprint", "Route"),
+    "track_code": (),
+    "age_sex_restrict": (),
+    # One-character indicators (chute, entry, claimed, statebred, bandages, ...)
+    "flag": (),
+}
+
+# Serialises vocabulary updates between the stage threads of this process.
+_vocabulary_lock = threading.Lock()
+
+class CompactSpec:
+    """The narrowed dtypes of one long-format table."""
+
+    def __init__(self, int_dtypes: Dict[str, str], categories: Dict[str, str], float64_columns: Sequence[str] = ()):
+        bad = {c: d for c, d in int_dtypes.items() if d not in (COMPACT_INT8, COMPACT_INT16)}
+        if bad:
+            raise ValueError(f"Unsupported compact integer dtypes {bad}")
+        unknown = sorted(set(categories.values()) - set(SEED_VOCABULARY))
+        if unknown:
+            raise ValueError(f"Unknown category vocabularies {unknown}; expected one of {sorted(SEED_VOCABULARY)}")
+        self.int_dtypes = int_dtypes
+        # column -> vocabulary name
+        self.categories = categories
+        # Float columns left at float64
+        self.float64_columns = frozenset(float64_columns)
+
+    def __repr__(self) -> str:
+        return (f"CompactSpec({len(self.int_dtypes)} int, {len(self.categories)} category, "
+                f"{len(self.float64_columns)} float64 kept)")
+
+class CategoryVocabulary:
+    """The shared, append-only category lists, persisted as JSON."""
+
+    def __init__(self, path: Path = CATEGORY_VOCABULARY):
+        self.path = path
+        self.values: Dict[str, List[str]] = {name: list(seed) for name, seed in SEED_VOCABULARY.items()}
+        self._merge(self._load())
+        self.dirty = False
+
+    def _load(self) -> Dict[str, List[str]]:
+        logger = logging.getLogger(__name__)
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read category vocabulary {self.path}: {e}. Starting from the seed lists.")
+            return {}
+
+    def _merge(self, values: Dict[str, List[str]]) -> bool:
+        added = False
+        for name, extra in values.items():
+            known = self.values.setdefault(name, [])
+            seen = set(known)
+            for value in extra:
+                if value not in seen:
+                    known.append(value)
+                    seen.add(value)
+                    added = True
+        return added
+
+    def categories(self, name: str, observed: Iterable[str]) -> List[str]:
+        """The categories of code set `name`, after appending any observed value it lacks."""
+        if self._merge({name: [v for v in observed if isinstance(v, str)]}):
+            self.dirty = True
+        return list(self.values[name])
+
+    def save(self) -> None:
+        """Writes the vocabulary if it grew, keeping values other processes added meanwhile."""
+        if not self.dirty:
+            return
+        self._merge(self._load())
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.values, f, indent=2)
+        tmp_path.replace(self.path)
+        self.dirty = False
+
+def _fits(values: pd.Series, dtype: str) -> bool:
+    info = np.iinfo(dtype)
+    return bool(values.notna().all()) and (values.empty or (values.min() >= info.min and values.max() <= info.max))
+
+def compact_frame(df: pd.DataFrame, spec: CompactSpec, vocabulary: Optional[CategoryVocabulary] = None) -> pd.DataFrame:
+    """
+    Returns df with the spec's dtypes. Integer columns are only narrowed when
+    they have no nulls and every value fits; others are left as they are.
+    """
+    logger = logging.getLogger(__name__)
+    converted: Dict[str, pd.Series] = {}
+    for column, dtype in spec.int_dtypes.items():
+        if column not in df.columns or df[column].dtype.kind not in "iu":
+            continue
+        if _fits(df[column], dtype):
+            converted[column] = df[column].astype(dtype)
+        else:
+            logger.debug(f"'{column}' has nulls or values outside {dtype}; left as {df[column].dtype}.")
+    for column in df.columns:
+        if df[column].dtype == "float64" and column not in spec.float64_columns:
+            converted[column] = df[column].astype("float32")
+
+    columns = [c for c in spec.categories if c in df.columns]
+    if columns:
+        with _vocabulary_lock:
+            vocabulary = vocabulary or CategoryVocabulary()
+            for column in columns:
+                values = df[column].astype(object).where(df[column].notna(), None)
+                categories = vocabulary.categories(spec.categories[column], pd.unique(values.dropna()))
+                converted[column] = pd.Series(pd.Categorical(values, categories=categories), index=df.index)
+            vocabulary.save()
+    return df.assign(**converted) if converted else df
+
+def concat_frames(frames: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    """
+    pd.concat of row-compatible frames that keeps a categorical column
+    categorical when the frames' categories differ (their union, in
+    first-seen order) rather than falling back to object.
+    """
+    frames = list(frames)
+    if len(frames) > 1:
+        for column in frames[0].columns:
+            dtypes = [f[column].dtype for f in frames if column in f.columns]
+            if len(dtypes) < len(frames) or not all(isinstance(d, pd.CategoricalDtype) for d in dtypes):
+                continue
+            union = list(dict.fromkeys(c for d in dtypes for c in d.categories))
+            if any(list(d.categories) != union for d in dtypes):
+                frames = [f.assign(**{column: f[column].cat.set_categories(union)}) for f in frames]
+    return pd.concat(frames, ignore_index=True, sort=False)
@@ -20,6 +20,7 @@ import logging  # Import logging
 import sys
 
 from config.settings import PARSED_RACE_DATA, CURRENT_RACE_INFO, PROCESSED_DATA_DIR
+from .projection import available_columns, read_columns, write_frame
 
 # --- Centralized Path Configuration ---
 WIDE_DATA_FILE_PATH: Final[Path] = PARSED_RACE_DATA
@@ -316,27 +317,34 @@ record_groups = {
 }
 
 # --- Main Function (New) ---
-def main():
+def main(input_path: Path = WIDE_DATA_FILE_PATH, output_path: Path = CURRENT_INFO_FILE_PATH,
+         wide_df: Optional[pd.DataFrame] = None) -> Optional[Path]:
     """
     Main function to process current race info.
     This function will be called by run_pipeline.py.
+    If wide_df is given (the in-memory parse output), input_path is not read.
+    Returns the path of the saved Parquet file, or None if nothing was saved.
     """
     logger = logging.getLogger(__name__) # Get logger instance
     logger.info(f"--- Creating Current Race Info File ({pd.Timestamp.now(tz='America/New_York').strftime('%Y-%m-%d %H:%M:%S %Z')}) ---")
 
-    # 1. Load the full wide-format data
-    if not WIDE_DATA_FILE_PATH.exists():
-        logger.error(f"Error: Input Parquet file not found at {WIDE_DATA_FILE_PATH}")
-        # Consider raising an error or returning a status
-        return
-    try:
-        logger.info(f"Loading wide format data from: {WIDE_DATA_FILE_PATH}")
-        wide_df = pd.read_parquet(WIDE_DATA_FILE_PATH, engine='pyarrow')
-        logger.info(f"Loaded wide data with shape: {wide_df.shape}")
+    # 1. Load the wide-format data (unless it was handed over in memory),
+    # skipping the workout/past performance columns at read time
+    if wide_df is None:
+        if not input_path.exists():
+            logger.error(f"Error: Input Parquet file not found at {input_path}")
+            return None
+        try:
+            logger.info(f"Loading wide format data from: {input_path}")
+            original_cols = available_columns(input_path)
+            wide_df = read_columns(input_path, exclude=COLUMNS_TO_DROP)
+            logger.info(f"Loaded wide data with shape: {wide_df.shape}")
+        except Exception as e:
+            logger.error(f"Error loading Parquet file {input_path}: {e}", exc_info=True)
+            return None
+    else:
+        logger.info(f"Using in-memory wide data with shape: {wide_df.shape}")
         original_cols = wide_df.columns.tolist()
-    except Exception as e:
-        logger.error(f"Error loading Parquet file {WIDE_DATA_FILE_PATH}: {e}", exc_info=True)
-        return
 
     # 2. Identify columns that actually exist in the DataFrame and are in the drop list
     cols_to_actually_drop = [col for col in COLUMNS_TO_DROP if col in original_cols]
@@ -408,20 +416,23 @@ def main():
     current_info_df['furlongs'] = current_info_df['distance_in_yards'] / 220
 
     # 4b. Save the resulting DataFrame
-    logger.info(f"\nSaving current race info data to: {CURRENT_INFO_FILE_PATH}")
+    logger.info(f"\nSaving current race info data to: {output_path}")
+    saved_path: Optional[Path] = None
     try:
-        CURRENT_INFO_FILE_PATH.parent.mkdir(parents=True, exist_ok=True) # Ensure directory exists
-        current_info_df.to_parquet(CURRENT_INFO_FILE_PATH, index=False, engine='pyarrow')
+        output_path.parent.mkdir(parents=True, exist_ok=True) # Ensure directory exists
+        write_frame(current_info_df, output_path)
         logger.info("Save complete.")
+        saved_path = output_path
         logger.info("\nOutput DataFrame Info:")
         # current_info_df.info(verbose=False, show_counts=True) # .info() prints to stdout
     except ImportError:
         logger.error("\nError: 'pyarrow' library not found. Cannot save to Parquet.")
         logger.error("Please install it: pip install pyarrow")
     except Exception as e:
-        logger.error(f"\nError saving final data to Parquet file {CURRENT_INFO_FILE_PATH}: {e}", exc_info=True)
+        logger.error(f"\nError saving final data to Parquet file {output_path}: {e}", exc_info=True)
 
     logger.info(f"\n--- Script Finished ({pd.Timestamp.now(tz='America/New_York').strftime('%Y-%m-%d %H:%M:%S %Z')}) ---")
+    return saved_path
 
 # --- Main Execution (for direct script run) ---
 if __name__ == "__main__":
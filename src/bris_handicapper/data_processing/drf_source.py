@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+DRF card sources: bare .DRF files and the compressed bundles Brisnet serves.
+
+A card is read from a plain DRF file, a gzip-compressed DRF (CDX0628.DRF.gz)
+or a DRF member of a zip archive. Compressed cards are decompressed as a
+stream straight into the CSV reader, so no extracted copy is written to disk.
+A zip holding several DRF files yields one card per member.
+"""
+from __future__ import annotations
+
+import fnmatch
+import logging
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import pyarrow as pa
+
+from config.settings import DRF_BUNDLE_PATTERNS, DRF_PATTERN, RAW_DATA_DIR
+
+class DrfSource:
+    """One DRF card: a file on disk, or a member of a zip bundle on disk."""
+
+    def __init__(self, path: Path, member: Optional[str] = None):
+        self.path = Path(path)
+        self.member = member
+
+    @property
+    def name(self) -> str:
+        """File name of the card itself (without a .gz suffix)."""
+        if self.member is not None:
+            return PurePosixPath(self.member).name
+        if self.is_gzip:
+            return self.path.stem
+        return self.path.name
+
+    @property
+    def stem(self) -> str:
+        return PurePosixPath(self.name).stem
+
+    @property
+    def is_gzip(self) -> bool:
+        return self.member is None and self.path.suffix.lower() == ".gz"
+
+    @property
+    def is_compressed(self) -> bool:
+        return self.member is not None or self.is_gzip
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _key(self) -> Tuple[str, Optional[str]]:
+        return str(self.path), self.member
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, DrfSource) and self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __str__(self) -> str:
+        return f"{self.path}:{self.member}" if self.member is not None else str(self.path)
+
+    def __repr__(self) -> str:
+        return f"DrfSource({str(self)!r})"
+
+# Anything naming a card: a path to a DRF/.gz file, or a DrfSource.
+DrfInput = Union[Path, DrfSource]
+
+def as_drf_source(drf: Union[DrfInput, str]) -> DrfSource:
+    return drf if isinstance(drf, DrfSource) else DrfSource(Path(drf))
+
+@contextmanager
+def open_drf(drf: DrfInput) -> Iterator[Union[BinaryIO, pa.NativeFile]]:
+    """Opens a card as a binary stream, decompressing gzip and zip members on the fly."""
+    source = as_drf_source(drf)
+    if source.member is not None:
+        with zipfile.ZipFile(source.path) as bundle, bundle.open(source.member) as stream:
+            yield stream
+    elif source.is_gzip:
+        with pa.input_stream(str(source.path), compression="gzip") as stream:
+            yield stream
+    else:
+        with open(source.path, 'rb') as stream:
+            yield stream
+
+def read_first_line(drf: DrfInput, max_bytes: int = 1 << 16) -> bytes:
+    """Returns the first line of a card (without the line ending)."""
+    with open_drf(drf) as stream:
+        head = stream.read(max_bytes)
+    return head.split(b'\n', 1)[0].rstrip(b'\r')
+
+def _is_drf_name(name: str, pattern: str = DRF_PATTERN) -> bool:
+    return fnmatch.fnmatch(name, pattern)
+
+def zip_members(bundle_path: Path, pattern: str = DRF_PATTERN) -> List[str]:
+    """Names of the DRF members of a zip bundle, sorted by file name."""
+    with zipfile.ZipFile(bundle_path) as bundle:
+        names = [info.filename for info in bundle.infolist()
+                 if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+                 and _is_drf_name(PurePosixPath(info.filename).name, pattern)]
+    return sorted(names, key=lambda n: PurePosixPath(n).name)
+
+def expand_drf_path(path: Path, pattern: str = DRF_PATTERN) -> List[DrfSource]:
+    """The cards held by one file: itself, its gzip payload, or each DRF member of a zip."""
+    path = Path(path)
+    if zipfile.is_zipfile(path):
+        members = zip_members(path, pattern)
+        if not members:
+            logging.getLogger(__name__).warning(f"No DRF files matching '{pattern}' inside {path.name}")
+        return [DrfSource(path, member) for member in members]
+    return [DrfSource(path)]
+
+def expand_drf_paths(paths: Sequence[DrfInput], pattern: str = DRF_PATTERN) -> List[DrfSource]:
+    sources: List[DrfSource] = []
+    for path in paths:
+        sources.extend([path] if isinstance(path, DrfSource) else expand_drf_path(path, pattern))
+    return sources
+
+def find_drf_bundle_files(raw_dir: Path = RAW_DATA_DIR, pattern: str = DRF_PATTERN) -> List[Path]:
+    """DRF files, gzipped DRF files and zip bundles in a directory, sorted by name."""
+    found = set(raw_dir.glob(pattern))
+    for bundle_pattern in DRF_BUNDLE_PATTERNS:
+        for path in raw_dir.glob(bundle_pattern):
+            if path.suffix.lower() == ".gz" and not _is_drf_name(path.stem, pattern):
+                continue
+            found.add(path)
+    return sorted(found)
+
+def unique_cards(sources: Sequence[DrfSource]) -> List[DrfSource]:
+    """
+    Drops repeated cards (same file stem), keeping input order. A card found
+    both extracted and compressed is read from the bare file.
+    """
+    cards: Dict[str, DrfSource] = {}
+    for source in sorted(sources, key=lambda s: s.is_compressed):
+        if source.stem in cards:
+            logging.getLogger(__name__).info(f"Skipping {source}: card {source.stem} already found in {cards[source.stem]}")
+            continue
+        cards[source.stem] = source
+    kept = set(cards.values())
+    return [s for s in sources if s in kept]
+
+def find_drf_sources(raw_dir: Path = RAW_DATA_DIR, pattern: str = DRF_PATTERN) -> List[DrfSource]:
+    """Every card in a directory, with zip bundles expanded into one source per member."""
+    sources = expand_drf_paths(find_drf_bundle_files(raw_dir, pattern), pattern)
+    return sorted(unique_cards(sources), key=lambda s: s.name)
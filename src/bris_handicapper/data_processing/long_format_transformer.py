@@ -14,15 +14,21 @@ from config.settings import (
     BRIS_SPEC_CACHE,
     WORKOUTS_LONG,
     PAST_STARTS_LONG,
+    COMPACT_LONG_FORMAT,
 )
 
+from config.data_mappings import COLUMN_CATALOG, LONG_FORMAT_ID_COLUMNS, PAST_STARTS_STATIC_COLUMNS
+
+from .bris_spec_new import SPRINT_MAX_YARDS
+from .compact import COMPACT_INT8, CompactSpec, compact_frame
+from .pace_kernel import add_pace_figures
+from .projection import read_columns, write_frame
+from .reshape import DTYPE_DATE, DTYPE_FLOAT, ReshapePlan, reshape_plan, wide_to_long
+from .schema import load_compiled_schema
+from .window_features import REDUCER_LAST, REDUCER_MEAN, REDUCER_TOP_K_MEAN, WindowFeature, add_window_features, top_k_mean
+
 # ... (ID_VARIABLES, WORKOUT_METRIC_MAP, PAST_RACE_METRIC_MAP remain the same) ...
-ID_VARIABLES: List[str] = [
-    "track",
-    "race",
-    "post_position",
-    "horse_name",
-]
+ID_VARIABLES: List[str] = list(LONG_FORMAT_ID_COLUMNS)
 
 # Mapping from clean workout metric names to the field number of workout #1
 WORKOUT_METRIC_MAP: Dict[str, int] = {
@@ -37,6 +43,15 @@ WORKOUT_METRIC_MAP: Dict[str, int] = {
     "work_rank": 198,
 }
 
+# Target dtype of each numeric and date workout metric; the others stay text.
+WORKOUT_METRIC_DTYPES: Dict[str, str] = {
+    "work_date": DTYPE_DATE,
+    "work_time": DTYPE_FLOAT,
+    "work_distance": DTYPE_FLOAT,
+    "work_num_at_dist": DTYPE_FLOAT,
+    "work_rank": DTYPE_FLOAT,
+}
+
 # Mapping from clean past start metric names to the field number of race #1
 PAST_RACE_METRIC_MAP: Dict[str, int] = {
     "pp_race_date": 256,
@@ -135,38 +150,173 @@ PAST_RACE_METRIC_MAP: Dict[str, int] = {
     "pp_eqb_conditions": 1419,
 }
 
-# ... (load_data, validate_id_vars, wide_to_long_iterative, wide_to_long_melt, and all other helper functions remain the same) ...
-def load_data(parquet_path: Path, pkl_path: Path) -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
-    """Load wide-format race data and the specification cache."""
-    wide_df: Optional[pd.DataFrame] = None
-    spec_df: Optional[pd.DataFrame] = None
-
-    if not parquet_path.exists():
-        logging.error("Input Parquet file not found at %s", parquet_path)
-        return None, None
-    try:
-        wide_df = pd.read_parquet(parquet_path, engine="pyarrow")
-    except Exception as exc:
-        logging.error("Error loading Parquet file %s: %s", parquet_path, exc)
-        return None, None
-
-    if not pkl_path.exists():
-        logging.error("Specification cache file not found at %s", pkl_path)
-        return wide_df, None
-    try:
-        spec_df = pd.read_pickle(pkl_path)
-        if "field_number" not in spec_df.columns and spec_df.index.name != "field_number":
-            spec_df["field_number"] = spec_df.index
-        if "label" not in spec_df.columns:
-            logging.error("Spec cache '%s' must contain a 'label' column.", pkl_path.name)
-            return wide_df, None
-        if "field_number" in spec_df.columns and spec_df.index.name != "field_number":
-            spec_df = spec_df.set_index("field_number", drop=False)
-    except Exception as exc:
-        logging.error("Error loading specification cache file %s: %s", pkl_path, exc)
+# Target dtype of each numeric and date past start metric; the others (names,
+# codes, flags and comments) stay text.
+PAST_RACE_METRIC_DTYPES: Dict[str, str] = {
+    "pp_race_date": DTYPE_DATE,
+    "pp_days_since_prev": DTYPE_FLOAT,
+    "pp_race_num": DTYPE_FLOAT,
+    "pp_distance": DTYPE_FLOAT,
+    "pp_num_entrants": DTYPE_FLOAT,
+    "pp_post_position": DTYPE_FLOAT,
+    "pp_medication": DTYPE_FLOAT,
+    "pp_winner_weight": DTYPE_FLOAT,
+    "pp_second_weight": DTYPE_FLOAT,
+    "pp_third_weight": DTYPE_FLOAT,
+    "pp_winner_margin": DTYPE_FLOAT,
+    "pp_second_margin": DTYPE_FLOAT,
+    "pp_third_margin": DTYPE_FLOAT,
+    "pp_weight_carried": DTYPE_FLOAT,
+    "pp_odds": DTYPE_FLOAT,
+    "pp_claiming_price": DTYPE_FLOAT,
+    "pp_purse": DTYPE_FLOAT,
+    "pp_start_call_pos": DTYPE_FLOAT,
+    "pp_first_call_pos": DTYPE_FLOAT,
+    "pp_second_call_pos": DTYPE_FLOAT,
+    "pp_gate_call_pos": DTYPE_FLOAT,
+    "pp_stretch_pos": DTYPE_FLOAT,
+    "pp_finish_pos": DTYPE_FLOAT,
+    "pp_money_pos": DTYPE_FLOAT,
+    "pp_start_lengths_leader": DTYPE_FLOAT,
+    "pp_start_lengths_behind": DTYPE_FLOAT,
+    "pp_first_call_lengths_leader": DTYPE_FLOAT,
+    "pp_first_call_lengths_behind": DTYPE_FLOAT,
+    "pp_second_call_lengths_leader": DTYPE_FLOAT,
+    "pp_second_call_lengths_behind": DTYPE_FLOAT,
+    "pp_bris_shape_1st_call": DTYPE_FLOAT,
+    "pp_stretch_lengths_leader": DTYPE_FLOAT,
+    "pp_stretch_lengths_behind": DTYPE_FLOAT,
+    "pp_finish_lengths_winner": DTYPE_FLOAT,
+    "pp_finish_lengths_behind": DTYPE_FLOAT,
+    "pp_bris_shape_2nd_call": DTYPE_FLOAT,
+    "pp_bris_2f_pace": DTYPE_FLOAT,
+    "pp_bris_4f_pace": DTYPE_FLOAT,
+    "pp_bris_6f_pace": DTYPE_FLOAT,
+    "pp_bris_8f_pace": DTYPE_FLOAT,
+    "pp_bris_10f_pace": DTYPE_FLOAT,
+    "pp_bris_late_pace": DTYPE_FLOAT,
+    "pp_bris_speed_rating": DTYPE_FLOAT,
+    "pp_speed_rating_alt": DTYPE_FLOAT,
+    "pp_track_variant": DTYPE_FLOAT,
+    "pp_frac_2f": DTYPE_FLOAT,
+    "pp_frac_3f": DTYPE_FLOAT,
+    "pp_frac_4f": DTYPE_FLOAT,
+    "pp_frac_5f": DTYPE_FLOAT,
+    "pp_frac_6f": DTYPE_FLOAT,
+    "pp_frac_7f": DTYPE_FLOAT,
+    "pp_frac_8f": DTYPE_FLOAT,
+    "pp_frac_10f": DTYPE_FLOAT,
+    "pp_frac_12f": DTYPE_FLOAT,
+    "pp_frac_14f": DTYPE_FLOAT,
+    "pp_frac_16f": DTYPE_FLOAT,
+    "pp_fraction_1": DTYPE_FLOAT,
+    "pp_fraction_2": DTYPE_FLOAT,
+    "pp_fraction_3": DTYPE_FLOAT,
+    "pp_final_time": DTYPE_FLOAT,
+    "pp_apprentice_allow": DTYPE_FLOAT,
+    "pp_favorite_indicator": DTYPE_FLOAT,
+    "pp_bris_speed_par": DTYPE_FLOAT,
+    "pp_low_claiming": DTYPE_FLOAT,
+    "pp_high_claiming": DTYPE_FLOAT,
+}
+
+# Narrowed dtypes of the long tables in compact mode (settings.COMPACT_LONG_FORMAT):
+# ids as int8, code columns as shared-vocabulary categoricals, all other floats
+# as float32 except the money amounts.
+WORKOUTS_COMPACT = CompactSpec(
+    int_dtypes={"race": COMPACT_INT8, "post_position": COMPACT_INT8, "workout_num": COMPACT_INT8},
+    categories={
+        "track": "track_code",
+        "work_track": "track_code",
+        "work_track_condition": "track_condition",
+    },
+)
+
+PAST_STARTS_COMPACT = CompactSpec(
+    int_dtypes={
+        "race": COMPACT_INT8,
+        "post_position": COMPACT_INT8,
+        "past_race_num": COMPACT_INT8,
+        "quirin_style_speed_points": COMPACT_INT8,
+    },
+    categories={
+        "track": "track_code",
+        "pp_track_code": "track_code",
+        "pp_track_code_bris": "track_code",
+        "pp_surface": "surface",
+        "pp_track_condition": "track_condition",
+        "pp_race_type": "race_type",
+        "pp_distance_type": "distance_type",
+        "pp_age_sex_restrict": "age_sex_restrict",
+        "bris_run_style_designation": "run_style",
+        **{column: "flag" for column in (
+            "pp_chute_indicator", "pp_equipment", "pp_entry_indicator", "pp_claimed_code",
+            "pp_statebred_flag", "pp_restricted_flag", "pp_front_bandages", "pp_bar_shoe",
+            "pp_misc_code", "pp_sealed_track", "pp_aw_surface_flag",
+        )},
+    },
+    float64_columns=[
+        "pp_purse", "pp_claiming_price", "pp_low_claiming", "pp_high_claiming",
+        "avg_purse_last_5", "avg_purse_last_3", "purse_last_1",
+    ],
+)
+
+# Pace figures averaged over each horse's recent starts
+PACE_METRICS: List[str] = [
+    "pp_e1_pace",
+    "pp_turn_time",
+    "pp_e2_pace",
+    "pp_bris_late_pace",
+    "pp_combined_pace",
+]
+
+# Recency features of each horse's past starts, all computed in one pass
+PAST_START_WINDOW_FEATURES: List[WindowFeature] = [
+    *(WindowFeature(f"avg_best2_recent_{m}", m, 3, REDUCER_TOP_K_MEAN, k=2) for m in PACE_METRICS),
+    WindowFeature("avg_purse_last_5", "pp_purse", 5, REDUCER_MEAN),
+    WindowFeature("avg_purse_last_3", "pp_purse", 3, REDUCER_MEAN),
+    WindowFeature("purse_last_1", "pp_purse", 1, REDUCER_LAST),
+    WindowFeature("avg_odds_last_5", "pp_odds", 5, REDUCER_MEAN),
+    WindowFeature("avg_odds_last_3", "pp_odds", 3, REDUCER_MEAN),
+    WindowFeature("odds_last_1", "pp_odds", 1, REDUCER_LAST),
+]
+
+def load_data(
+    parquet_path: Path,
+    pkl_path: Path,
+    metric_map: Dict[str, int],
+    iter_col: str,
+    n_iters: int,
+    dtypes: Dict[str, str],
+    wide_df: Optional[pd.DataFrame] = None,
+    stage: Optional[str] = None,
+) -> Tuple[Optional[pd.DataFrame], Optional[ReshapePlan]]:
+    """
+    Load the reshape plan for the metric map and the wide-format race data
+    (unless already in memory). With a stage, only the stage's catalog
+    columns and the plan's numbered metric columns are read from the Parquet
+    file.
+    """
+    schema = load_compiled_schema(spec_path=pkl_path)
+    if schema is None:
+        logging.error("Could not load specification cache %s", pkl_path)
         return wide_df, None
+    plan = reshape_plan(schema, metric_map, iter_col, n_iters, dtypes)
+
+    if wide_df is None:
+        columns: Optional[List[str]] = None
+        if stage is not None:
+            columns = COLUMN_CATALOG[stage] + plan.columns
+        if not parquet_path.exists():
+            logging.error("Input file not found at %s", parquet_path)
+            return None, None
+        try:
+            wide_df = read_columns(parquet_path, columns)
+        except Exception as exc:
+            logging.error("Error loading %s: %s", parquet_path, exc)
+            return None, None
 
-    return wide_df, spec_df
+    return wide_df, plan
 
 
 def validate_id_vars(df: pd.DataFrame, id_vars: List[str], logger: logging.Logger) -> List[str]:
@@ -180,169 +330,23 @@ def validate_id_vars(df: pd.DataFrame, id_vars: List[str], logger: logging.Logge
     return actual
 
 
-def wide_to_long_iterative(
-    wide_df: pd.DataFrame,
-    spec_df: pd.DataFrame,
-    id_vars: List[str],
-    metric_map: Dict[str, int],
-    iter_col: str,
-    n_iters: int,
-) -> pd.DataFrame:
-    """Iteratively reshape sets of numbered columns to a long format."""
-    out_frames: List[pd.DataFrame] = []
-    for i in range(n_iters):
-        num = i + 1
-        col_map: Dict[str, str] = {}
-        cols: List[str] = []
-        for clean, base in metric_map.items():
-            field_num = base + i
-            try:
-                actual = spec_df.loc[field_num, "label"]
-            except Exception:
-                continue
-            if actual in wide_df.columns:
-                col_map[actual] = clean
-                cols.append(actual)
-        if not cols:
-            continue
-        temp = wide_df[id_vars + cols].copy()
-        temp.rename(columns=col_map, inplace=True)
-        temp[iter_col] = num
-        final_cols = id_vars + list(metric_map.keys()) + [iter_col]
-        final_cols = [c for c in final_cols if c in temp.columns]
-        out_frames.append(temp[final_cols])
-    if not out_frames:
-        return pd.DataFrame(columns=id_vars + list(metric_map.keys()) + [iter_col])
-    return pd.concat(out_frames, ignore_index=True, sort=False)
-
-
-def wide_to_long_melt(
-    wide_df: pd.DataFrame,
-    spec_df: pd.DataFrame,
-    id_vars: List[str],
-    metric_map: Dict[str, int],
-    iter_col: str,
-    n_iters: int,
-) -> pd.DataFrame:
-    """Reshape numbered columns to long format using pd.melt."""
-    melted: Dict[str, pd.DataFrame] = {}
-    for clean, base in metric_map.items():
-        actual_cols: List[str] = []
-        col_to_iter: Dict[str, int] = {}
-        for i in range(n_iters):
-            iter_num = i + 1
-            field_num = base + i
-            try:
-                actual = spec_df.loc[field_num, "label"]
-            except Exception:
-                continue
-            if actual in wide_df.columns:
-                actual_cols.append(actual)
-                col_to_iter[actual] = iter_num
-        if not actual_cols:
-            continue
-        mdf = wide_df[id_vars + actual_cols].melt(
-            id_vars=id_vars,
-            value_vars=actual_cols,
-            var_name="_actual",
-            value_name=clean,
-        )
-        mdf[iter_col] = mdf["_actual"].map(col_to_iter)
-        mdf.drop(columns=["_actual"], inplace=True)
-        mdf.dropna(subset=[iter_col], inplace=True)
-        melted[clean] = mdf
-    if not melted:
-        return pd.DataFrame()
-    keys = list(melted.keys())
-    df_long = melted[keys[0]]
-    join_keys = id_vars + [iter_col]
-    for key in keys[1:]:
-        df_long = df_long.merge(
-            melted[key][join_keys + [key]],
-            on=join_keys,
-            how="outer",
-        )
-    return df_long
-
 # ---------------------------------------------------------------------------
 # Workout-specific helpers
 
 def clean_workout_data(df: pd.DataFrame) -> pd.DataFrame:
-    if df.empty:
+    """Drops workouts without a valid date (the metrics are typed by the reshape plan)."""
+    if df.empty or "work_date" not in df.columns:
         return df
-    df = df.copy()
-    if "work_date" in df.columns:
-        df["work_date"] = pd.to_datetime(df["work_date"], format="%Y%m%d", errors="coerce")
-        df.dropna(subset=["work_date"], inplace=True)
-    numeric_cols = ["work_time", "work_distance", "work_num_at_dist", "work_rank"]
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    if "workout_num" in df.columns and df["workout_num"].notna().all():
-        df["workout_num"] = df["workout_num"].astype(int)
-    return df
+    return df.dropna(subset=["work_date"])
 
 # ---------------------------------------------------------------------------
 # Past starts specific helpers
 
-def label_dist(d):
-    try:
-        val = float(d)
-    except (ValueError, TypeError):
-        return np.nan
-    return "Sprint" if val <= 1540 else "Route"
-
-
 def clean_past_starts_data(df: pd.DataFrame) -> pd.DataFrame:
-    if df.empty:
+    """Drops past starts without a valid race date (the metrics are typed by the reshape plan)."""
+    if df.empty or "pp_race_date" not in df.columns:
         return df
-    df = df.copy()
-    date_cols = [col for col in df.columns if "date" in col.lower()]
-    numeric_cols = [
-        col
-        for col in df.columns
-        if any(k in col.lower() for k in [
-            "days",
-            "distance",
-            "entrants",
-            "position",
-            "weight",
-            "margin",
-            "odds",
-            "claiming",
-            "purse",
-            "lengths",
-            "shape",
-            "pace",
-            "speed",
-            "variant",
-            "frac",
-            "time",
-            "allow",
-            "indic",
-            "par",
-            "low",
-            "high",
-        ])
-        and col not in date_cols
-    ]
-    if "pp_distance" in df.columns:
-        df["pp_distance"] = pd.to_numeric(df["pp_distance"], errors="coerce")
-    numeric_cols.extend(["pp_race_num", "pp_medication", "pp_purse"])
-    numeric_cols = list(set(numeric_cols))
-    if "pp_race_date" in df.columns:
-        df["pp_race_date"] = pd.to_datetime(df["pp_race_date"], format="%Y%m%d", errors="coerce")
-        df.dropna(subset=["pp_race_date"], inplace=True)
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    pos_cols = [c for c in df.columns if "pos" in c.lower() or "finish" in c.lower()]
-    for col in pos_cols:
-        if col in df.columns and df[col].dtype == "object":
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    if "past_race_num" in df.columns and df["past_race_num"].notna().all():
-        df["past_race_num"] = df["past_race_num"].astype(int)
-    return df
+    return df.dropna(subset=["pp_race_date"])
 
 
 def calculate_splits_for_long_format(df: pd.DataFrame) -> pd.DataFrame:
@@ -358,9 +362,6 @@ def calculate_splits_for_long_format(df: pd.DataFrame) -> pd.DataFrame:
         "c9": "pp_frac_9f",
         "final": "pp_final_time",
     }
-    for col in cumulative.values():
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
     if "pp_frac_2f" in df:
         df["pp_split_0_2f_secs"] = df["pp_frac_2f"]
     if all(c in df for c in ("pp_frac_4f", "pp_frac_2f")):
@@ -374,16 +375,10 @@ def calculate_splits_for_long_format(df: pd.DataFrame) -> pd.DataFrame:
     if all(c in df for c in ("pp_frac_12f", "pp_frac_10f")):
         df["pp_split_10f_12f_secs"] = df["pp_frac_12f"] - df["pp_frac_10f"]
     if "pp_final_time" in df.columns:
-        if "pp_frac_10f" in df.columns:
-            df["pp_split_10f_finish_secs"] = df["pp_final_time"] - df["pp_frac_10f"]
-        elif "pp_frac_8f" in df.columns:
-            df["pp_split_8f_finish_secs"] = df["pp_final_time"] - df["pp_frac_8f"]
-        elif "pp_frac_6f" in df.columns:
-            df["pp_split_6f_finish_secs"] = df["pp_final_time"] - df["pp_frac_6f"]
-        elif "pp_frac_4f" in df.columns:
-            df["pp_split_4f_finish_secs"] = df["pp_final_time"] - df["pp_frac_4f"]
-        elif "pp_frac_2f" in df.columns:
-            df["pp_split_2f_finish_secs"] = df["pp_final_time"] - df["pp_frac_2f"]
+        # Last fraction of a sprint (from 4f), a route (from 6f) and a classic distance (from 10f)
+        for call in ("10f", "6f", "4f"):
+            if f"pp_frac_{call}" in df.columns:
+                df[f"pp_split_{call}_finish_secs"] = df["pp_final_time"] - df[f"pp_frac_{call}"]
     if all(c in df for c in ("pp_frac_5f", "pp_frac_4f")):
         df["pp_split_4f_5f_secs"] = df["pp_frac_5f"] - df["pp_frac_4f"]
     if all(c in df for c in ("pp_frac_7f", "pp_frac_6f")):
@@ -401,9 +396,6 @@ def calculate_position_changes(df: pd.DataFrame) -> pd.DataFrame:
         "stretch": "pp_stretch_pos",
         "finish": "pp_finish_pos",
     }
-    for col in col_map.values():
-        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
-            df[col] = pd.to_numeric(df[col], errors="coerce")
     if "pp_start_call_pos" in df and "pp_first_call_pos" in df:
         df["pp_pos_gain_start_to_c1"] = df["pp_start_call_pos"] - df["pp_first_call_pos"]
     if "pp_first_call_pos" in df and "pp_second_call_pos" in df:
@@ -425,9 +417,6 @@ def calculate_lengths_behind_changes(df: pd.DataFrame) -> pd.DataFrame:
         "stretch": "pp_stretch_lengths_leader",
         "finish": "pp_finish_lengths_winner",
     }
-    for col in col_map.values():
-        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
-            df[col] = pd.to_numeric(df[col], errors="coerce")
     if "pp_start_lengths_leader" in df and "pp_first_call_lengths_leader" in df:
         df["pp_chg_len_ldr_start_to_c1"] = df["pp_first_call_lengths_leader"] - df["pp_start_lengths_leader"]
     if "pp_first_call_lengths_leader" in df and "pp_second_call_lengths_leader" in df:
@@ -448,9 +437,6 @@ def calculate_early_late_pace_figures(df: pd.DataFrame) -> pd.DataFrame:
         "6f": "pp_bris_6f_pace",
         "late": "pp_bris_late_pace",
     }
-    for col in pace_cols.values():
-        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
-            df[col] = pd.to_numeric(df[col], errors="coerce")
     if "pp_distance_type" not in df.columns:
         df["pp_e1_pace"] = np.nan
         df["pp_e2_pace"] = np.nan
@@ -484,43 +470,22 @@ def calculate_avg_best2_bris_speed(df: pd.DataFrame) -> pd.DataFrame:
             df[c] = pd.to_numeric(df[c], errors="coerce")
         else:
             df[c] = np.nan
-    df["pp_avg_best2_bris_speed"] = df[cols].apply(
-        lambda r: r.nlargest(2).mean() if r.count() >= 2 else np.nan,
-        axis=1,
-    )
+    ratings = df[cols].to_numpy(dtype="float64", na_value=np.nan)
+    df["pp_avg_best2_bris_speed"] = top_k_mean(ratings, 2, min_count=2)
     return df
 
 
-def calculate_avg_best2_recent(df: pd.DataFrame, id_vars: List[str], metrics: List[str]) -> pd.DataFrame:
-    for m in metrics:
-        if m in df.columns:
-            df[m] = pd.to_numeric(df[m], errors="coerce")
-        else:
-            df[m] = np.nan
-    df = df.sort_values("pp_race_date", ascending=False)
-    for m in metrics:
-        out_col = f"avg_best2_recent_{m}"
-        df[out_col] = (
-            df.groupby(id_vars)[m]
-            .transform(lambda s: s.head(3).nlargest(2).mean())
-        )
-    return df
-
-
-def add_class_and_odds_metrics(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-    sort_cols = ["track", "race", "horse_name", "pp_race_date"]
-    out.sort_values(sort_cols, inplace=True)
-    group_cols = ["track", "race", "horse_name"]
-    def _tail_mean(series: pd.Series, n: int):
-        return series.tail(n).mean()
-    out["avg_purse_last_5"] = out.groupby(group_cols)["pp_purse"].transform(lambda s: _tail_mean(s, 5))
-    out["avg_purse_last_3"] = out.groupby(group_cols)["pp_purse"].transform(lambda s: _tail_mean(s, 3))
-    out["purse_last_1"] = out.groupby(group_cols)["pp_purse"].transform(lambda s: s.iloc[-1])
-    out["avg_odds_last_5"] = out.groupby(group_cols)["pp_odds"].transform(lambda s: _tail_mean(s, 5))
-    out["avg_odds_last_3"] = out.groupby(group_cols)["pp_odds"].transform(lambda s: _tail_mean(s, 3))
-    out["odds_last_1"] = out.groupby(group_cols)["pp_odds"].transform(lambda s: s.iloc[-1])
-    return out
+def add_history_features(df: pd.DataFrame, id_vars: List[str]) -> pd.DataFrame:
+    """
+    Adds the recency features declared in PAST_START_WINDOW_FEATURES and
+    orders the starts by horse and date, oldest first.
+    """
+    df = add_window_features(df, id_vars, "pp_race_date", PAST_START_WINDOW_FEATURES)
+    return df.sort_values(
+        ["track", "race", "horse_name", "pp_race_date", "past_race_num"],
+        ascending=[True, True, True, True, False],
+        kind="stable",
+    )
 
 
 def compute_fractional_splits(df: pd.DataFrame) -> pd.DataFrame:
@@ -669,147 +634,57 @@ def convert_odds_to_decimal(odds_value):
     
 def calculate_brohamer_pace_figures(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Calculates and appends Brohamer/Sartin pace figures to the past performance DataFrame.
-
-    This function computes feet-per-second (FPS) velocities for three internal
-    race fractions and uses them to derive the core Brohamer compound ratings:
-    Early Pace (EP), Sustained Pace (SP), Average Pace (AP), Factor X (FX),
-    and the energy distribution metric (%Early).
-
-    Args:
-        df: The long-format past performance DataFrame. Must contain fractional
-            split times (e.g., 'pp_split_0_2f_secs'), distance in yards
-            ('pp_distance'), and the race type ('pp_distance_type').
-
-    Returns:
-        The DataFrame with new columns for each Brohamer pace figure.
+    Appends the Brohamer/Sartin pace figures (fractional velocities, EP, SP,
+    AP, FX and %Early) computed by the columnar kernel in pace_kernel.
     """
     logger = logging.getLogger(__name__)
     logger.info("Calculating Brohamer/Sartin pace figures...")
-    
-    # Ensure a copy is being worked on to avoid SettingWithCopyWarning
-    df = df.copy()
-
-    # Constants
-    FEET_PER_FURLONG = 660
-
-    # --- 1. Calculate FPS Velocity for Each Internal Fraction ---
-    # Ensure required split columns are numeric, coercing errors
-    split_cols = [
-        'pp_split_0_2f_secs', 'pp_split_2f_4f_secs', 'pp_split_4f_6f_secs',
-        'pp_split_4f_finish_secs', 'pp_split_6f_finish_secs'
-    ]
-    for col in split_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        else:
-            logger.warning(f"Required split column '{col}' not found. Pace calculations involving it will result in NaN.")
-            df[col] = np.nan # Create column to prevent KeyErrors
-
-    # Initialize FPS columns with NaN
-    df['fps_f1'] = np.nan
-    df['fps_f2'] = np.nan
-    df['fps_f3'] = np.nan
-
-    # Define masks for sprint and route races
-    is_sprint = df['pp_distance_type'] == 'Sprint'
-    is_route = df['pp_distance_type'] == 'Route'
-    
-    # Fraction 1 Velocity (fps_f1)
-    df.loc[is_sprint, 'fps_f1'] = (2 * FEET_PER_FURLONG) / df.loc[is_sprint, 'pp_split_0_2f_secs']
-    df.loc[is_route, 'fps_f1'] = (4 * FEET_PER_FURLONG) / (df.loc[is_route, 'pp_split_0_2f_secs'] + df.loc[is_route, 'pp_split_2f_4f_secs'])
-
-    # Fraction 2 / Turn-Time Velocity (fps_f2)
-    df.loc[is_sprint, 'fps_f2'] = (2 * FEET_PER_FURLONG) / df.loc[is_sprint, 'pp_split_2f_4f_secs']
-    df.loc[is_route, 'fps_f2'] = (2 * FEET_PER_FURLONG) / df.loc[is_route, 'pp_split_4f_6f_secs']
-    
-    # Fraction 3 Velocity (fps_f3)
-    sprint_f3_dist = df.loc[is_sprint, 'pp_distance'] - (4 * 220) # 4f in yards
-    route_f3_dist = df.loc[is_route, 'pp_distance'] - (6 * 220)   # 6f in yards
-    df.loc[is_sprint, 'fps_f3'] = (sprint_f3_dist * 3) / df.loc[is_sprint, 'pp_split_4f_finish_secs'] # convert yards to feet
-    df.loc[is_route, 'fps_f3'] = (route_f3_dist * 3) / df.loc[is_route, 'pp_split_6f_finish_secs']   # convert yards to feet
-
-    # --- 2. Calculate Brohamer Compound Pace Ratings ---
-    df['ep'] = np.nan
-    df['sp'] = np.nan
-    df['ap'] = np.nan
-    df['fx'] = np.nan
-
-    # Early Pace (EP)
-    df.loc[is_sprint, 'ep'] = (4 * FEET_PER_FURLONG) / (df.loc[is_sprint, 'pp_split_0_2f_secs'] + df.loc[is_sprint, 'pp_split_2f_4f_secs'])
-    df.loc[is_route, 'ep'] = (6 * FEET_PER_FURLONG) / (df.loc[is_route, 'pp_split_0_2f_secs'] + df.loc[is_route, 'pp_split_2f_4f_secs'] + df.loc[is_route, 'pp_split_4f_6f_secs'])
-
-    # Sustained Pace (SP)
-    df['sp'] = (df['ep'] + df['fps_f3']) / 2
-
-    # Average Pace (AP)
-    df.loc[is_sprint, 'ap'] = (df.loc[is_sprint, 'fps_f1'] + df.loc[is_sprint, 'fps_f2'] + df.loc[is_sprint, 'fps_f3']) / 3
-    df.loc[is_route, 'ap'] = (df.loc[is_route, 'ep'] + df.loc[is_route, 'sp']) / 2
-    
-    # Factor X (FX) - Sprints only
-    df.loc[is_sprint, 'fx'] = (df.loc[is_sprint, 'fps_f1'] + df.loc[is_sprint, 'fps_f3']) / 2
-
-    # --- 3. Calculate Energy Distribution (%Early) ---
-    df['percent_early'] = df['ep'] / (df['ep'] + df['fps_f3'])
-
-    # Replace infinite values that can result from division by zero with NaN
-    df.replace([np.inf, -np.inf], np.nan, inplace=True)
-
+    df = add_pace_figures(df)
     logger.info("Finished calculating Brohamer/Sartin pace figures.")
     return df
 
 # ---------------------------------------------------------------------------
 # High level transformation functions
 
-def transform_workouts() -> None:
+def transform_workouts(
+    input_path: Path = PARSED_RACE_DATA,
+    output_path: Path = WORKOUTS_LONG,
+    wide_df: Optional[pd.DataFrame] = None,
+) -> Optional[Path]:
     logger = logging.getLogger(__name__)
     logger.info("--- Transforming workout data ---")
-    wide_df, spec_df = load_data(PARSED_RACE_DATA, BRIS_SPEC_CACHE)
-    if wide_df is None or spec_df is None:
+    wide_df, plan = load_data(input_path, BRIS_SPEC_CACHE, WORKOUT_METRIC_MAP, "workout_num", 12,
+                              WORKOUT_METRIC_DTYPES, wide_df, "workouts")
+    if wide_df is None or plan is None:
         logger.error("Failed to load necessary data. Aborting.")
-        return
+        return None
     actual_id_vars = validate_id_vars(wide_df, ID_VARIABLES, logger)
-    long_df = wide_to_long_iterative(
-        wide_df,
-        spec_df,
-        actual_id_vars,
-        WORKOUT_METRIC_MAP,
-        "workout_num",
-        12,
-    )
+    long_df = wide_to_long(wide_df, plan, actual_id_vars)
     long_df = clean_workout_data(long_df)
     if long_df.empty:
         logger.warning("No valid workout data found. Output file not saved.")
-        return
-    long_df.to_parquet(WORKOUTS_LONG, index=False, engine="pyarrow")
-    logger.info("Saved workout data to %s", WORKOUTS_LONG)
+        return None
+    if COMPACT_LONG_FORMAT:
+        long_df = compact_frame(long_df, WORKOUTS_COMPACT)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    write_frame(long_df, output_path)
+    logger.info("Saved workout data to %s", output_path)
+    return output_path
 
 
-def transform_past_starts() -> None:
+def add_past_start_features(long_df: pd.DataFrame, wide_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cleans the reshaped past starts and derives the pace, split, position and
+    class features, then merges the horse-level static columns back from the
+    wide data.
+    """
     logger = logging.getLogger(__name__)
-    logger.info("--- Transforming past performance data ---")
-    wide_df, spec_df = load_data(PARSED_RACE_DATA, BRIS_SPEC_CACHE)
-    if wide_df is None or spec_df is None:
-        logger.error("Failed to load necessary data. Aborting.")
-        return
-    actual_id_vars = validate_id_vars(wide_df, ID_VARIABLES, logger)
-    long_df = wide_to_long_melt(
-        wide_df,
-        spec_df,
-        actual_id_vars,
-        PAST_RACE_METRIC_MAP,
-        "past_race_num",
-        10,
-    )
-    if long_df.empty:
-        logger.error("No past performance metrics were successfully melted.")
-        return
-    
     # --- Data Cleaning and Feature Engineering Pipeline ---
     long_df = clean_past_starts_data(long_df)
     
     if "pp_distance" in long_df.columns:
-        long_df["pp_distance_type"] = long_df["pp_distance"].apply(label_dist)
+        # Missing distances fall through to 'Route', as in bris_spec_new.distance_type_labels.
+        long_df["pp_distance_type"] = np.where(long_df["pp_distance"] <= SPRINT_MAX_YARDS, "Sprint", "Route")
     else:
         logger.warning("'pp_distance' missing—cannot create 'pp_distance_type'.")
         long_df["pp_distance_type"] = np.nan
@@ -823,38 +698,47 @@ def transform_past_starts() -> None:
     long_df = calculate_brohamer_pace_figures(long_df)
     
     long_df = calculate_avg_best2_bris_speed(long_df)
-    metrics = [
-        "pp_e1_pace",
-        "pp_turn_time",
-        "pp_e2_pace",
-        "pp_bris_late_pace",
-        "pp_combined_pace",
-    ]
-    long_df = calculate_avg_best2_recent(long_df, ID_VARIABLES, metrics)
-    long_df = add_class_and_odds_metrics(long_df)
+    long_df = add_history_features(long_df, ID_VARIABLES)
     
     # Merge static info back
-    long_df = long_df.copy()
-    static_cols = [
-        "track",
-        "race",
-        "horse_name",
-        "post_position",
-        "morn_line_odds_if_available",
-        "bris_run_style_designation",
-        "quirin_style_speed_points",
-    ]
-    static_info = wide_df[static_cols].drop_duplicates()
-    long_df = long_df.merge(
+    static_info = wide_df[PAST_STARTS_STATIC_COLUMNS].drop_duplicates()
+    return long_df.merge(
         static_info,
         on=["track", "race", "post_position", "horse_name"],
         how="left",
     )
-    
+
+
+def transform_past_starts(
+    input_path: Path = PARSED_RACE_DATA,
+    output_path: Path = PAST_STARTS_LONG,
+    wide_df: Optional[pd.DataFrame] = None,
+) -> Optional[Path]:
+    logger = logging.getLogger(__name__)
+    logger.info("--- Transforming past performance data ---")
+    wide_df, plan = load_data(input_path, BRIS_SPEC_CACHE, PAST_RACE_METRIC_MAP, "past_race_num", 10,
+                              PAST_RACE_METRIC_DTYPES, wide_df, "past_starts")
+    if wide_df is None or plan is None:
+        logger.error("Failed to load necessary data. Aborting.")
+        return None
+    actual_id_vars = validate_id_vars(wide_df, ID_VARIABLES, logger)
+    long_df = wide_to_long(wide_df, plan, actual_id_vars)
+    if long_df.empty:
+        logger.error("No past performance data found in the wide data.")
+        return None
+    # Each horse's starts together, most recent first
+    long_df = long_df.sort_values(actual_id_vars + [plan.iter_col], kind="stable", ignore_index=True)
+
+    long_df = add_past_start_features(long_df, wide_df)
+
     if long_df.empty:
         logger.warning("No valid past performance data remained. Output not saved.")
-        return
-        
-    long_df.to_parquet(PAST_STARTS_LONG, index=False, engine="pyarrow")
-    logger.info("Saved past performance data to %s", PAST_STARTS_LONG)
+        return None
+
+    if COMPACT_LONG_FORMAT:
+        long_df = compact_frame(long_df, PAST_STARTS_COMPACT)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    write_frame(long_df, output_path)
+    logger.info("Saved past performance data to %s", output_path)
+    return output_path
 
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Brohamer/Sartin pace figures for the long-format past starts.
+
+The cumulative fractional times of every start (pp_frac_2f ... pp_frac_16f)
+are laid out once as a (starts x calls) matrix. For each start the kernel
+picks its first and second pace calls from the race distance:
+
+    sprints under 5f   2f and 3f (4f if there is no 3f time)
+    other sprints      2f and 4f (3f if there is no 4f time)
+    routes             4f and 6f (5f if there is no 6f time)
+
+A call is only used when its time is present and it lies before the
+finish. From the calls, the final time and the distance it computes the
+feet-per-second velocity of the three fractions and the compound ratings:
+
+    fps_f1         first call distance / first call time
+    fps_f2         first to second call
+    fps_f3         second call to the finish
+    ep             early pace, second call distance / second call time
+    sp             sustained pace, (ep + fps_f3) / 2
+    ap             average pace: sprints (f1 + f2 + f3) / 3, routes (ep + sp) / 2
+    fx             factor X, sprints only: (fps_f1 + fps_f3) / 2
+    percent_early  ep / (ep + fps_f3)
+
+Everything is vectorised NumPy over all starts at once; the figures are
+written into one (starts x figures) array. Figures that cannot be computed
+(missing or non-increasing times) are null.
+"""
+from __future__ import annotations
+
+from typing import Final, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .bris_spec_new import SPRINT_MAX_YARDS
+
+FEET_PER_FURLONG: Final[int] = 660
+YARDS_PER_FURLONG: Final[int] = 220
+
+# Call points with a cumulative time column pp_frac_<n>f, in furlongs
+PACE_CALL_FURLONGS: Final[Tuple[int, ...]] = (2, 3, 4, 5, 6, 7, 8, 10, 12, 14, 16)
+
+PACE_FIGURE_COLUMNS: Final[List[str]] = [
+    "fps_f1", "fps_f2", "fps_f3", "ep", "sp", "ap", "fx", "percent_early",
+]
+
+# Races shorter than this (yards) take their second call at 3f.
+SHORT_SPRINT_MAX_YARDS: Final[int] = 5 * YARDS_PER_FURLONG - 1
+
+def call_column(furlongs: int) -> str:
+    return f"pp_frac_{furlongs}f"
+
+def pace_call_matrix(df: pd.DataFrame) -> np.ndarray:
+    """The (starts x PACE_CALL_FURLONGS) matrix of cumulative times; null where a call is missing."""
+    calls = np.full((len(df), len(PACE_CALL_FURLONGS)), np.nan)
+    for j, furlongs in enumerate(PACE_CALL_FURLONGS):
+        column = call_column(furlongs)
+        if column in df.columns:
+            calls[:, j] = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    return calls
+
+def _column_values(df: pd.DataFrame, column: str) -> np.ndarray:
+    if column not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+def _pick_call(calls: np.ndarray, distance_ft: np.ndarray, choices: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For each start, the first of its candidate calls (furlongs, per start)
+    with a time that lies before the finish: (call distance in feet, time).
+    """
+    rows = np.arange(len(calls))
+    feet = np.full(len(calls), np.nan)
+    times = np.full(len(calls), np.nan)
+    for furlongs in choices:
+        index = np.searchsorted(PACE_CALL_FURLONGS, furlongs)
+        candidate_time = calls[rows, index]
+        candidate_feet = furlongs * float(FEET_PER_FURLONG)
+        usable = np.isnan(times) & ~np.isnan(candidate_time) & (candidate_feet < distance_ft)
+        feet[usable] = candidate_feet[usable]
+        times[usable] = candidate_time[usable]
+    return feet, times
+
+def brohamer_figures(calls: np.ndarray, final_time: np.ndarray, distance_yards: np.ndarray) -> np.ndarray:
+    """
+    Computes the PACE_FIGURE_COLUMNS for every start from the call matrix,
+    the final times and the race distances in yards (negative "about"
+    distances are taken as their absolute value).
+    """
+    n = len(calls)
+    distance_yards = np.abs(distance_yards)
+    distance_ft = distance_yards * 3.0
+    is_sprint = distance_yards <= SPRINT_MAX_YARDS
+    is_route = distance_yards > SPRINT_MAX_YARDS
+    is_short = distance_yards <= SHORT_SPRINT_MAX_YARDS
+
+    first = np.where(is_sprint, 2, 4)
+    second = np.where(is_short, 3, np.where(is_sprint, 4, 6))
+    second_fallback = np.where(is_short, 4, np.where(is_sprint, 3, 5))
+    e1_ft, e1_time = _pick_call(calls, distance_ft, [first])
+    e2_ft, e2_time = _pick_call(calls, distance_ft, [second, second_fallback])
+    # The second call must come after the first.
+    e2_ft[~(e2_ft > e1_ft)] = np.nan
+
+    out = np.full((n, len(PACE_FIGURE_COLUMNS)), np.nan)
+    fps_f1, fps_f2, fps_f3, ep, sp, ap, fx, percent_early = (out[:, j] for j in range(len(PACE_FIGURE_COLUMNS)))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        np.divide(e1_ft, e1_time, out=fps_f1)
+        np.divide(e2_ft - e1_ft, e2_time - e1_time, out=fps_f2)
+        np.divide(distance_ft - e2_ft, final_time - e2_time, out=fps_f3)
+        np.divide(e2_ft, e2_time, out=ep)
+        # Non-increasing times give zero or negative durations: no velocity.
+        out[:, :4][out[:, :4] <= 0] = np.nan
+        np.multiply(ep + fps_f3, 0.5, out=sp)
+        ap[:] = np.where(is_sprint, (fps_f1 + fps_f2 + fps_f3) / 3.0, np.where(is_route, (ep + sp) / 2.0, np.nan))
+        fx[:] = np.where(is_sprint, (fps_f1 + fps_f3) / 2.0, np.nan)
+        np.divide(ep, ep + fps_f3, out=percent_early)
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+def add_pace_figures(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns df with its PACE_FIGURE_COLUMNS added (or replaced). The figures
+    are joined as one block and the result is consolidated once, which also
+    merges the single-column blocks left by the split and position features
+    added before it.
+    """
+    figures = brohamer_figures(
+        pace_call_matrix(df),
+        _column_values(df, "pp_final_time"),
+        _column_values(df, "pp_distance"),
+    )
+    figures_df = pd.DataFrame(figures, index=df.index, columns=PACE_FIGURE_COLUMNS)
+    return pd.concat([df.drop(columns=PACE_FIGURE_COLUMNS, errors="ignore"), figures_df], axis=1).copy()
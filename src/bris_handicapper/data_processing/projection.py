@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Column-projected reads and writes of the processed intermediate files.
+
+Stages read only the columns they declare (see config.data_mappings
+COLUMN_CATALOG) so Parquet skips the column chunks of everything else.
+
+Files are Parquet or, with settings.INTERMEDIATE_FORMAT = "arrow", uncompressed
+Arrow IPC (Feather v2). The format is chosen by file suffix. Arrow files are
+opened memory-mapped: column buffers are read straight from the OS page cache,
+so repeated loads and concurrent worker processes share one copy of the data
+instead of each decompressing and decoding its own.
+
+Every Parquet file is written with the same layout. Rows are ordered by the
+LAYOUT_SORT_COLUMNS a table has (the order is recorded in the row-group
+metadata) and cut into row groups of whole races of about
+settings.PARQUET_ROW_GROUP_ROWS rows. Categorical, text and key columns are
+dictionary-encoded; text and float columns are compressed with zstd, the
+rest with snappy. Column and page statistics are written, plus Bloom filters
+on the LOOKUP_COLUMNS.
+"""
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from config.settings import PARQUET_ROW_GROUP_ROWS
+from bris_handicapper.telemetry import count
+
+ARROW_SUFFIXES = frozenset({".arrow", ".feather"})
+
+# Row order of the processed files: each of these a table has, in turn.
+LAYOUT_SORT_COLUMNS: Tuple[str, ...] = ("track", "race", "post_position", "past_race_num", "workout_num")
+# Columns whose change starts a new race; row groups only break there.
+RACE_COLUMNS: Tuple[str, ...] = ("track", "race")
+# Columns point lookups filter on; they get Bloom filters.
+LOOKUP_COLUMNS: Tuple[str, ...] = ("track", "race", "horse_name")
+BLOOM_FILTER_FPP = 0.05
+
+def is_arrow_file(path: Path) -> bool:
+    return Path(path).suffix.lower() in ARROW_SUFFIXES
+
+def available_columns(path: Path) -> List[str]:
+    """Column names stored in a processed file, read from its footer only."""
+    if is_arrow_file(path):
+        with pa.memory_map(str(path), 'r') as source:
+            return pa.ipc.open_file(source).schema.names
+    return pq.read_schema(path).names
+
+def table_shape(path: Path) -> Tuple[int, int]:
+    """(rows, columns) of a processed file, from its metadata."""
+    if is_arrow_file(path):
+        with pa.memory_map(str(path), 'r') as source:
+            reader = pa.ipc.open_file(source)
+            rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+            return rows, len(reader.schema)
+    metadata = pq.read_metadata(path)
+    return metadata.num_rows, metadata.num_columns
+
+def to_frame(table: pa.Table, split_blocks: bool = False) -> pd.DataFrame:
+    """
+    Converts an Arrow table for the pandas stages. Date columns become
+    datetime64[ns] (as pandas parsed them before the reader typed dates)
+    rather than columns of datetime.date objects.
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_date(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.timestamp("ns")))
+    return table.to_pandas(split_blocks=split_blocks)
+
+def read_table(path: Path, columns: Optional[List[str]] = None) -> pa.Table:
+    """Reads a processed file as an Arrow table; Arrow IPC files are memory-mapped."""
+    if is_arrow_file(path):
+        return feather.read_table(path, columns=columns, memory_map=True)
+    return pq.read_table(path, columns=columns)
+
+def read_columns(
+    path: Path,
+    columns: Optional[Iterable[str]] = None,
+    exclude: Iterable[str] = (),
+) -> pd.DataFrame:
+    """
+    Reads the listed columns of a processed file, in file order. Names the
+    file does not contain are skipped with a warning; columns=None means every
+    column not in exclude.
+    """
+    logger = logging.getLogger(__name__)
+    if not path.exists():
+        raise FileNotFoundError(f"Processed file not found at {path}")
+    stored = available_columns(path)
+    wanted = set(stored) if columns is None else set(columns)
+    wanted.difference_update(exclude)
+    missing = sorted(wanted.difference(stored))
+    if missing:
+        logger.warning(f"{path.name} has no column(s) {missing}; they are not read.")
+    projected = [c for c in stored if c in wanted]
+    logger.info(f"Reading {len(projected)} of {len(stored)} columns from {path.name}")
+    table = read_table(path, projected)
+    count(input_rows=table.num_rows, input_columns=table.num_columns)
+    # split_blocks keeps null-free numeric columns as views of the mapped buffers
+    # rather than consolidating them into a new 2-D block.
+    return to_frame(table, split_blocks=is_arrow_file(path))
+
+def write_frame(df: pd.DataFrame, path: Path) -> Path:
+    """Writes a DataFrame (without its index) in the format given by the path's suffix."""
+    write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+    return path
+
+def _sort_keys(schema: pa.Schema) -> List[Tuple[str, str]]:
+    return [(c, "ascending") for c in LAYOUT_SORT_COLUMNS if c in schema.names]
+
+def sort_for_layout(table: pa.Table) -> pa.Table:
+    """The table in LAYOUT_SORT_COLUMNS order (stable; unchanged if already in order)."""
+    keys = _sort_keys(table.schema)
+    if not keys or table.num_rows < 2:
+        return table
+    # Dictionary columns cannot be sorted directly; sort on their values.
+    key_table = pa.table({
+        name: table[name].cast(table.schema.field(name).type.value_type)
+        if pa.types.is_dictionary(table.schema.field(name).type) else table[name]
+        for name, _ in keys
+    })
+    indices = pc.sort_indices(key_table, sort_keys=keys)
+    if np.array_equal(indices.to_numpy(), np.arange(table.num_rows)):
+        return table
+    return table.take(indices)
+
+def race_row_groups(table: pa.Table, target_rows: int = PARQUET_ROW_GROUP_ROWS) -> List[Tuple[int, int]]:
+    """
+    (offset, length) of each row group: consecutive whole races adding up to
+    at least target_rows (a larger race is one group), or plain target_rows
+    slices if the table has no race columns.
+    """
+    n = table.num_rows
+    if n == 0:
+        return []
+    race_columns = [c for c in RACE_COLUMNS if c in table.column_names]
+    if race_columns:
+        keys = table.select(race_columns).to_pandas()
+        changed = (keys != keys.shift()).to_numpy().any(axis=1)
+        race_starts = np.flatnonzero(changed).tolist()
+    else:
+        race_starts = list(range(0, n, target_rows))
+    groups: List[Tuple[int, int]] = []
+    start = 0
+    for boundary in race_starts[1:] + [n]:
+        if boundary - start >= target_rows or boundary == n:
+            groups.append((start, boundary - start))
+            start = boundary
+    return groups
+
+def parquet_options(schema: pa.Schema, rows: int = PARQUET_ROW_GROUP_ROWS, sorted_rows: bool = False) -> Dict[str, Any]:
+    """
+    The ParquetWriter options of the shared layout for a schema; rows (the
+    most a row group will hold) sizes the Bloom filters.
+    """
+    dictionary: List[str] = []
+    compression: Dict[str, str] = {}
+    for field in schema:
+        if pa.types.is_floating(field.type):
+            compression[field.name] = "zstd"
+        elif pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            dictionary.append(field.name)
+            compression[field.name] = "zstd"
+        else:
+            if pa.types.is_dictionary(field.type) or field.name in LAYOUT_SORT_COLUMNS:
+                dictionary.append(field.name)
+            compression[field.name] = "snappy"
+    options: Dict[str, Any] = {
+        "use_dictionary": dictionary,
+        "compression": compression,
+        "write_statistics": True,
+        "write_page_index": True,
+        "bloom_filter_options": {
+            c: {"ndv": max(rows, 1), "fpp": BLOOM_FILTER_FPP} for c in LOOKUP_COLUMNS if c in schema.names
+        },
+    }
+    keys = _sort_keys(schema)
+    if sorted_rows and keys:
+        options["sorting_columns"] = pq.SortingColumn.from_ordering(schema, keys)
+    return options
+
+def write_table(table: pa.Table, path: Path) -> Path:
+    """Writes an Arrow table, in the shared layout, in the format given by the path's suffix."""
+    table = sort_for_layout(table)
+    if is_arrow_file(path):
+        feather.write_feather(table, path, compression="uncompressed", chunksize=PARQUET_ROW_GROUP_ROWS)
+        return path
+    groups = race_row_groups(table) or [(0, 0)]
+    options = parquet_options(table.schema, max(length for _, length in groups), sorted_rows=True)
+    with pq.ParquetWriter(path, table.schema, **options) as writer:
+        for offset, length in groups:
+            writer.write_table(table.slice(offset, length), row_group_size=max(length, 1))
+    return path
+
+def open_table_writer(path: Path, schema: pa.Schema) -> Union[pq.ParquetWriter, pa.ipc.RecordBatchFileWriter]:
+    """
+    Incremental writer (write_table / close) for the format given by the
+    path's suffix. Parquet files get the shared encodings, but rows are
+    written in the order they are given.
+    """
+    if is_arrow_file(path):
+        return pa.ipc.new_file(str(path), schema)
+    return pq.ParquetWriter(path, schema, **parquet_options(schema))
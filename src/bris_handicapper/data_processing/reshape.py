@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Wide -> long reshaping of the numbered Brisnet column blocks.
+
+A DRF row repeats the same metrics for each of a horse's workouts (12) and
+past starts (10) as blocks of numbered fields. A ReshapePlan resolves a
+metric map (clean metric name -> field number of the first block) against
+the compiled schema once: for each metric, the ordered column labels of its
+blocks, the schema kind of its values and the dtype it is given in the long
+table (DTYPE_FLOAT or DTYPE_DATE; other metrics stay text). Plans are
+validated when they are
+compiled and memoised per schema version, so every card in a run (and every
+run on the same spec files) reuses the same plan.
+
+wide_to_long builds the long table from a plan by stacking the blocks,
+renamed to the metric names, on top of each other. Blocks that are entirely null (a past start or workout no
+horse on the card has) are skipped, and rows whose metrics are all null
+(a horse with fewer starts than there are blocks) are never emitted.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .schema import CompiledSchema
+
+# (block number starting at 1, column label)
+Block = Tuple[int, str]
+
+# Target dtypes of long-format metrics
+DTYPE_FLOAT = "float64"
+DTYPE_DATE = "date"
+
+# Plans already compiled in this process, keyed by schema version and metric layout.
+_plans: Dict[Tuple, "ReshapePlan"] = {}
+
+class ReshapePlan:
+    """The column blocks of a set of repeated metrics, resolved against the schema."""
+
+    def __init__(self, iter_col: str, n_iters: int, blocks: Dict[str, List[Block]], kinds: Dict[str, str],
+                 dtypes: Dict[str, str]):
+        self.iter_col = iter_col
+        self.n_iters = n_iters
+        self.blocks = blocks
+        self.kinds = kinds
+        self.dtypes = dtypes
+
+    @property
+    def metrics(self) -> List[str]:
+        return list(self.blocks)
+
+    @property
+    def columns(self) -> List[str]:
+        """Every wide column the plan reads, metric by metric."""
+        return [label for blocks in self.blocks.values() for _, label in blocks]
+
+    def present_blocks(self, columns: Sequence[str]) -> Dict[str, List[Block]]:
+        """The plan's blocks restricted to the columns a frame actually has."""
+        present = set(columns)
+        restricted: Dict[str, List[Block]] = {}
+        for metric, blocks in self.blocks.items():
+            kept = [block for block in blocks if block[1] in present]
+            if kept:
+                restricted[metric] = kept
+        return restricted
+
+    def __repr__(self) -> str:
+        return f"ReshapePlan({self.iter_col!r}, {len(self.blocks)} metrics x {self.n_iters})"
+
+def compile_reshape_plan(schema: CompiledSchema, metric_map: Dict[str, int], iter_col: str,
+                         n_iters: int, dtypes: Optional[Dict[str, str]] = None) -> ReshapePlan:
+    """
+    Resolves metric_map against the schema. Fields the schema does not know
+    or marks as reserved are left out of the plan, and a metric whose blocks
+    disagree on their kind is dropped with a warning. dtypes gives the target
+    dtype of the non-text metrics; raises ValueError if it names a metric
+    missing from metric_map or an unknown dtype.
+    """
+    logger = logging.getLogger(__name__)
+    dtypes = dict(dtypes or {})
+    unknown = sorted(set(dtypes) - set(metric_map))
+    if unknown:
+        raise ValueError(f"Reshape plan for '{iter_col}': dtypes given for unknown metrics {unknown}")
+    bad = {m: d for m, d in dtypes.items() if d not in (DTYPE_FLOAT, DTYPE_DATE)}
+    if bad:
+        raise ValueError(f"Reshape plan for '{iter_col}': unsupported dtypes {bad}")
+    kind_by_field = {f["field_number"]: f["kind"] for f in schema.fields}
+    blocks: Dict[str, List[Block]] = {}
+    kinds: Dict[str, str] = {}
+    for metric, base in metric_map.items():
+        metric_blocks: List[Block] = []
+        metric_kinds = set()
+        for i in range(n_iters):
+            field_number = base + i
+            label = schema.label(field_number)
+            if label is None:
+                logger.warning(f"Reshape plan for '{iter_col}': field {field_number} of '{metric}' "
+                               f"is not in the schema; block {i + 1} skipped.")
+                continue
+            if kind_by_field.get(field_number) == "reserved":
+                logger.info(f"Reshape plan for '{iter_col}': field {field_number} of '{metric}' "
+                            f"is reserved; block {i + 1} skipped.")
+                continue
+            metric_blocks.append((i + 1, label))
+            metric_kinds.add(kind_by_field[field_number])
+        if not metric_blocks:
+            continue
+        if len(metric_kinds) > 1:
+            logger.warning(f"Reshape plan for '{iter_col}': blocks of '{metric}' have mixed kinds "
+                           f"{sorted(metric_kinds)}; metric skipped.")
+            continue
+        blocks[metric] = metric_blocks
+        kinds[metric] = metric_kinds.pop()
+    return ReshapePlan(iter_col, n_iters, blocks, kinds, {m: d for m, d in dtypes.items() if m in blocks})
+
+def reshape_plan(schema: CompiledSchema, metric_map: Dict[str, int], iter_col: str, n_iters: int,
+                 dtypes: Optional[Dict[str, str]] = None) -> ReshapePlan:
+    """Returns the plan for a metric layout, compiling it once per schema version."""
+    version = tuple(sorted((key, source.get("sha256")) for key, source in schema.sources.items()))
+    key = (version, iter_col, n_iters, tuple(metric_map.items()), tuple(sorted((dtypes or {}).items())))
+    plan = _plans.get(key)
+    if plan is None:
+        plan = compile_reshape_plan(schema, metric_map, iter_col, n_iters, dtypes)
+        _plans[key] = plan
+    return plan
+
+def wide_to_long(wide_df: pd.DataFrame, plan: ReshapePlan, id_vars: List[str],
+                 drop_empty: bool = True) -> pd.DataFrame:
+    """
+    Reshapes the plan's column blocks to long format: id_vars, the block
+    number (plan.iter_col), then the metrics in plan order. Rows come block by
+    block (block 1 for every horse, then block 2, ...). A metric missing from
+    some blocks gets nulls there. Each metric is converted once to its plan
+    dtype (values that do not parse become null). With drop_empty, a horse's block is only emitted when at
+    least one of its metrics has a value.
+    """
+    blocks = plan.present_blocks(wide_df.columns)
+    if not blocks:
+        return pd.DataFrame()
+    iterations = sorted({num for metric_blocks in blocks.values() for num, _ in metric_blocks})
+
+    ids = wide_df[id_vars]
+    frames: List[pd.DataFrame] = []
+    for num in iterations:
+        renames = {label: metric for metric, metric_blocks in blocks.items() for n, label in metric_blocks if n == num}
+        block = wide_df[list(renames)]
+        if drop_empty and not block.notna().to_numpy().any():
+            continue
+        frame = pd.concat([ids, block.rename(columns=renames)], axis=1)
+        frame.insert(len(id_vars), plan.iter_col, num)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=id_vars + [plan.iter_col] + list(blocks))
+    df_long = pd.concat(frames, ignore_index=True, sort=False)
+    df_long = df_long[id_vars + [plan.iter_col] + list(blocks)]
+    if drop_empty:
+        has_data = df_long[list(blocks)].notna().to_numpy().any(axis=1)
+        if not has_data.all():
+            df_long = df_long[has_data].reset_index(drop=True)
+    converted: Dict[str, pd.Series] = {}
+    for metric, dtype in plan.dtypes.items():
+        if metric not in df_long.columns:
+            continue
+        if dtype == DTYPE_DATE:
+            converted[metric] = pd.to_datetime(df_long[metric], format="%Y%m%d", errors="coerce")
+        else:
+            # Nullable floats: a horse may lack any block.
+            converted[metric] = pd.to_numeric(df_long[metric], errors="coerce").astype("float64")
+    return df_long.assign(**converted) if converted else df_long
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled Brisnet schema shared by every pipeline stage.
+
+Combines the column labels from bris_spec.pkl with the field types declared in
+bris_dict.txt into one typed artifact: a pyarrow schema, a field-number ->
+label index and a numeric/date/categorical classification. The compiled result
+is stored as JSON in the cache directory, rebuilt only when either source file
+changes, and memoised in-process so each run loads it at most once.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any, Dict, Final, FrozenSet, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from config.settings import BRIS_DICT, BRIS_SPEC_CACHE, BRIS_SCHEMA_CACHE
+from bris_handicapper.manifest import file_hash
+
+SCHEMA_VERSION: Final[int] = 2
+
+# CHARACTER fields no longer than this are treated as low-cardinality codes
+# (track, surface, race type, sex, ...) and dictionary-encoded.
+CATEGORICAL_MAX_LENGTH: Final[int] = 3
+
+# Arrow types for fields whose declaration in bris_dict.txt does not match the
+# data, by Field #. Field 223 (T/J Combo $2 ROI, 365D) is declared 9999 but
+# carries values such as -1.13, like its meet counterpart (field 1417, 999.99).
+FIELD_TYPE_OVERRIDES: Final[Dict[int, str]] = {223: "float64"}
+
+_FORMAT_TOKEN = re.compile(r"^[X9().]+$")
+_FIELD_DETAIL_PATTERN = re.compile(
+    r"^\s*(\d+)\s+(.*?)\s{2,}(CHARACTER|NUMERIC|DATE)[ \t]*(.*)$", re.MULTILINE
+)
+
+# Compiled schemas already loaded in this process, keyed by source paths.
+_loaded: Dict[Tuple[str, str], "CompiledSchema"] = {}
+
+class CompiledSchema:
+    """Typed view of the Brisnet specification, built once per source version."""
+
+    def __init__(self, fields: List[Dict[str, Any]], sources: Dict[str, Dict[str, Any]]):
+        self.fields = fields
+        self.sources = sources
+        self.labels: List[str] = [f["label"] for f in fields]
+        self.label_by_field: Dict[int, str] = {f["field_number"]: f["label"] for f in fields}
+        self.field_types: Dict[int, str] = {f["field_number"]: f["type"] for f in fields if f["type"]}
+        self.numeric_cols: FrozenSet[str] = frozenset(f["label"] for f in fields if f["kind"] == "numeric")
+        self.date_cols: FrozenSet[str] = frozenset(f["label"] for f in fields if f["kind"] == "date")
+        self.categorical_cols: FrozenSet[str] = frozenset(f["label"] for f in fields if f["kind"] == "categorical")
+        self.arrow_schema: pa.Schema = pa.schema(
+            [pa.field(f["label"], _arrow_type(f)) for f in fields if f["kind"] != "reserved"]
+        )
+        self._spec_df: Optional[pd.DataFrame] = None
+
+    @property
+    def spec_df(self) -> pd.DataFrame:
+        """The spec as a DataFrame indexed by field number with 'field_number' and 'label' columns."""
+        if self._spec_df is None:
+            spec_df = pd.DataFrame({
+                "field_number": [f["field_number"] for f in self.fields],
+                "label": self.labels,
+            })
+            self._spec_df = spec_df.set_index("field_number", drop=False)
+        return self._spec_df
+
+    def label(self, field_number: int) -> Optional[str]:
+        return self.label_by_field.get(field_number)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"version": SCHEMA_VERSION, "sources": self.sources, "fields": self.fields}
+
+def _arrow_type(field: Dict[str, Any]) -> pa.DataType:
+    if field.get("arrow_type"):
+        return pa.type_for_alias(field["arrow_type"])
+    kind = field["kind"]
+    if kind == "numeric":
+        # Decimal fields declare a format with a point; a field with a declared
+        # width but no format (a code such as Equipment Change) is an integer.
+        # Without either, float64 holds whatever the field carries.
+        fmt = field.get("format")
+        if fmt:
+            return pa.float64() if "." in fmt else pa.int64()
+        return pa.int64() if field.get("max_length") else pa.float64()
+    if kind == "date":
+        return pa.date32()
+    if kind == "categorical":
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.string()
+
+def parse_bris_dict_details(dict_path: Path) -> Dict[int, Dict[str, Any]]:
+    """Parses the declared FORMAT and MAX LENGTH of each Field # in bris_dict.txt."""
+    details: Dict[int, Dict[str, Any]] = {}
+    with open(dict_path, 'r', encoding='iso-8859-1') as f:
+        content = f.read()
+    for match in _FIELD_DETAIL_PATTERN.finditer(content):
+        tokens = match.group(4).split()
+        fmt: Optional[str] = None
+        if tokens and _FORMAT_TOKEN.match(tokens[0]):
+            fmt = tokens.pop(0)
+        max_length = int(tokens[0]) if tokens and tokens[0].isdigit() else None
+        details[int(match.group(1))] = {"format": fmt, "max_length": max_length}
+    return details
+
+def _source_stamp(path: Path) -> Dict[str, Any]:
+    stat = path.stat()
+    return {"path": str(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash(path)}
+
+def _sources_match(recorded: Dict[str, Dict[str, Any]], dict_path: Path, spec_path: Path) -> bool:
+    """
+    Cheap mtime/size check first; fall back to content hashes when those differ.
+    A source that was missing when the schema was compiled (bris_dict.txt is
+    optional) is not recorded, and matches for as long as it is still missing.
+    """
+    for key, path in (("dict", dict_path), ("spec", spec_path)):
+        entry = recorded.get(key)
+        if entry is None or not path.exists():
+            if entry is None and not path.exists():
+                continue
+            return False
+        stat = path.stat()
+        if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            continue
+        if entry.get("sha256") != file_hash(path):
+            return False
+    return True
+
+def compile_schema(dict_path: Path = BRIS_DICT, spec_path: Path = BRIS_SPEC_CACHE) -> Optional[CompiledSchema]:
+    """Builds the compiled schema from bris_spec.pkl labels and bris_dict.txt types."""
+    # Imported here: bris_spec_new owns the original loaders and imports this module.
+    from bris_handicapper.data_processing.bris_spec_new import load_specification_cache, parse_bris_dict_types
+
+    logger = logging.getLogger(__name__)
+    spec_df = load_specification_cache(spec_path)
+    if spec_df is None:
+        return None
+    field_types = parse_bris_dict_types(dict_path)
+    details = parse_bris_dict_details(dict_path) if dict_path.exists() else {}
+
+    fields: List[Dict[str, Any]] = []
+    for field_number, label in zip(spec_df.index.tolist(), spec_df['label'].tolist()):
+        field_number = int(field_number)
+        field_type = field_types.get(field_number)
+        detail = details.get(field_number, {})
+        if label.startswith("reserved"):
+            kind = "reserved"
+        elif field_type == 'NUMERIC':
+            kind = "numeric"
+        elif field_type == 'DATE_STR':
+            kind = "date"
+        elif field_type == 'CHARACTER' and (detail.get("max_length") or CATEGORICAL_MAX_LENGTH + 1) <= CATEGORICAL_MAX_LENGTH:
+            kind = "categorical"
+        else:
+            kind = "string"
+        fields.append({
+            "field_number": field_number,
+            "label": label,
+            "type": field_type,
+            "format": detail.get("format"),
+            "max_length": detail.get("max_length"),
+            "kind": kind,
+            "arrow_type": FIELD_TYPE_OVERRIDES.get(field_number),
+        })
+    sources = {"spec": _source_stamp(spec_path)}
+    if dict_path.exists():
+        sources["dict"] = _source_stamp(dict_path)
+    schema = CompiledSchema(fields, sources)
+    logger.info(f"Compiled schema: {len(fields)} fields, {len(schema.numeric_cols)} numeric, "
+                f"{len(schema.date_cols)} date, {len(schema.categorical_cols)} categorical.")
+    return schema
+
+def load_compiled_schema(
+    dict_path: Path = BRIS_DICT,
+    spec_path: Path = BRIS_SPEC_CACHE,
+    cache_path: Path = BRIS_SCHEMA_CACHE,
+) -> Optional[CompiledSchema]:
+    """
+    Returns the compiled schema, reusing (in order) the in-process copy, the
+    cached JSON artifact, or a fresh build from the source files.
+    """
+    logger = logging.getLogger(__name__)
+    memo_key = (str(dict_path), str(spec_path))
+    schema = _loaded.get(memo_key)
+    if schema is not None and _sources_match(schema.sources, dict_path, spec_path):
+        return schema
+
+    schema = None
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'r') as f:
+                cached = json.load(f)
+            if cached.get("version") == SCHEMA_VERSION and _sources_match(cached.get("sources", {}), dict_path, spec_path):
+                schema = CompiledSchema(cached["fields"], cached["sources"])
+                logger.info(f"Loaded compiled schema from: {cache_path}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable compiled schema cache {cache_path}: {e}")
+
+    if schema is None:
+        schema = compile_schema(dict_path, spec_path)
+        if schema is None:
+            return None
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_path, 'w') as f:
+                json.dump(schema.to_json(), f)
+            logger.info(f"Saved compiled schema to: {cache_path}")
+        except OSError as e:
+            logger.warning(f"Could not save compiled schema cache {cache_path}: {e}")
+
+    _loaded[memo_key] = schema
+    return schema
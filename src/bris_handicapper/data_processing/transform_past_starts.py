@@ -3,12 +3,22 @@ from __future__ import annotations
 
 import logging
 import sys
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from config.settings import PARSED_RACE_DATA, PAST_STARTS_LONG
 
 from .long_format_transformer import transform_past_starts
 
 
-def main() -> None:
-    transform_past_starts()
+def main(
+    input_path: Path = PARSED_RACE_DATA,
+    output_path: Path = PAST_STARTS_LONG,
+    wide_df: Optional[pd.DataFrame] = None,
+) -> Optional[Path]:
+    return transform_past_starts(input_path, output_path, wide_df)
 
 
 if __name__ == "__main__":
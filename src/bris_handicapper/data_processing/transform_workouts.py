@@ -3,12 +3,22 @@ from __future__ import annotations
 
 import logging
 import sys
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from config.settings import PARSED_RACE_DATA, WORKOUTS_LONG
 
 from .long_format_transformer import transform_workouts
 
 
-def main() -> None:
-    transform_workouts()
+def main(
+    input_path: Path = PARSED_RACE_DATA,
+    output_path: Path = WORKOUTS_LONG,
+    wide_df: Optional[pd.DataFrame] = None,
+) -> Optional[Path]:
+    return transform_workouts(input_path, output_path, wide_df)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Per-horse windowed features over the past starts.
+
+A WindowFeature declares one history feature as a metric, a window (the
+horse's last N starts) and a reducer:
+
+    mean        mean of the non-null values in the window
+    top_k_mean  mean of the k largest non-null values in the window
+    last        the value of the most recent start (null if it has none)
+    max         largest non-null value in the window
+
+add_window_features computes every declared feature in a single pass: the
+starts are ordered once by horse and date, each metric is laid out as a
+(horse x window) matrix of its most recent values, and the reducers run on
+those matrices with NumPy. A new recency feature is one more declaration,
+not another groupby over the past starts.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+REDUCER_MEAN = "mean"
+REDUCER_TOP_K_MEAN = "top_k_mean"
+REDUCER_LAST = "last"
+REDUCER_MAX = "max"
+
+class WindowFeature:
+    """One feature: reducer applied to metric over each horse's last `window` starts."""
+
+    def __init__(self, name: str, metric: str, window: int, reducer: str, k: int = 2, min_count: int = 1):
+        if reducer not in _REDUCERS:
+            raise ValueError(f"Unknown reducer {reducer!r} for feature '{name}'; expected one of {sorted(_REDUCERS)}")
+        if window < 1:
+            raise ValueError(f"Window of feature '{name}' must be at least 1, got {window}")
+        self.name = name
+        self.metric = metric
+        self.window = window
+        self.reducer = reducer
+        # top_k_mean only
+        self.k = k
+        # Fewest non-null values in the window for a non-null result
+        self.min_count = min_count
+
+    def __repr__(self) -> str:
+        return f"WindowFeature({self.name!r}: {self.reducer} of {self.metric} over last {self.window})"
+
+def top_k_mean(values: np.ndarray, k: int, min_count: int = 1) -> np.ndarray:
+    """
+    Row-wise mean of the k largest non-null values of a 2-D array; null for
+    rows with fewer than min_count non-null values.
+    """
+    present = ~np.isnan(values)
+    count = present.sum(axis=1)
+    # Descending, with nulls (as -inf) last
+    ranked = -np.sort(-np.where(present, values, -np.inf), axis=1)[:, :k]
+    taken = np.minimum(count, k)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = np.where(np.isfinite(ranked), ranked, 0.0).sum(axis=1) / taken
+    result[count < max(min_count, 1)] = np.nan
+    return result
+
+def _mean(window: np.ndarray, feature: WindowFeature) -> np.ndarray:
+    present = ~np.isnan(window)
+    count = present.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = np.where(present, window, 0.0).sum(axis=1) / count
+    result[count < max(feature.min_count, 1)] = np.nan
+    return result
+
+def _top_k_mean(window: np.ndarray, feature: WindowFeature) -> np.ndarray:
+    return top_k_mean(window, feature.k, feature.min_count)
+
+def _last(window: np.ndarray, feature: WindowFeature) -> np.ndarray:
+    return window[:, 0].copy()
+
+def _max(window: np.ndarray, feature: WindowFeature) -> np.ndarray:
+    present = ~np.isnan(window)
+    result = np.where(present, window, -np.inf).max(axis=1)
+    result[present.sum(axis=1) < max(feature.min_count, 1)] = np.nan
+    return result
+
+# Reducers take the (horse x window) matrix, most recent start first, and return one value per horse.
+_REDUCERS: Dict[str, Callable[[np.ndarray, WindowFeature], np.ndarray]] = {
+    REDUCER_MEAN: _mean,
+    REDUCER_TOP_K_MEAN: _top_k_mean,
+    REDUCER_LAST: _last,
+    REDUCER_MAX: _max,
+}
+
+def add_window_features(df: pd.DataFrame, group_cols: List[str], order_col: str,
+                        features: Sequence[WindowFeature]) -> pd.DataFrame:
+    """
+    Returns df with one float column per feature, computed per group_cols
+    (one horse) over its rows ordered by order_col (rows without a value sort
+    as the oldest; of two rows with the same value, the earlier one is the
+    more recent). Row order is unchanged. A last-value feature of an
+    integer metric keeps the integer dtype when no horse lacks a value.
+    """
+    logger = logging.getLogger(__name__)
+    if df.empty:
+        return df.assign(**{f.name: pd.Series(dtype="float64", index=df.index) for f in features})
+    group_ids = df.groupby(group_cols, sort=False, dropna=False).ngroup().to_numpy()
+    n_groups = int(group_ids.max()) + 1
+    order_key = df[order_col]
+    if pd.api.types.is_datetime64_any_dtype(order_key):
+        order_key = order_key.to_numpy(dtype="datetime64[ns]").view("int64")
+    else:
+        order_key = pd.to_numeric(order_key, errors="coerce").to_numpy(dtype="float64", na_value=-np.inf)
+    # Ties on order_col: the earlier row counts as the more recent start, as in the DRF blocks.
+    order = np.lexsort((-np.arange(len(df)), order_key, group_ids))
+    sorted_groups = group_ids[order]
+    ends = np.cumsum(np.bincount(group_ids, minlength=n_groups))
+    # 0 for a horse's most recent start, 1 for the one before, ...
+    recency = ends[sorted_groups] - 1 - np.arange(len(order))
+
+    windows: Dict[str, np.ndarray] = {}
+    for metric in dict.fromkeys(f.metric for f in features):
+        width = max(f.window for f in features if f.metric == metric)
+        if metric in df.columns:
+            values = pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)[order]
+        else:
+            logger.warning(f"Metric '{metric}' missing; its window features will be null.")
+            values = np.full(len(order), np.nan)
+        window = np.full((n_groups, width), np.nan)
+        in_window = recency < width
+        window[sorted_groups[in_window], recency[in_window]] = values[in_window]
+        windows[metric] = window
+
+    new_columns: Dict[str, pd.Series] = {}
+    for feature in features:
+        per_group = _REDUCERS[feature.reducer](windows[feature.metric][:, :feature.window], feature)
+        column = pd.Series(per_group[group_ids], index=df.index)
+        source = df[feature.metric].dtype if feature.metric in df.columns else None
+        if feature.reducer == REDUCER_LAST and source is not None and source.kind in "iu" and column.notna().all():
+            column = column.astype(source)
+        new_columns[feature.name] = column
+    return df.assign(**new_columns)
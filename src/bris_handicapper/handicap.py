@@ -5,20 +5,27 @@ Main analysis orchestrator for the BrisHandicapper project.
 This script loads the processed race and past performance data, then executes
 the sequential steps of the "Adapted Handicapping Process" for each race.
 """
+import argparse
 import logging
 import sys
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 import pandas as pd
 
 # --- Module Imports ---
 try:
     from config import settings, paths
-    from bris_handicapper.analysis.contender_filter import isolate_contenders
+    from config.data_mappings import COLUMN_CATALOG
+    from bris_handicapper.data_processing.projection import read_columns
+    from bris_handicapper.analysis.card_index import CardIndex
+    from bris_handicapper.analysis.horse_features import build_horse_features
+    from bris_handicapper.analysis.contender_filter import flag_contenders, isolate_contenders
     from bris_handicapper.analysis.grouper import group_contenders
     from bris_handicapper.analysis.situational_analyzer import adjust_groups_for_situation
     from bris_handicapper.reporting.reporter import generate_llm_report_data, save_report
+    from bris_handicapper.telemetry import annotate, measure, start_run
 except ImportError as e:
     print(f"FATAL: Could not import necessary modules. Error: {e}")
     print("\nPlease ensure you have:")
@@ -35,6 +42,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def load_handicap_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Reads the current race info and past starts columns used by the handicapping steps."""
+    with measure("load_processed_data"):
+        current_races_df = read_columns(settings.CURRENT_RACE_INFO_FILE, COLUMN_CATALOG["handicap_current_race"])
+        past_starts_df = read_columns(settings.PAST_STARTS_LONG_FILE, COLUMN_CATALOG["handicap_past_starts"])
+    return current_races_df, past_starts_df
+
 def handicap_races():
     """
     Main function to run the handicapping process on all races for the day.
@@ -42,45 +56,111 @@ def handicap_races():
     logger.info("Loading processed data for handicapping...")
 
     try:
-        current_races_df = pd.read_parquet(settings.CURRENT_RACE_INFO_FILE)
-        past_starts_df = pd.read_parquet(settings.PAST_STARTS_LONG_FILE)
+        current_races_df, past_starts_df = load_handicap_data()
         logger.info("Successfully loaded current race info and past starts data.")
     except FileNotFoundError as e:
         logger.error(f"FATAL: Could not load processed data file. Please run the data pipeline first. Error: {e}")
         return
 
-    races_to_handicap = current_races_df[['track', 'race']].drop_duplicates().to_dict('records')
+    handicap_card(current_races_df, past_starts_df)
 
-    for race_info in races_to_handicap:
-        track_code = race_info['track']
-        race_num = race_info['race']
+def handicap_race(single_race_df: pd.DataFrame, past_starts_df: pd.DataFrame,
+                  reports_dir: Path = paths.REPORTS_DIR,
+                  late_changes: Optional[List[str]] = None,
+                  features: Optional[pd.DataFrame] = None) -> Optional[Dict[str, Any]]:
+    """
+    Runs steps 2-6 of the handicapping process for one race and saves its
+    report. past_starts_df holds the past starts of the race's horses (a
+    CardIndex.race lookup); the whole card's also works, but every step then
+    scans it. features is the race's horse feature table (see
+    analysis.horse_features), shared by every step; it is built from the
+    race's rows when not given. late_changes (descriptions of scratches,
+    surface changes, ...) are recorded in the report. Returns the report, or
+    None if the race has no contenders.
+    """
+    track_code = single_race_df['track'].iloc[0]
+    race_num = single_race_df['race'].iloc[0]
+    race_labels = {"track": str(track_code).strip(), "race": race_num}
+    if features is None:
+        with measure("horse_features", **race_labels):
+            features = build_horse_features(single_race_df, past_starts_df)
+
+    # --- Execute the 6-Step Handicapping Process ---
+    # Step 2: Isolate Contenders
+    with measure("isolate_contenders", **race_labels):
+        contenders = isolate_contenders(single_race_df, past_starts_df, features)
+        annotate(input_rows=len(single_race_df), output_rows=len(contenders))
+    if contenders.empty:
+        logger.warning(f"No contenders identified for Race {race_num}, skipping.")
+        return None
+
+    # Step 3: Group Contenders
+    with measure("group_contenders", **race_labels):
+        initial_groups = group_contenders(contenders, past_starts_df, features)
+        annotate(input_rows=len(contenders))
+
+    # Steps 4 & 5: Adjust Groups
+    with measure("adjust_groups_for_situation", **race_labels):
+        final_groups, adjustments = adjust_groups_for_situation(initial_groups, contenders, past_starts_df, features)
+
+    # Step 6: Generate and Save Report
+    with measure("report", **race_labels):
+        report_data = generate_llm_report_data(final_groups, contenders, past_starts_df, adjustments, features)
+        if late_changes:
+            report_data["late_changes"] = list(late_changes)
+        save_report(report_data, reports_dir)
+    return report_data
+
+def handicap_card(current_races_df: pd.DataFrame, past_starts_df: pd.DataFrame,
+                  reports_dir: Path = paths.REPORTS_DIR) -> None:
+    """
+    Runs the handicapping steps for every race in the current race info and
+    saves one report per race to reports_dir. Both tables are indexed by race
+    once, so each race only touches its own rows. The horse features and the
+    contender rules of the whole card are evaluated in one pass before the loop.
+    """
+    races = CardIndex(current_races_df)
+    past_starts = CardIndex(past_starts_df)
+    with measure("horse_features"):
+        features_df = build_horse_features(current_races_df, past_starts_df)
+        annotate(input_rows=len(past_starts_df), output_rows=len(features_df))
+    with measure("flag_contenders"):
+        features = CardIndex(flag_contenders(current_races_df, features_df))
+        annotate(input_rows=len(current_races_df))
+
+    for track_key, race_num in races.keys():
+        single_race_df = races.race(track_key, race_num)
+        track_code = single_race_df['track'].iloc[0]
 
         logger.info(f"\n{'='*60}\nProcessing: {track_code} - Race {race_num}\n{'='*60}")
 
-        single_race_df = current_races_df[
-            (current_races_df['track'] == track_code) &
-            (current_races_df['race'] == race_num)
-        ]
-
-        # --- Execute the 6-Step Handicapping Process ---
-        # Step 2: Isolate Contenders
-        contenders = isolate_contenders(single_race_df, past_starts_df)
-        if contenders.empty:
-            logger.warning(f"No contenders identified for Race {race_num}, skipping.")
-            continue
-
-        # Step 3: Group Contenders
-        initial_groups = group_contenders(contenders, past_starts_df)
-
-        # Steps 4 & 5: Adjust Groups
-        final_groups, adjustments = adjust_groups_for_situation(initial_groups, contenders, past_starts_df)
-
-        # Step 6: Generate and Save Report
-        report_data = generate_llm_report_data(final_groups, contenders, past_starts_df, adjustments)
-        save_report(report_data, paths.REPORTS_DIR)
-
-        logger.info(f"Finished processing {track_code} - Race {race_num}. Report saved.")
+        if handicap_race(single_race_df, past_starts.race(track_key, race_num), reports_dir,
+                         features=features.race(track_key, race_num)) is not None:
+            logger.info(f"Finished processing {track_code} - Race {race_num}. Report saved.")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses command-line options for the handicapping run."""
+    parser = argparse.ArgumentParser(description="Handicap every race in the processed data.")
+    parser.add_argument(
+        "--metrics", action="store_true",
+        help="Print a per-step performance summary (wall/CPU time, peak memory, rows, I/O) at the end.",
+    )
+    return parser.parse_args(argv)
+
+def run(argv: Optional[List[str]] = None):
+    """Runs handicap_races, recording per-step metrics (see bris_handicapper.telemetry)."""
+    args = parse_args(argv)
+    collector = None
+    if settings.TELEMETRY_ENABLED or args.metrics:
+        metrics_path = settings.METRICS_DIR / f"handicap_{datetime.now():%Y%m%d_%H%M%S}.metrics.jsonl"
+        collector = start_run(metrics_path if settings.TELEMETRY_ENABLED else None)
+    try:
+        with measure("handicap_races"):
+            handicap_races()
+    finally:
+        if args.metrics and collector is not None:
+            logger.info(f"Step metrics:\n{collector.summary()}")
 
 if __name__ == "__main__":
     logger.info("Executing handicap.py as a standalone script.")
-    handicap_races()
+    run()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+"""
+Late changes for the BrisHandicapper project.
+
+A change set is a small JSON or CSV file listing the day's late changes:
+
+    scratch    a horse is withdrawn (track, race, horse)
+    surface    a race changes surface, e.g. comes off the turf (track, race, value)
+    condition  the track condition is updated (track, optional race, value)
+    jockey     a rider change (track, race, horse, value)
+
+horse is a program number or a horse name. JSON files hold a list of
+objects with these keys (or {"changes": [...]}); CSV files have them as
+columns. When race is omitted from a condition change, the change applies
+to every race at the track. A wet condition (SY, MY, SL, ...; see
+analysis.horse_features.WET_TRACK_CONDITIONS) makes the wet-track pedigree
+checks of the contender filter and situational analysis apply to the race.
+
+A LateChangeSession keeps the current race table and past starts in
+memory. It patches the table for each change and re-runs the handicapping
+steps only for the races the changes touch, so an update takes a fraction
+of a second per race instead of a full card reprocess. Each re-handicapped
+report lists the changes applied to its race.
+
+Usage: bris_handicapper_late_changes changes.json [more.csv ...]
+"""
+import argparse
+import csv
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from config import settings, paths
+from bris_handicapper.analysis.card_index import CardIndex, RaceKey
+from bris_handicapper.analysis.horse_features import CONDITION_COLUMN
+from bris_handicapper.handicap import handicap_race, load_handicap_data
+from bris_handicapper.reporting.reporter import report_path
+from bris_handicapper.telemetry import annotate, measure, start_run
+
+logger = logging.getLogger(__name__)
+
+CHANGE_SCRATCH = "scratch"
+CHANGE_SURFACE = "surface"
+CHANGE_CONDITION = "condition"
+CHANGE_JOCKEY = "jockey"
+CHANGE_KINDS = (CHANGE_SCRATCH, CHANGE_SURFACE, CHANGE_CONDITION, CHANGE_JOCKEY)
+
+SURFACE_COLUMN = "surface"
+JOCKEY_COLUMN = "today_s_jockey"
+# Statistics of the previous rider (and trainer/rider pairing); cleared on a jockey change.
+JOCKEY_STAT_PREFIXES = ("jockey_", "tj_combo_", "t_j_combo_")
+
+def _track_keys(tracks: pd.Series) -> pd.Series:
+    return tracks.astype(str).str.strip().str.upper()
+
+class LateChange:
+    """One entry of a change set."""
+
+    def __init__(self, kind: str, track: str, race: Optional[int] = None,
+                 horse: Optional[str] = None, value: Optional[str] = None):
+        self.kind = kind
+        self.track = track
+        self.race = race
+        self.horse = horse
+        self.value = value
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "LateChange":
+        """Builds a change from a JSON object or CSV row; raises ValueError if it is incomplete."""
+        def text(key: str) -> Optional[str]:
+            value = record.get(key)
+            value = None if value is None else str(value).strip()
+            return value or None
+
+        kind = (text("type") or text("kind") or "").lower()
+        if kind not in CHANGE_KINDS:
+            raise ValueError(f"Unknown change type {kind!r} in {record}; expected one of {CHANGE_KINDS}")
+        track = text("track")
+        race = text("race")
+        change = cls(kind, (track or "").upper(), int(float(race)) if race else None, text("horse"), text("value"))
+        missing = [name for name, needed in (
+            ("track", True),
+            ("race", kind != CHANGE_CONDITION),
+            ("horse", kind in (CHANGE_SCRATCH, CHANGE_JOCKEY)),
+            ("value", kind != CHANGE_SCRATCH),
+        ) if needed and getattr(change, name) is None]
+        if missing:
+            raise ValueError(f"{kind} change is missing {missing}: {record}")
+        return change
+
+    def describe(self) -> str:
+        where = f"{self.track} race {self.race}" if self.race is not None else f"{self.track} (all races)"
+        if self.kind == CHANGE_SCRATCH:
+            return f"{where}: {self.horse} scratched"
+        if self.kind == CHANGE_JOCKEY:
+            return f"{where}: {self.horse} now ridden by {self.value}"
+        return f"{where}: {self.kind} changed to {self.value}"
+
+    def __repr__(self) -> str:
+        return f"LateChange({self.describe()!r})"
+
+def load_change_set(path: Path) -> List[LateChange]:
+    """Reads a JSON or CSV change set."""
+    if path.suffix.lower() == ".csv":
+        with open(path, newline='') as f:
+            records: List[Dict[str, Any]] = list(csv.DictReader(f))
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        records = data.get("changes", []) if isinstance(data, dict) else data
+    changes = [LateChange.from_record(record) for record in records]
+    logger.info(f"Loaded {len(changes)} late change(s) from {path.name}")
+    return changes
+
+class LateChangeSession:
+    """
+    The day's handicapping inputs held in memory, updated change by change.
+    """
+
+    def __init__(self, current_races_df: pd.DataFrame, past_starts_df: pd.DataFrame,
+                 reports_dir: Path = paths.REPORTS_DIR):
+        self.current_races_df = current_races_df
+        self.past_starts_df = past_starts_df
+        # Late changes never touch the past starts, so they are indexed once.
+        self.past_starts = CardIndex(past_starts_df)
+        self.reports_dir = reports_dir
+        # Every change applied so far, by race, for the reports
+        self.applied: Dict[RaceKey, List[str]] = {}
+        # Track codes as written in the data (and in report paths), by key
+        self.track_codes: Dict[str, str] = {key: str(track) for key, track in
+                                            zip(_track_keys(current_races_df['track']), current_races_df['track'])}
+
+    @classmethod
+    def from_processed_files(cls, reports_dir: Path = paths.REPORTS_DIR) -> "LateChangeSession":
+        current_races_df, past_starts_df = load_handicap_data()
+        return cls(current_races_df, past_starts_df, reports_dir)
+
+    def _race_keys(self, mask: pd.Series) -> List[RaceKey]:
+        rows = self.current_races_df.loc[mask, ['track', 'race']].drop_duplicates()
+        return [(str(t).strip().upper(), int(r)) for t, r in rows.itertuples(index=False)]
+
+    def _race_mask(self, change: LateChange) -> pd.Series:
+        df = self.current_races_df
+        mask = _track_keys(df['track']) == change.track
+        if change.race is not None:
+            mask &= df['race'] == change.race
+        return mask
+
+    def _horse_mask(self, change: LateChange, race_mask: pd.Series) -> pd.Series:
+        df = self.current_races_df
+        wanted = change.horse.upper()
+        for column in ("program_number_if_available", "horse_name"):
+            if column in df.columns:
+                mask = race_mask & (df[column].astype(str).str.strip().str.upper() == wanted)
+                if mask.any():
+                    return mask
+        return race_mask & False
+
+    def apply(self, changes: Sequence[LateChange]) -> Dict[RaceKey, List[str]]:
+        """
+        Patches the current race table. Returns the descriptions of the
+        changes applied, keyed by the races they affect. Changes that match
+        no race or horse are logged and skipped.
+        """
+        affected: Dict[RaceKey, List[str]] = {}
+        for change in changes:
+            mask = self._race_mask(change)
+            if change.kind in (CHANGE_SCRATCH, CHANGE_JOCKEY):
+                mask = self._horse_mask(change, mask)
+            if not mask.any():
+                logger.warning(f"Late change matches nothing in the current races, skipped: {change.describe()}")
+                continue
+            races = self._race_keys(mask)
+            df = self.current_races_df
+            if change.kind == CHANGE_SCRATCH:
+                self.current_races_df = df.loc[~mask].copy()
+            elif change.kind == CHANGE_SURFACE:
+                df.loc[mask, SURFACE_COLUMN] = change.value
+            elif change.kind == CHANGE_CONDITION:
+                if CONDITION_COLUMN not in df.columns:
+                    df[CONDITION_COLUMN] = pd.Series(pd.NA, index=df.index, dtype="string")
+                df.loc[mask, CONDITION_COLUMN] = change.value
+            elif change.kind == CHANGE_JOCKEY:
+                if JOCKEY_COLUMN not in df.columns:
+                    df[JOCKEY_COLUMN] = pd.Series(pd.NA, index=df.index, dtype="string")
+                df.loc[mask, JOCKEY_COLUMN] = change.value
+                stats = [c for c in df.columns if c.startswith(JOCKEY_STAT_PREFIXES)]
+                df.loc[mask, stats] = None
+            logger.info(f"Applied late change: {change.describe()}")
+            for race in races:
+                affected.setdefault(race, []).append(change.describe())
+                self.applied.setdefault(race, []).append(change.describe())
+        return affected
+
+    def rehandicap(self, races: Sequence[RaceKey]) -> Dict[RaceKey, Optional[Dict[str, Any]]]:
+        """
+        Re-runs the handicapping steps for the given races and replaces their
+        reports. Each race's horse features are rebuilt from its changed rows.
+        """
+        reports: Dict[RaceKey, Optional[Dict[str, Any]]] = {}
+        df = self.current_races_df
+        track_keys = _track_keys(df['track'])
+        for track, race in races:
+            with measure("rehandicap_race", track=track, race=race):
+                single_race_df = df[(track_keys == track) & (df['race'] == race)]
+                annotate(input_rows=len(single_race_df))
+                report = None
+                if not single_race_df.empty:
+                    try:
+                        report = handicap_race(single_race_df, self.past_starts.race(track, race), self.reports_dir,
+                                               late_changes=self.applied.get((track, race)))
+                    except Exception as e:
+                        # One race failing must not stop the others from being updated.
+                        logger.error(f"Re-handicapping {track} race {race} failed: {e}", exc_info=True)
+                        annotate(status="failed")
+                        reports[(track, race)] = None
+                        continue
+                stale = report_path(self.reports_dir, self.track_codes.get(track, track), race)
+                if report is None and stale.exists():
+                    stale.unlink()
+                    logger.info(f"Removed report {stale}: no contenders left after late changes.")
+            reports[(track, race)] = report
+        return reports
+
+    def process(self, changes: Sequence[LateChange]) -> Dict[RaceKey, Optional[Dict[str, Any]]]:
+        """Applies a change set and re-handicaps the affected races."""
+        with measure("late_changes"):
+            affected = self.apply(changes)
+            annotate(input_rows=len(changes), output_rows=len(affected))
+            logger.info(f"{len(affected)} race(s) affected: {sorted(affected)}")
+            return self.rehandicap(sorted(affected))
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Apply late changes and re-handicap the affected races.")
+    parser.add_argument("change_sets", nargs="+", type=Path, help="JSON or CSV change set files, applied in order.")
+    return parser.parse_args(argv)
+
+def run(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if settings.TELEMETRY_ENABLED:
+        start_run(settings.METRICS_DIR / f"late_changes_{datetime.now():%Y%m%d_%H%M%S}.metrics.jsonl")
+    session = LateChangeSession.from_processed_files()
+    for path in args.change_sets:
+        reports = session.process(load_change_set(path))
+        logger.info(f"{path.name}: re-handicapped {len(reports)} race(s).")
+
+if __name__ == "__main__":
+    run()
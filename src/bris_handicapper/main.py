@@ -7,17 +7,20 @@ processing sequence to parse, clean, and transform the data into usable formats.
 """
 import sys
 import logging
+import argparse
 from pathlib import Path
 from datetime import datetime
+from typing import List, Optional
 
 # --- Module Imports ---
 # When installed as a package, these imports work correctly
 try:
     from config.config import settings
-    from bris_handicapper.data_processing.bris_spec_new import main as parse_bris_data
-    from bris_handicapper.data_processing.current_race_info import main as create_current_info
-    from bris_handicapper.data_processing.transform_workouts import main as transform_workouts_data
-    from bris_handicapper.data_processing.transform_past_starts import main as transform_past_starts_data
+    from bris_handicapper.batch import run_batch
+    from bris_handicapper.data_processing.drf_source import expand_drf_paths, find_drf_bundle_files
+    from bris_handicapper.manifest import IngestManifest
+    from bris_handicapper.pipeline import run_card_stages, standard_output_paths
+    from bris_handicapper.telemetry import measure, start_run
 except ImportError as e:
     print(f"FATAL: Could not import necessary modules. Error: {e}")
     print("\nPlease ensure you have:")
@@ -44,15 +47,16 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def find_latest_drf_file() -> Path:
-    """Finds the most recent DRF file in the raw data directory.""" 
-    logger.info(f"Searching for DRF files in: {settings.RAW_DATA_DIR} using pattern: '{settings.DRF_PATTERN}'")
+    """Finds the most recent DRF file (or .zip/.gz DRF bundle) in the raw data directory."""
+    logger.info(f"Searching for DRF files in: {settings.RAW_DATA_DIR} using pattern: '{settings.DRF_PATTERN}' "
+                f"and bundles {settings.DRF_BUNDLE_PATTERNS}")
 
     if not settings.RAW_DATA_DIR.exists():
         msg = f"Raw data directory does not exist: {settings.RAW_DATA_DIR}"
         logger.error(msg)
         raise FileNotFoundError(msg)
 
-    drf_files = list(settings.RAW_DATA_DIR.glob(settings.DRF_PATTERN))
+    drf_files = find_drf_bundle_files(settings.RAW_DATA_DIR, settings.DRF_PATTERN)
 
     if not drf_files:
         msg = f"No DRF files found matching pattern '{settings.DRF_PATTERN}' in {settings.RAW_DATA_DIR}"
@@ -64,40 +68,112 @@ def find_latest_drf_file() -> Path:
     logger.info(f"Found latest DRF file: {latest_file.name}")
     return latest_file
 
-def run():
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses command-line options for the pipeline."""
+    parser = argparse.ArgumentParser(description="Run the Brisnet data processing pipeline.")
+    parser.add_argument(
+        "--stream", action="store_true", default=settings.STREAMING_PARSE,
+        help="Parse the DRF file in bounded-size batches to keep memory flat.",
+    )
+    parser.add_argument(
+        "drf_files", nargs="*", type=Path,
+        help="DRF files or .zip/.gz bundles to process. Defaults to the latest file (or all files with --batch).",
+    )
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="Process every DRF file in the raw data directory in parallel and merge the outputs.",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Rebuild every stage even if the ingest manifest shows its inputs are unchanged.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=settings.BATCH_MAX_WORKERS,
+        help="Number of worker processes for batch mode (default: one per CPU core).",
+    )
+    parser.add_argument(
+        "--disk-handoff", dest="in_memory", action="store_false", default=settings.IN_MEMORY_HANDOFF,
+        help="Pass the parsed data between stages through parsed_race_data_full.parquet instead of in memory.",
+    )
+    parser.add_argument(
+        "--keep-parsed", action="store_true", default=settings.PERSIST_PARSED_DATA,
+        help="Also write parsed_race_data_full.parquet when handing data over in memory.",
+    )
+    parser.add_argument(
+        "--archive", action="store_true", default=settings.ARCHIVE_CARDS,
+        help="Append each processed card to the race_date/track partitioned archive under data/archive/.",
+    )
+    parser.add_argument(
+        "--metrics", action="store_true",
+        help="Print a per-stage performance summary (wall/CPU time, peak memory, rows, I/O) at the end.",
+    )
+    return parser.parse_args(argv)
+
+def _run_pipeline(args: argparse.Namespace) -> None:
+    """Processes the requested cards (see run)."""
+    # Step 0: Find the cards to process (latest file unless some were supplied);
+    # a zip bundle holding several cards is processed as a batch.
+    drf_sources = None
+    if not args.batch:
+        candidates = args.drf_files or [find_latest_drf_file()]
+        drf_sources = expand_drf_paths(candidates)
+        if not drf_sources:
+            raise FileNotFoundError(f"No DRF cards found in {[p.name for p in candidates]}")
+    if drf_sources is None or len(drf_sources) > 1:
+        results = run_batch(drf_sources or args.drf_files or None, max_workers=args.workers,
+                            streaming=args.stream, force=args.force, in_memory=args.in_memory,
+                            archive=args.archive)
+        failed = [r["card"] for r in results if r["status"] != "ok"]
+        if failed:
+            logger.error(f"=== Batch finished with {len(failed)} failed card(s): {failed} ===")
+            sys.exit(1)
+        logger.info(f"=== Batch Finished Successfully ({len(results)} cards) ===")
+        return
+
+    drf_to_process = drf_sources[0]
+
+    manifest = IngestManifest() if settings.USE_INGEST_MANIFEST else None
+
+    # Execute the pipeline steps: parse, current race info, workouts, past starts
+    logger.info(f"Running pipeline stages for {drf_to_process.name}...")
+    stages = run_card_stages(drf_to_process, standard_output_paths(), manifest,
+                             streaming=args.stream, force=args.force,
+                             in_memory=args.in_memory, persist_parsed=args.keep_parsed,
+                             archive=args.archive)
+    logger.info(f"Stages run: {stages['ran'] or 'none (all up to date)'}")
+
+    if manifest is not None:
+        manifest.save()
+
+    logger.info("=============================================")
+    logger.info("=== Pipeline Finished Successfully      ===")
+    logger.info("=============================================")
+
+def run(argv: Optional[List[str]] = None):
     """
-    Executes the complete data processing pipeline in sequence.
+    Executes the complete data processing pipeline, recording per-stage
+    metrics (see bris_handicapper.telemetry).
     """
+    args = parse_args(argv)
+    collector = None
+    if settings.TELEMETRY_ENABLED or args.metrics:
+        metrics_path = settings.METRICS_DIR / LOG_FILE_PATH.with_suffix(".metrics.jsonl").name
+        collector = start_run(metrics_path if settings.TELEMETRY_ENABLED else None)
     logger.info("==============================================")
     logger.info("=== Starting Brisnet Data Processing Pipeline ===")
     logger.info("==============================================")
 
     try:
-        # Step 0: Find the latest data file to process
-        drf_to_process = find_latest_drf_file()
-
-        # Execute the pipeline steps
-        logger.info("Step 1: Parsing Brisnet data...")
-        parse_bris_data(drf_file_path_arg=drf_to_process)
-
-        logger.info("Step 2: Creating current race info...")
-        create_current_info()
-
-        logger.info("Step 3: Transforming workouts...")
-        transform_workouts_data()
-
-        logger.info("Step 4: Transforming past starts...")
-        transform_past_starts_data()
-
-        logger.info("=============================================")
-        logger.info("=== Pipeline Finished Successfully      ===")
-        logger.info("=============================================")
-
+        with measure("pipeline"):
+            _run_pipeline(args)
     except FileNotFoundError as e:
         logger.error(f"PIPELINE HALTED: A required file was not found. Details: {e}", exc_info=False)
     except Exception as e:
         logger.error(f"PIPELINE FAILED with an unexpected error: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        if args.metrics and collector is not None:
+            logger.info(f"Stage metrics:\n{collector.summary()}")
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Ingest manifest for the BrisHandicapper project.
+
+Records, for every pipeline stage output, the content hash of each input file,
+the hash of the output itself, and a code/version stamp. A stage whose inputs,
+outputs, options and code are unchanged since it last ran can be skipped.
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import data_mappings, settings
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+MANIFEST_VERSION = 1
+
+# (path, size, mtime_ns) -> sha256, so a file is hashed at most once per process
+_hash_memo: Dict[Tuple[str, int, int], str] = {}
+_code_stamp: Optional[str] = None
+
+def file_hash(path: Path) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    stat = path.stat()
+    memo_key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    cached = _hash_memo.get(memo_key)
+    if cached is not None:
+        return cached
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+def code_stamp() -> str:
+    """
+    Returns a stamp identifying the installed package version and the source
+    of the data-processing code and of the settings and column mappings it
+    reads, so outputs are rebuilt after a code or catalog change.
+    """
+    global _code_stamp
+    if _code_stamp is None:
+        try:
+            version = metadata.version("bris_handicapper")
+        except metadata.PackageNotFoundError:
+            version = "0.0.0"
+        package_dir = Path(__file__).resolve().parent
+        digest = hashlib.sha256()
+        sources = sorted(package_dir.glob("data_processing/*.py"))
+        sources += [package_dir / "batch.py", package_dir / "pipeline.py",
+                    Path(settings.__file__), Path(data_mappings.__file__)]
+        for source in sources:
+            digest.update(source.name.encode())
+            digest.update(source.read_bytes())
+        _code_stamp = f"{version}+{digest.hexdigest()[:16]}"
+    return _code_stamp
+
+class IngestManifest:
+    """A JSON manifest of stage inputs and outputs stored under cache/."""
+
+    def __init__(self, path: Path = settings.INGEST_MANIFEST):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable ingest manifest {self.path}: {e}")
+            return {}
+        if data.get("version") != MANIFEST_VERSION:
+            logger.info("Ingest manifest version changed; all stages will be rebuilt.")
+            return {}
+        return data.get("stages", {})
+
+    @staticmethod
+    def stage_key(stage: str, outputs: Sequence[Path]) -> str:
+        return f"{stage}:{Path(outputs[0]).resolve()}"
+
+    def build_entry(self, inputs: Sequence[Path], outputs: Sequence[Path],
+                    options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Builds the manifest record for a stage that has just completed."""
+        return {
+            "inputs": {str(Path(p).resolve()): file_hash(Path(p)) for p in inputs},
+            "outputs": {str(Path(p).resolve()): file_hash(Path(p)) for p in outputs},
+            "options": options or {},
+            "code": code_stamp(),
+            "completed_at": datetime.now().isoformat(timespec='seconds'),
+        }
+
+    def is_current(self, stage: str, inputs: Sequence[Path], outputs: Sequence[Path],
+                   options: Optional[Dict[str, Any]] = None) -> bool:
+        """True if the stage's recorded inputs, outputs, options and code all still match."""
+        entry = self.entries.get(self.stage_key(stage, outputs))
+        if entry is None or entry.get("code") != code_stamp() or entry.get("options") != (options or {}):
+            return False
+        for recorded, paths in (("inputs", inputs), ("outputs", outputs)):
+            hashes = entry.get(recorded, {})
+            if len(hashes) != len(paths):
+                return False
+            for p in map(Path, paths):
+                if not p.exists() or hashes.get(str(p.resolve())) != file_hash(p):
+                    return False
+        return True
+
+    def record(self, stage: str, inputs: Sequence[Path], outputs: Sequence[Path],
+               options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        entry = self.build_entry(inputs, outputs, options)
+        self.entries[self.stage_key(stage, outputs)] = entry
+        return entry
+
+    def update(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """Merges entries recorded elsewhere (e.g. by batch worker processes)."""
+        self.entries.update(entries)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"version": MANIFEST_VERSION, "stages": self.entries}, f, indent=2, sort_keys=True)
+        tmp_path.replace(self.path)
+
+def run_if_changed(
+    manifest: Optional[IngestManifest],
+    stage: str,
+    func: Callable[..., Optional[Path]],
+    inputs: Sequence[Path],
+    outputs: List[Path],
+    options: Optional[Dict[str, Any]] = None,
+    force: bool = False,
+    **kwargs: Any,
+) -> Tuple[bool, Optional[Path]]:
+    """
+    Runs a stage unless the manifest shows it is up to date.
+
+    Returns (ran, output_path). output_path is None only if the stage ran and
+    failed to produce its output. Successful runs are recorded in the manifest.
+    Missing optional inputs are left out of the comparison.
+    """
+    inputs = [Path(p) for p in inputs if Path(p).exists()]
+    if manifest is not None and not force and manifest.is_current(stage, inputs, outputs, options):
+        logger.info(f"Skipping '{stage}': inputs unchanged since last run ({outputs[0].name}).")
+        return False, outputs[0]
+    saved = func(**kwargs)
+    if manifest is not None and saved is not None and all(Path(p).exists() for p in outputs):
+        manifest.record(stage, inputs, outputs, options)
+    return True, saved
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+Per-card stage runner for the BrisHandicapper project.
+
+Runs the parse, current race info, workout and past performance stages for a
+single DRF card. By default the parsed wide table is handed to the three
+downstream stages in memory, so the 1,300-column file is parsed once and never
+read back; it is only written to disk when persisting is requested. With a
+streaming parse, or when in-memory handoff is off, the stages communicate
+through parsed_race_data_full.parquet as before.
+
+The stages form a small graph (parse -> the three downstream stages ->
+archive). The downstream stages depend only on the parsed data, so they run
+concurrently.
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from config import settings
+from bris_handicapper.data_processing.bris_spec_new import main as parse_bris_data, parse_drf, save_parsed_table
+from bris_handicapper.data_processing.current_race_info import main as create_current_info
+from bris_handicapper.data_processing.drf_source import DrfInput, DrfSource, as_drf_source
+from bris_handicapper.data_processing.projection import table_shape, to_frame
+from bris_handicapper.data_processing.transform_workouts import main as transform_workouts_data
+from bris_handicapper.data_processing.transform_past_starts import main as transform_past_starts_data
+from bris_handicapper.archive import archive_card
+from bris_handicapper.manifest import IngestManifest, run_if_changed
+from bris_handicapper.stage_graph import STAGE_DONE, Stage, raise_first_failure, run_stage_graph
+from bris_handicapper.telemetry import annotate, measure
+
+logger = logging.getLogger(__name__)
+
+SPEC_INPUTS: List[Path] = [settings.BRIS_DICT, settings.BRIS_SPEC_CACHE]
+
+# Downstream stages in run order: (output key, stage function, spec files it reads).
+DOWNSTREAM_STAGES = [
+    ("current_race_info", create_current_info, []),
+    ("workouts", transform_workouts_data, [settings.BRIS_SPEC_CACHE]),
+    ("past_starts", transform_past_starts_data, [settings.BRIS_SPEC_CACHE]),
+]
+
+def standard_output_paths() -> Dict[str, Path]:
+    """Output paths of a single-card run: the standard processed files."""
+    return {
+        "parsed": settings.PARSED_RACE_DATA_FILE,
+        "current_race_info": settings.CURRENT_RACE_INFO_FILE,
+        "workouts": settings.WORKOUTS_LONG_FILE,
+        "past_starts": settings.PAST_STARTS_LONG_FILE,
+    }
+
+class _ParsedCard:
+    """
+    Parses a card on first use and keeps the wide table for later stages.
+    Stages running concurrently share one instance; the card is parsed once.
+    """
+
+    def __init__(self, drf_path: DrfSource, parsed_path: Path):
+        self.drf_path = drf_path
+        self.parsed_path = parsed_path
+        self._wide_df: Optional[pd.DataFrame] = None
+        self._lock = threading.Lock()
+
+    def wide_df(self) -> pd.DataFrame:
+        with self._lock:
+            if self._wide_df is None:
+                with measure("parse", card=self.drf_path.stem):
+                    self._parse()
+        return self._wide_df
+
+    def parse(self, persist: bool = False) -> Optional[Path]:
+        with self._lock:
+            return self._parse(persist)
+
+    def _parse(self, persist: bool = False) -> Optional[Path]:
+        table = parse_drf(self.drf_path)
+        if table is None:
+            raise RuntimeError(f"Parsing {self.drf_path.name} produced no data")
+        annotate(output_rows=table.num_rows, output_columns=table.num_columns)
+        saved = save_parsed_table(table, self.parsed_path) if persist else None
+        self._wide_df = to_frame(table)
+        return saved
+
+def _run_with_wide_df(stage_func: Callable[..., Optional[Path]], card: _ParsedCard, **kwargs: Any) -> Optional[Path]:
+    wide_df = card.wide_df()
+    annotate(input_rows=len(wide_df), input_columns=len(wide_df.columns))
+    return stage_func(wide_df=wide_df, **kwargs)
+
+def _manifest_step(manifest: Optional[IngestManifest], key: str, func: Callable[..., Optional[Path]],
+                   inputs: Sequence[Path], output: Path, options: Optional[Dict[str, Any]], force: bool,
+                   required: bool = False, produced: Optional[Dict[str, Path]] = None,
+                   **kwargs: Any) -> Callable[[], Tuple[bool, Optional[Path]]]:
+    """
+    Wraps one stage as a graph step returning run_if_changed's (ran, output_path).
+    The output path is also stored in produced[key] when the stage has one.
+    """
+    def step() -> Tuple[bool, Optional[Path]]:
+        ran, saved = run_if_changed(manifest, key, func, inputs, [output], options=options, force=force, **kwargs)
+        if required and saved is None:
+            raise RuntimeError(f"{key} step produced no output")
+        if not ran:
+            annotate(status="up_to_date")
+        elif saved is not None:
+            rows, columns = table_shape(saved)
+            annotate(output_rows=rows, output_columns=columns, output_bytes=saved.stat().st_size)
+        if produced is not None and saved is not None:
+            produced[key] = saved
+        return ran, saved
+    return step
+
+def card_stage_graph(
+    drf_path: DrfSource,
+    outputs: Dict[str, Path],
+    manifest: Optional[IngestManifest],
+    streaming: bool,
+    force: bool,
+    in_memory: bool,
+    persist_parsed: bool,
+    archive: bool,
+) -> List[Stage]:
+    """Builds the stage graph for one card; see run_card_stages."""
+    source_inputs: Sequence[Path] = [drf_path.path] + SPEC_INPUTS
+    # Cards of one zip share its hash; the member name tells them apart.
+    card_options: Dict[str, Any] = {"member": drf_path.member} if drf_path.member is not None else {}
+    stages: List[Stage] = []
+    produced: Dict[str, Path] = {}
+    labels = {"card": drf_path.stem}
+
+    if in_memory:
+        logger.info(f"Handing the parsed table for {drf_path.name} to downstream stages in memory.")
+        card = _ParsedCard(drf_path, outputs["parsed"])
+        if persist_parsed:
+            stages.append(Stage("parse", _manifest_step(
+                manifest, "parse", card.parse, source_inputs, outputs["parsed"],
+                {"streaming": False, **card_options}, force, required=True, persist=True), labels=labels))
+        # Without a persisted file, the first downstream stage that needs the table parses it.
+    else:
+        stages.append(Stage("parse", _manifest_step(
+            manifest, "parse", parse_bris_data, source_inputs, outputs["parsed"],
+            {"streaming": streaming, **card_options}, force, required=True,
+            drf_file_path_arg=drf_path, streaming=streaming, output_path=outputs["parsed"]), labels=labels))
+    parse_requires = [s.name for s in stages]
+
+    for key, stage_func, spec_inputs in DOWNSTREAM_STAGES:
+        if in_memory:
+            # Keyed on the DRF itself: no parsed file may exist to compare against.
+            step = _manifest_step(manifest, key, _run_with_wide_df, source_inputs, outputs[key],
+                                  {"handoff": "memory", **card_options}, force, produced=produced,
+                                  stage_func=stage_func, card=card,
+                                  input_path=outputs["parsed"], output_path=outputs[key])
+        else:
+            step = _manifest_step(manifest, key, stage_func, [outputs["parsed"]] + spec_inputs, outputs[key],
+                                  None, force, produced=produced, input_path=outputs["parsed"], output_path=outputs[key])
+        stages.append(Stage(key, step, requires=parse_requires, labels=labels))
+
+    if archive:
+        stages.append(Stage("archive", lambda: archive_card(drf_path, produced),
+                            requires=[key for key, _, _ in DOWNSTREAM_STAGES], labels=labels))
+    return stages
+
+def run_card_stages(
+    drf_path: DrfInput,
+    outputs: Dict[str, Path],
+    manifest: Optional[IngestManifest] = None,
+    streaming: bool = settings.STREAMING_PARSE,
+    force: bool = False,
+    in_memory: bool = settings.IN_MEMORY_HANDOFF,
+    persist_parsed: bool = settings.PERSIST_PARSED_DATA,
+    archive: bool = settings.ARCHIVE_CARDS,
+    stage_workers: Optional[int] = settings.STAGE_MAX_WORKERS,
+) -> Dict[str, Any]:
+    """
+    Runs the four stages for one card, skipping any the manifest shows are
+    up to date, and optionally appends the card to the historical archive.
+    The card may be a DRF file, a gzipped DRF or a member of a zip bundle.
+    Independent stages run concurrently on up to stage_workers threads.
+
+    Returns {"ran": [stage, ...], "outputs": {key: path}, "stages": {name: StageResult}}.
+    Raises the first stage error (RuntimeError if the card cannot be parsed)
+    once every stage not downstream of it has finished.
+    """
+    drf_path = as_drf_source(drf_path)
+    stages = card_stage_graph(drf_path, outputs, manifest, streaming, force,
+                              in_memory and not streaming, persist_parsed, archive)
+    results = run_stage_graph(stages, stage_workers)
+
+    result: Dict[str, Any] = {"ran": [], "outputs": {}, "stages": results}
+    for name, stage_result in results.items():
+        if stage_result.status != STAGE_DONE:
+            continue
+        if name == "archive":
+            result["archived"] = stage_result.value
+            continue
+        ran, saved = stage_result.value
+        if ran:
+            result["ran"].append(name)
+        if saved is not None and name != "parse":
+            result["outputs"][name] = saved
+    raise_first_failure(results)
+    return result
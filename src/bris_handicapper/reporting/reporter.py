@@ -14,29 +14,30 @@ from typing import Dict, List, Any, Optional
 
 from config.config import settings
 from bris_handicapper.analysis.grouper import FACTOR_MATRIX_CONFIG
+from bris_handicapper.analysis.horse_features import build_horse_features, by_horse
 
 logger = logging.getLogger(__name__)
 
 def build_factor_matrix_for_report(
-    contenders_df: pd.DataFrame, past_starts_df: pd.DataFrame
+    contenders_df: pd.DataFrame, past_starts_df: pd.DataFrame, features: Optional[pd.DataFrame] = None
 ) -> Dict[str, Dict[str, Any]]:
     """
     Builds a data-rich dictionary of the key performance factors for top contenders.
+    features is the race's horse feature table, built when not given.
     """
     report_matrix = {}
-    program_number_if_availables = contenders_df['program_number_if_available'].tolist()
+    if features is None:
+        features = build_horse_features(contenders_df, past_starts_df)
+    horse_features = by_horse(features)
+    contenders = contenders_df.drop_duplicates('program_number_if_available').set_index('program_number_if_available')
     
-    for prog_num in program_number_if_availables:
-        horse_data = contenders_df[contenders_df['program_number_if_available'] == prog_num].iloc[0]
-        horse_pps = past_starts_df[past_starts_df['program_number_if_available'] == prog_num]
-        
+    for prog_num in contenders_df['program_number_if_available'].tolist():
         horse_report = {}
         for factor, config in FACTOR_MATRIX_CONFIG.items():
-            source_col = config['source_col']
             if config['source_df'] == 'current':
-                value = horse_data.get(source_col)
+                value = contenders.loc[prog_num].get(config['source_col'])
             else:
-                value = horse_pps[source_col].max() if not horse_pps.empty else None
+                value = horse_features.loc[prog_num, factor]
             
             horse_report[factor] = round(value, 2) if pd.notnull(value) else 'N/A'
             
@@ -48,7 +49,8 @@ def generate_llm_report_data(
     final_groups: Dict[str, List[Any]],
     contenders_df: pd.DataFrame,
     past_starts_df: pd.DataFrame,
-    adjustments: Optional[Dict[str, Dict[Any, str]]] = None
+    adjustments: Optional[Dict[str, Dict[Any, str]]] = None,
+    features: Optional[pd.DataFrame] = None
 ) -> Dict[str, Any]:
     """
     Generates a structured dictionary for a single race, optimized for an LLM.
@@ -61,7 +63,8 @@ def generate_llm_report_data(
     track_id = race_info['track']
     race_num = race_info['race']
     
-    favorite = contenders_df.sort_values(by='morning_line_odds').iloc[0]
+    favorite = contenders_df.sort_values(by='morn_line_odds_if_available',
+                                         key=lambda odds: pd.to_numeric(odds, errors='coerce')).iloc[0]
     favorite_prog_num = favorite['program_number_if_available']
     
     if favorite_prog_num in final_groups.get("Group 1", []):
@@ -79,7 +82,7 @@ def generate_llm_report_data(
         "race_identification": {
             "track": track_id,
             "race": int(race_num),
-            "distance_furlongs": round(race_info.get('distance_yards', 0) / 220, 2),
+            "distance_furlongs": round(race_info.get('distance_in_yards', 0) / 220, 2),
             "surface": race_info.get('surface'),
             "race_type": race_info.get('race_type')
         },
@@ -94,7 +97,7 @@ def generate_llm_report_data(
             "contender_groups": final_groups
         },
         "supporting_data": {
-            "factor_matrix": build_factor_matrix_for_report(contenders_df, past_starts_df),
+            "factor_matrix": build_factor_matrix_for_report(contenders_df, past_starts_df, features),
             "adjustment_notes": adjustments
         },
         "metadata": {
@@ -104,15 +107,17 @@ def generate_llm_report_data(
     }
     return report
 
+def report_path(output_dir: Path, track: str, race_num: int) -> Path:
+    """Where the report for a race is saved."""
+    return output_dir / track / f"race_{race_num}_report.json"
+
 def save_report(report_data: Dict[str, Any], output_dir: Path):
     """Saves the report data as a JSON file."""
     track = report_data["race_identification"]["track"]
     race_num = report_data["race_identification"]["race"]
     
-    track_dir = output_dir / track
-    track_dir.mkdir(exist_ok=True, parents=True)
-    
-    file_path = track_dir / f"race_{race_num}_report.json"
+    file_path = report_path(output_dir, track, race_num)
+    file_path.parent.mkdir(exist_ok=True, parents=True)
     
     try:
         with open(file_path, 'w') as f:
@@ -129,20 +134,23 @@ if __name__ == '__main__':
         'track': ['TEST'] * 4,
         'race': [5] * 4,
         'program_number_if_available': ['1', '2', '7', '8'],
+        'post_position': [1, 2, 7, 8],
         'horse_name': ['Alpha', 'Bravo', 'Charlie', 'Delta'],
-        'morning_line_odds': [2.0, 3.0, 5.0, 8.0],
-        'distance_yards': [1760, 1760, 1760, 1760],
+        'morn_line_odds_if_available': ['2.00', '3.00', '5.00', '8.00'],
+        'distance_in_yards': [1760, 1760, 1760, 1760],
         'surface': ['T', 'T', 'T', 'T'],
         'race_type': ['A', 'A', 'A', 'A'],
-        'bris_prime_power': [145, 148, 144, 130]
+        'bris_prime_power_rating': [145, 148, 144, 130]
     }
     mock_contenders_df = pd.DataFrame(mock_contenders_data)
 
     mock_pp_data = {
-        'program_number_if_available': ['1', '2', '7', '8'],
+        'track': ['TEST'] * 4,
+        'race': [5] * 4,
+        'post_position': [1, 2, 7, 8],
         'pp_bris_speed_rating': [100, 99, 97, 86],
-        'pp_bris_pace_2f': [92, 96, 88, 81],
-        'pp_bris_pace_4f': [101, 99, 96, 90],
+        'pp_bris_2f_pace': [92, 96, 88, 81],
+        'pp_bris_4f_pace': [101, 99, 96, 90],
         'pp_bris_late_pace': [96, 97.5, 92.5, 85]
     }
     mock_pp_df = pd.DataFrame(mock_pp_data)
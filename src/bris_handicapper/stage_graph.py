@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Stage-graph executor for the BrisHandicapper pipeline.
+
+Each stage names the stages whose outputs it consumes. A stage starts as soon
+as everything it requires has finished, so independent stages run side by side
+in a thread pool and a cold run takes about as long as its critical path. A
+stage that raises fails; every stage downstream of it is skipped and records
+why. Stages with no path to the failure still run to completion. Every stage
+that runs is measured by bris_handicapper.telemetry.
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from config import settings
+from bris_handicapper.telemetry import measure
+
+logger = logging.getLogger(__name__)
+
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+STAGE_SKIPPED = "skipped"
+
+class Stage:
+    """
+    A pipeline step: a no-argument callable and the stages it depends on.
+    labels (e.g. the card) are stored with the stage's telemetry record.
+    """
+
+    def __init__(self, name: str, func: Callable[[], Any], requires: Sequence[str] = (),
+                 labels: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.func = func
+        self.requires = list(requires)
+        self.labels = labels or {}
+
+class StageResult:
+    """Outcome of one stage: its status, return value or error, and wall time."""
+
+    def __init__(self, name: str, status: str, value: Any = None,
+                 error: Optional[BaseException] = None, seconds: float = 0.0, reason: str = ""):
+        self.name = name
+        self.status = status
+        self.value = value
+        self.error = error
+        self.seconds = seconds
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f"StageResult({self.name!r}, {self.status!r})"
+
+def check_graph(stages: Sequence[Stage]) -> None:
+    """Raises ValueError on duplicate names, unknown dependencies or cycles."""
+    names = [s.name for s in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate stage names in {names}")
+    by_name = {s.name: s for s in stages}
+    for stage in stages:
+        unknown = [r for r in stage.requires if r not in by_name]
+        if unknown:
+            raise ValueError(f"Stage '{stage.name}' requires unknown stage(s) {unknown}")
+    resolved: set = set()
+    remaining = list(stages)
+    while remaining:
+        ready = [s for s in remaining if all(r in resolved for r in s.requires)]
+        if not ready:
+            raise ValueError(f"Stage graph has a cycle among {[s.name for s in remaining]}")
+        resolved.update(s.name for s in ready)
+        remaining = [s for s in remaining if s.name not in resolved]
+
+def _timed_call(stage: Stage) -> StageResult:
+    start = time.perf_counter()
+    try:
+        with measure(stage.name, **stage.labels):
+            value = stage.func()
+    except Exception as e:
+        logger.error(f"Stage '{stage.name}' failed: {e}", exc_info=True)
+        return StageResult(stage.name, STAGE_FAILED, error=e, seconds=time.perf_counter() - start)
+    return StageResult(stage.name, STAGE_DONE, value=value, seconds=time.perf_counter() - start)
+
+def run_stage_graph(stages: Sequence[Stage], max_workers: Optional[int] = settings.STAGE_MAX_WORKERS) -> Dict[str, StageResult]:
+    """
+    Runs every stage once its requirements are done, up to max_workers at a
+    time (1 runs them one after another in list order). Returns the results
+    keyed by stage name, in the order the stages were given.
+    """
+    check_graph(stages)
+    results: Dict[str, StageResult] = {}
+    pending: List[Stage] = list(stages)
+    running: Dict[Future, Stage] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1, thread_name_prefix="stage") as pool:
+        while pending or running:
+            progressed = True
+            while progressed:
+                progressed = False
+                for stage in list(pending):
+                    blocked = [r for r in stage.requires if r in results and results[r].status != STAGE_DONE]
+                    if blocked:
+                        reason = f"upstream stage '{blocked[0]}' {results[blocked[0]].status}"
+                        logger.warning(f"Skipping stage '{stage.name}': {reason}.")
+                        results[stage.name] = StageResult(stage.name, STAGE_SKIPPED, reason=reason)
+                    elif all(r in results for r in stage.requires):
+                        running[pool.submit(_timed_call, stage)] = stage
+                    else:
+                        continue
+                    pending.remove(stage)
+                    progressed = True
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                results[stage.name] = future.result()
+    return {s.name: results[s.name] for s in stages}
+
+def raise_first_failure(results: Dict[str, StageResult]) -> None:
+    """Re-raises the error of the first failed stage (in graph order), if any."""
+    for result in results.values():
+        if result.status == STAGE_FAILED:
+            raise result.error
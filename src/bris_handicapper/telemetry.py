@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""
+Per-stage performance telemetry for the BrisHandicapper project.
+
+Wrapping a step in measure("name") records its wall time, process CPU time,
+peak RSS and the bytes read and written while it ran. Steps add
+their input/output shapes through annotate() and count(). While a run is being
+collected (start_run / collecting), every record is appended to a JSON-lines
+metrics file and can be printed as a summary table at the end.
+
+CPU time and I/O bytes are process-wide counters. Stages that run concurrently
+(see stage_graph) are therefore each charged for the others' work while they
+overlap. Wall time and shapes are always exact.
+
+Peak RSS is the stage's own peak on Linux: the kernel's high-water mark
+(VmHWM) is reset through /proc/self/clear_refs when a stage starts, after
+crediting the mark reached so far to the stages already open. Elsewhere it
+falls back to ru_maxrss, the process's peak since it started, so a stage
+there reports the largest footprint of anything run before it as well.
+"""
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_PROC_IO = Path("/proc/self/io")
+_PROC_STATUS = Path("/proc/self/status")
+_PROC_CLEAR_REFS = Path("/proc/self/clear_refs")
+# Writing this to clear_refs resets VmHWM to the current RSS
+_RESET_PEAK_RSS = "5"
+
+class Telemetry:
+    """The metric records of one run, optionally mirrored to a JSON-lines file."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self.extend([record])
+
+    def extend(self, records: Sequence[Dict[str, Any]]) -> None:
+        """Adds records (e.g. collected in a batch worker process) to the run."""
+        with self._lock:
+            self.records.extend(records)
+            if self.path is not None and records:
+                with open(self.path, 'a') as f:
+                    for record in records:
+                        f.write(json.dumps(record, default=_json_value) + "\n")
+
+    def summary(self) -> str:
+        return format_summary(self.records)
+
+def _json_value(value: Any) -> Any:
+    """numpy scalars (e.g. a race number taken from a DataFrame) as plain Python values."""
+    return value.item() if hasattr(value, "item") else str(value)
+
+_active: Optional[Telemetry] = None
+_local = threading.local()
+
+def start_run(path: Optional[Path] = None) -> Telemetry:
+    """Starts collecting this process's records, writing them to path if given."""
+    global _active
+    _active = Telemetry(path)
+    if path is not None:
+        logger.info(f"Writing stage metrics to {path}")
+    return _active
+
+def active() -> Optional[Telemetry]:
+    return _active
+
+@contextmanager
+def collecting() -> Iterator[Telemetry]:
+    """Collects records in memory for the duration of the block (used in batch workers)."""
+    global _active
+    previous, _active = _active, Telemetry()
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+def _open_records() -> List[Dict[str, Any]]:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+class _PeakWindow:
+    """The peak RSS (kB) seen while one stage is open."""
+
+    def __init__(self):
+        self.kb = 0
+        self.per_stage = False
+
+# Stages open in any thread
+_open_peaks: List[_PeakWindow] = []
+_peak_lock = threading.Lock()
+_can_reset_peak: Optional[bool] = None
+
+def _vm_hwm_kb() -> Optional[int]:
+    """The process's RSS high-water mark in kB since it was last reset (Linux only)."""
+    try:
+        match = re.search(r"^VmHWM:\s+(\d+)", _PROC_STATUS.read_text(), re.MULTILINE)
+    except OSError:
+        return None
+    return int(match.group(1)) if match else None
+
+def _reset_peak_rss() -> bool:
+    global _can_reset_peak
+    if _can_reset_peak is False:
+        return False
+    try:
+        _PROC_CLEAR_REFS.write_text(_RESET_PEAK_RSS)
+        _can_reset_peak = _vm_hwm_kb() is not None
+    except OSError:
+        _can_reset_peak = False
+    return _can_reset_peak
+
+def _credit_peak_rss() -> None:
+    """Credits the current high-water mark to every open stage. Caller holds _peak_lock."""
+    hwm = _vm_hwm_kb()
+    if hwm is not None:
+        for peak in _open_peaks:
+            peak.kb = max(peak.kb, hwm)
+
+def _start_peak_rss() -> _PeakWindow:
+    """Opens a stage's peak RSS window, resetting the high-water mark where possible."""
+    peak = _PeakWindow()
+    with _peak_lock:
+        _credit_peak_rss()
+        peak.per_stage = _reset_peak_rss()
+        _open_peaks.append(peak)
+    return peak
+
+def _end_peak_rss(peak: _PeakWindow) -> Optional[float]:
+    """Closes a stage's peak RSS window and returns its peak in MB."""
+    with _peak_lock:
+        _credit_peak_rss()
+        _open_peaks.remove(peak)
+    if peak.per_stage:
+        return round(peak.kb / 1024, 1)
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _io_counters() -> Optional[Tuple[int, int]]:
+    """Bytes this process has read and written through system calls (Linux only)."""
+    try:
+        text = _PROC_IO.read_text()
+    except OSError:
+        return None
+    fields = dict(line.split(": ", 1) for line in text.splitlines() if ": " in line)
+    return int(fields["rchar"]), int(fields["wchar"])
+
+@contextmanager
+def measure(stage: str, **context: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Measures the enclosed block as one stage record. context (card, race, ...)
+    is stored with the record. A stage may set "status" itself (e.g.
+    "up_to_date"); otherwise it is "ok", or "failed" if the block raises.
+    """
+    open_records = _open_records()
+    record: Dict[str, Any] = {"stage": stage, **context}
+    if open_records:
+        record["parent"] = open_records[-1]["stage"]
+    record["started_at"] = datetime.now().isoformat(timespec='milliseconds')
+    io_before = _io_counters()
+    peak = _start_peak_rss()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    open_records.append(record)
+    failed = False
+    try:
+        yield record
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        open_records.pop()
+        record["status"] = "failed" if failed else record.get("status", "ok")
+        record["wall_s"] = round(time.perf_counter() - wall_start, 4)
+        record["cpu_s"] = round(time.process_time() - cpu_start, 4)
+        record["peak_rss_mb"] = _end_peak_rss(peak)
+        io_after = _io_counters()
+        if io_before is not None and io_after is not None:
+            record["bytes_read"] = io_after[0] - io_before[0]
+            record["bytes_written"] = io_after[1] - io_before[1]
+        if _active is not None:
+            _active.add(record)
+
+def annotate(**fields: Any) -> None:
+    """Sets fields (e.g. output_rows) on the innermost stage being measured in this thread."""
+    open_records = _open_records()
+    if open_records:
+        open_records[-1].update(fields)
+
+def count(**fields: int) -> None:
+    """Adds to numeric fields (e.g. input_rows) of the innermost stage being measured."""
+    open_records = _open_records()
+    if open_records:
+        record = open_records[-1]
+        for key, value in fields.items():
+            record[key] = record.get(key, 0) + value
+
+def _mb(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value / (1024 * 1024):.1f}"
+
+def format_summary(records: Sequence[Dict[str, Any]]) -> str:
+    """One row per stage name (in first-seen order) aggregating all its records."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        groups.setdefault(record["stage"], []).append(record)
+    header = (f"{'stage':<26}{'runs':>5}{'failed':>7}{'wall s':>9}{'max s':>8}{'cpu s':>8}"
+              f"{'peak MB':>9}{'rows in':>10}{'rows out':>10}{'read MB':>9}{'write MB':>9}")
+    lines = [header, "-" * len(header)]
+    for stage, group in groups.items():
+        def total(key: str) -> Optional[float]:
+            values = [r[key] for r in group if r.get(key) is not None]
+            return sum(values) if values else None
+        peaks = [r["peak_rss_mb"] for r in group if r.get("peak_rss_mb") is not None]
+        rows_in, rows_out = total("input_rows"), total("output_rows")
+        lines.append(
+            f"{stage:<26}{len(group):>5}{sum(r['status'] == 'failed' for r in group):>7}"
+            f"{total('wall_s') or 0:>9.2f}{max(r['wall_s'] for r in group):>8.2f}{total('cpu_s') or 0:>8.2f}"
+            f"{(f'{max(peaks):.0f}' if peaks else '-'):>9}"
+            f"{('-' if rows_in is None else f'{rows_in:,}'):>10}{('-' if rows_out is None else f'{rows_out:,}'):>10}"
+            f"{_mb(total('bytes_read')):>9}{_mb(total('bytes_written')):>9}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+Watch-folder mode for the BrisHandicapper project.
+
+Keeps one warm process running that polls the raw data directory for DRF
+files and .zip/.gz bundles. A file is queued once its size and modification
+time have stayed unchanged for settings.WATCH_SETTLE_SECONDS, so downloads
+still being written are left alone. Files that change later (a re-download)
+are queued again. Each queued file is run through the pipeline stages and,
+unless disabled, the handicapping step, writing the usual processed files
+and reports. Late-change sets (settings.LATE_CHANGES_PATTERNS) are applied
+to the card in memory and only the races they affect are re-handicapped.
+Because pandas, pyarrow and the compiled schema are loaded once, a card is
+processed without the start-up cost of a fresh command.
+
+Usage: bris_handicapper_watch [--include-existing] [--once]
+"""
+import argparse
+import fnmatch
+import logging
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import settings
+from bris_handicapper.batch import run_batch
+from bris_handicapper.data_processing.drf_source import expand_drf_path, find_drf_bundle_files, unique_cards
+from bris_handicapper.data_processing.schema import load_compiled_schema
+from bris_handicapper.handicap import handicap_races
+from bris_handicapper.late_changes import LateChangeSession, load_change_set
+from bris_handicapper.manifest import IngestManifest
+from bris_handicapper.pipeline import run_card_stages, standard_output_paths
+from bris_handicapper.telemetry import measure, start_run
+
+logger = logging.getLogger(__name__)
+
+# (size, mtime_ns) of a file as last seen
+FileSignature = Tuple[int, int]
+
+def is_change_set(path: Path) -> bool:
+    return any(fnmatch.fnmatch(path.name.lower(), pattern) for pattern in settings.LATE_CHANGES_PATTERNS)
+
+def _signature(path: Path) -> Optional[FileSignature]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+class FolderWatcher:
+    """
+    Polls a directory for DRF files and bundles and reports each new or
+    changed file once it has settled (unchanged for settle_seconds).
+    """
+
+    def __init__(self, raw_dir: Path = settings.RAW_DATA_DIR, pattern: str = settings.DRF_PATTERN,
+                 settle_seconds: float = settings.WATCH_SETTLE_SECONDS, include_existing: bool = False):
+        self.raw_dir = raw_dir
+        self.pattern = pattern
+        self.settle_seconds = settle_seconds
+        # Signature each file had when it was last handed out
+        self.done: Dict[Path, FileSignature] = {}
+        # Files seen changing: their latest signature and when it was first seen
+        self.settling: Dict[Path, Tuple[FileSignature, float]] = {}
+        if not include_existing:
+            for path, sig in self._scan().items():
+                self.done[path] = sig
+
+    def _scan(self) -> Dict[Path, FileSignature]:
+        if not self.raw_dir.exists():
+            return {}
+        found = {}
+        candidates = find_drf_bundle_files(self.raw_dir, self.pattern)
+        candidates += [p for p in self.raw_dir.iterdir() if p.is_file() and is_change_set(p)]
+        for path in candidates:
+            if path.name.startswith("."):
+                continue
+            sig = _signature(path)
+            if sig is not None:
+                found[path] = sig
+        return found
+
+    def poll(self, now: Optional[float] = None) -> List[Path]:
+        """Returns the files that have settled since the last poll, oldest first."""
+        now = time.monotonic() if now is None else now
+        current = self._scan()
+        for path in set(self.done) - set(current):
+            del self.done[path]
+        for path in set(self.settling) - set(current):
+            del self.settling[path]
+
+        ready: List[Tuple[int, Path]] = []
+        for path, sig in current.items():
+            if self.done.get(path) == sig:
+                continue
+            seen = self.settling.get(path)
+            if seen is None or seen[0] != sig:
+                self.settling[path] = (sig, now)
+                continue
+            if now - seen[1] >= self.settle_seconds:
+                del self.settling[path]
+                self.done[path] = sig
+                ready.append((sig[1], path))
+        return [path for _, path in sorted(ready)]
+
+    @property
+    def waiting(self) -> bool:
+        """True while a file is still settling."""
+        return bool(self.settling)
+
+def process_drop(path: Path, force: bool = False, handicap: bool = settings.WATCH_HANDICAP) -> bool:
+    """
+    Runs the pipeline (and handicapping) for one file that landed in the
+    watch folder. A bundle holding several cards is processed as a batch.
+    Returns True on success; errors are logged, never raised.
+    """
+    try:
+        with measure("watch_file", file=path.name):
+            sources = unique_cards(expand_drf_path(path))
+            if not sources:
+                logger.warning(f"No DRF cards in {path.name}; nothing to do.")
+                return False
+            if len(sources) == 1:
+                manifest = IngestManifest() if settings.USE_INGEST_MANIFEST else None
+                stages = run_card_stages(sources[0], standard_output_paths(), manifest, force=force)
+                if manifest is not None:
+                    manifest.save()
+                logger.info(f"{sources[0].name}: stages run {stages['ran'] or 'none (all up to date)'}")
+            else:
+                results = run_batch(sources, force=force)
+                failed = [r["card"] for r in results if r["status"] != "ok"]
+                if failed:
+                    logger.error(f"{path.name}: {len(failed)} card(s) failed: {failed}")
+                    return False
+    except Exception as e:
+        logger.error(f"Processing {path.name} failed: {e}", exc_info=True)
+        return False
+    if handicap:
+        try:
+            with measure("handicap_races", file=path.name):
+                handicap_races()
+        except Exception as e:
+            logger.error(f"Handicapping after {path.name} failed: {e}", exc_info=True)
+            return False
+    logger.info(f"Finished {path.name}.")
+    return True
+
+def process_change_set(path: Path, session: Optional[LateChangeSession]) -> Optional[LateChangeSession]:
+    """
+    Applies a late-change set and re-handicaps the affected races. The
+    session (the card's handicapping inputs in memory) is loaded on first use
+    and returned for the next change set; errors are logged, never raised.
+    """
+    try:
+        with measure("watch_file", file=path.name):
+            changes = load_change_set(path)
+            if session is None:
+                session = LateChangeSession.from_processed_files()
+            session.process(changes)
+    except Exception as e:
+        logger.error(f"Applying late changes from {path.name} failed: {e}", exc_info=True)
+    return session
+
+def watch(watcher: FolderWatcher, stop: threading.Event, poll_seconds: float = settings.WATCH_POLL_SECONDS,
+          once: bool = False, force: bool = False, handicap: bool = settings.WATCH_HANDICAP) -> int:
+    """
+    Polls the watcher and processes settled files in arrival order until stop
+    is set (or, with once, until nothing is left to settle). Returns the
+    number of files processed.
+    """
+    queue: Deque[Path] = deque()
+    processed = 0
+    session: Optional[LateChangeSession] = None
+    while not stop.is_set():
+        for path in watcher.poll():
+            if path not in queue:
+                logger.info(f"Queued {path.name}")
+                queue.append(path)
+        while queue and not stop.is_set():
+            path = queue.popleft()
+            if is_change_set(path):
+                session = process_change_set(path, session)
+            else:
+                process_drop(path, force=force, handicap=handicap)
+                # Later change sets apply to the newly processed card.
+                session = None
+            processed += 1
+        if once and not watcher.waiting:
+            break
+        stop.wait(poll_seconds)
+    return processed
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Process DRF files as they land in the raw data directory.")
+    parser.add_argument("--dir", type=Path, default=settings.RAW_DATA_DIR,
+                        help="Directory to watch (default: %(default)s).")
+    parser.add_argument("--include-existing", action="store_true",
+                        help="Also process the files already in the directory at start-up.")
+    parser.add_argument("--once", action="store_true",
+                        help="Exit once every file found has been processed instead of watching forever.")
+    parser.add_argument("--no-handicap", dest="handicap", action="store_false", default=settings.WATCH_HANDICAP,
+                        help="Only run the pipeline stages, not the handicapping step.")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild every stage even if the ingest manifest shows its inputs are unchanged.")
+    return parser.parse_args(argv)
+
+def run(argv: Optional[List[str]] = None) -> None:
+    """Starts the watcher and runs until interrupted (Ctrl-C or SIGTERM)."""
+    args = parse_args(argv)
+    started = datetime.now()
+    settings.METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(settings.METRICS_DIR / f"watch_{started:%Y%m%d_%H%M%S}.log"),
+            logging.StreamHandler(sys.stdout),
+        ],
+        force=True,
+    )
+    if settings.TELEMETRY_ENABLED:
+        start_run(settings.METRICS_DIR / f"watch_{started:%Y%m%d_%H%M%S}.metrics.jsonl")
+    # Warm the compiled schema before the first card arrives.
+    load_compiled_schema()
+
+    stop = threading.Event()
+    def request_stop(signum, frame):
+        logger.info("Stop requested; finishing the current file.")
+        stop.set()
+    signal.signal(signal.SIGTERM, request_stop)
+
+    once = args.once
+    watcher = FolderWatcher(args.dir, include_existing=args.include_existing or once)
+    logger.info(f"Watching {args.dir} for DRF files (poll every {settings.WATCH_POLL_SECONDS}s, "
+                f"settle {settings.WATCH_SETTLE_SECONDS}s). Press Ctrl-C to stop.")
+    try:
+        processed = watch(watcher, stop, once=once, force=args.force, handicap=args.handicap)
+    except KeyboardInterrupt:
+        processed = None
+    logger.info(f"Watcher stopped{'' if processed is None else f' after {processed} file(s)'}.")
+
+if __name__ == "__main__":
+    run()
@@ -132,3 +132,49 @@ def generate_pp_mappings(num_pps=10):
 
 # Merge generated PP mappings into the main COLUMN_MAPPINGS
 COLUMN_MAPPINGS.update(generate_pp_mappings())
+
+# --- Column Catalog ---
+# The columns each consumer of the processed Parquet files actually reads.
+# Reads are projected onto these lists (see
+# bris_handicapper.data_processing.projection), so I/O and memory scale with
+# what a stage uses rather than with the width of the file. Names missing from
+# a file are skipped. The numbered workout/past-performance fields are declared
+# by field number in long_format_transformer's metric maps and are resolved to
+# labels through the spec at read time.
+
+# Identifiers carried into every long-format table.
+LONG_FORMAT_ID_COLUMNS = ["track", "race", "post_position", "horse_name"]
+
+# Today's-race columns merged back onto each past start.
+PAST_STARTS_STATIC_COLUMNS = [
+    "track",
+    "race",
+    "horse_name",
+    "post_position",
+    "morn_line_odds_if_available",
+    "bris_run_style_designation",
+    "quirin_style_speed_points",
+]
+
+# current_race_info.parquet columns used by handicap.py, analysis/ and reporting/.
+HANDICAP_CURRENT_RACE_COLUMNS = [
+    "track", "race", "post_position", "program_number_if_available", "horse_name",
+    "surface", "race_type", "distance_in_yards", "morn_line_odds_if_available", "today_s_jockey",
+    "bris_prime_power_rating", "bris_run_style_designation",
+    "bris_dirt_pedigree_rating", "bris_turf_pedigree_rating", "bris_mud_pedigree_rating",
+    "t_j_combo_2_roi_365d", "t_j_combo_starts_365d",
+]
+
+# past_starts_long_format.parquet columns used by handicap.py, analysis/ and reporting/.
+HANDICAP_PAST_START_COLUMNS = [
+    "track", "race", "post_position", "horse_name", "pp_race_date",
+    "pp_surface", "pp_track_condition",
+    "pp_bris_speed_rating", "pp_bris_2f_pace", "pp_bris_4f_pace", "pp_bris_late_pace",
+]
+
+COLUMN_CATALOG = {
+    "workouts": LONG_FORMAT_ID_COLUMNS,
+    "past_starts": LONG_FORMAT_ID_COLUMNS + [c for c in PAST_STARTS_STATIC_COLUMNS if c not in LONG_FORMAT_ID_COLUMNS],
+    "handicap_current_race": HANDICAP_CURRENT_RACE_COLUMNS,
+    "handicap_past_starts": HANDICAP_PAST_START_COLUMNS,
+}
@@ -13,6 +13,7 @@ PROJECT_ROOT = Path(__file__).resolve().parents[2]
 DATA_DIR = PROJECT_ROOT / "data"
 RAW_DATA_DIR = DATA_DIR / "raw"
 PROCESSED_DATA_DIR = DATA_DIR / "processed"
+ARCHIVE_DIR = DATA_DIR / "archive"
 
 # Reports directory
 REPORTS_DIR = PROJECT_ROOT / "reports"
@@ -1,6 +1,6 @@
 # BrisHandicapper/src/config/settings.py
 
-from .paths import RAW_DATA_DIR, PROCESSED_DATA_DIR, PROJECT_ROOT
+from .paths import RAW_DATA_DIR, PROCESSED_DATA_DIR, ARCHIVE_DIR, PROJECT_ROOT
 
 # This file contains configuration settings used across the application,
 # particularly by the main pipeline script.
@@ -9,17 +9,38 @@ from .paths import RAW_DATA_DIR, PROCESSED_DATA_DIR, PROJECT_ROOT
 # The glob pattern to find Brisnet DRF files.
 # The '[dD][rR][fF]' part makes the extension matching case-insensitive.
 DRF_PATTERN = "*.[dD][rR][fF]"
+# Compressed Brisnet downloads picked up alongside bare DRF files: gzipped
+# DRFs (e.g. CDX0628.DRF.gz) and zip bundles holding one or more DRF cards.
+# They are decompressed as a stream while parsing; nothing is extracted.
+DRF_BUNDLE_PATTERNS = ("*.[zZ][iI][pP]", "*.[gG][zZ]")
 
 # --- Input/Output Directories ---
 # These are imported from the central paths configuration for consistency.
 RAW_DATA_DIR = RAW_DATA_DIR
 PROCESSED_DATA_DIR = PROCESSED_DATA_DIR
 
+# --- Intermediate File Format ---
+# "parquet" writes compressed Parquet files. "arrow" writes uncompressed Arrow
+# IPC (Feather v2) files instead; they are larger on disk but are opened
+# memory-mapped, so repeated loads and concurrent worker processes share the
+# OS page cache rather than each decompressing its own copy.
+INTERMEDIATE_FORMAT = "parquet"
+PROCESSED_SUFFIX = {"parquet": ".parquet", "arrow": ".arrow"}[INTERMEDIATE_FORMAT]
+# Parquet layout: rows are written ordered by track, race, post position and
+# block number, in row groups of whole races of about this many rows.
+PARQUET_ROW_GROUP_ROWS = 16384
+
 # --- Processed File Names ---
 # Centralizing the names of the key processed files.
-CURRENT_RACE_INFO_FILE = PROCESSED_DATA_DIR / "current_race_info.parquet"
-PAST_STARTS_LONG_FILE = PROCESSED_DATA_DIR / "past_starts_long_format.parquet"
-WORKOUTS_LONG_FILE = PROCESSED_DATA_DIR / "workouts_long_format.parquet"
+CURRENT_RACE_INFO_FILE = PROCESSED_DATA_DIR / f"current_race_info{PROCESSED_SUFFIX}"
+PAST_STARTS_LONG_FILE = PROCESSED_DATA_DIR / f"past_starts_long_format{PROCESSED_SUFFIX}"
+WORKOUTS_LONG_FILE = PROCESSED_DATA_DIR / f"workouts_long_format{PROCESSED_SUFFIX}"
+
+# --- Compact Long Format ---
+# When True, the long-format tables are written (and so read back) with narrow
+# dtypes: float32 figures, int8 ids and categorical code columns, roughly
+# halving their memory and load time. Purses and claiming prices stay float64.
+COMPACT_LONG_FORMAT = False
 
 # --- Cache Directory and Files ---
 # Directory for cached files like specification and dictionary data
@@ -28,9 +49,91 @@ CACHE_DIR = PROJECT_ROOT / "cache"
 # Brisnet specification cache and dictionary paths
 BRIS_SPEC_CACHE = CACHE_DIR / "bris_spec.pkl"
 BRIS_DICT = CACHE_DIR / "bris_dict.txt"
+# Compiled, typed schema built from the two files above (rebuilt when they change)
+BRIS_SCHEMA_CACHE = CACHE_DIR / "bris_schema.json"
+
+# Content-hash manifest of pipeline inputs/outputs; unchanged stages are skipped.
+INGEST_MANIFEST = CACHE_DIR / "ingest_manifest.json"
+USE_INGEST_MANIFEST = True
+
+# Shared category lists of the compact long format, so every card is written
+# with the same dictionaries (append-only; safe to delete, it is rebuilt).
+CATEGORY_VOCABULARY = CACHE_DIR / "category_vocabulary.json"
 
 # --- Primary Processed Data File ---
-PARSED_RACE_DATA_FILE = PROCESSED_DATA_DIR / "parsed_race_data_full.parquet"
+PARSED_RACE_DATA_FILE = PROCESSED_DATA_DIR / f"parsed_race_data_full{PROCESSED_SUFFIX}"
+
+# --- Parsing Options ---
+# When True, DRF files are parsed in bounded-size batches and written to
+# Parquet one row group at a time, keeping memory flat for large bundles.
+STREAMING_PARSE = False
+# Number of DRF lines (horses) parsed per batch in streaming mode.
+DRF_STREAM_CHUNK_ROWS = 1000
+
+# --- Stage Handoff ---
+# When True, the parsed wide table is passed to the downstream stages in
+# memory instead of each stage re-reading parsed_race_data_full.parquet.
+# Streaming parses always hand off through the file.
+IN_MEMORY_HANDOFF = True
+# Also write parsed_race_data_full.parquet in in-memory mode (for debugging
+# or for re-running a single downstream stage from disk).
+PERSIST_PARSED_DATA = False
+
+# --- Stage Scheduling ---
+# Threads used to run a card's independent stages (current race info,
+# workouts, past starts) side by side; 1 runs them one after another.
+STAGE_MAX_WORKERS = 3
+
+# --- Performance Telemetry ---
+# Each pipeline or handicapping run appends one JSON line per measured stage
+# (wall/CPU time, peak RSS, rows and columns, I/O bytes) to
+# METRICS_DIR/<run>_<timestamp>.metrics.jsonl. Pass --metrics to either
+# command to also print a summary table.
+TELEMETRY_ENABLED = True
+METRICS_DIR = PROJECT_ROOT / "logs"
+
+# --- Watch Mode ---
+# bris_handicapper.watch polls RAW_DATA_DIR every WATCH_POLL_SECONDS and
+# processes a new or changed DRF/zip/gz file once its size and modification
+# time have not changed for WATCH_SETTLE_SECONDS (i.e. the download finished).
+# With WATCH_HANDICAP the handicapping step runs after each file.
+WATCH_POLL_SECONDS = 2.0
+WATCH_SETTLE_SECONDS = 5.0
+WATCH_HANDICAP = True
+# Late-change sets (scratches, surface/condition and jockey changes; see
+# bris_handicapper.late_changes) dropped into the watched folder are applied
+# in the warm process, and only the affected races are re-handicapped.
+LATE_CHANGES_PATTERNS = ("*.changes.json", "*.changes.csv")
+
+# --- Benchmarks ---
+# bris_handicapper.benchmarks.suite generates synthetic cards at these
+# multiples of the template card's size into BENCHMARK_DIR, times and
+# memory-profiles each processing step on them, and compares the results with
+# BENCHMARK_BASELINE (written with --save-baseline). A step regresses when it
+# is slower, or its peak memory higher, than the baseline by more than the
+# tolerance (a fraction) and by more than the minimum absolute difference.
+BENCHMARK_DIR = CACHE_DIR / "benchmarks"
+BENCHMARK_BASELINE = BENCHMARK_DIR / "baseline.json"
+BENCHMARK_SCALES = (1, 10, 100)
+BENCHMARK_SEED = 0
+BENCHMARK_TIME_TOLERANCE = 0.25
+BENCHMARK_MIN_TIME_DELTA_S = 0.05
+BENCHMARK_MEMORY_TOLERANCE = 0.20
+BENCHMARK_MIN_MEMORY_DELTA_MB = 20
+
+# --- Batch Ingest ---
+# Per-card outputs of a batch run are written to CARD_OUTPUT_DIR/<card>/
+# before being merged into the files above.
+CARD_OUTPUT_DIR = PROCESSED_DATA_DIR / "cards"
+# Worker processes for batch ingest; None uses one per CPU core.
+BATCH_MAX_WORKERS = None
+
+# --- Historical Archive ---
+# When True, every processed card is also appended to Hive-partitioned
+# Parquet datasets under ARCHIVE_DIR/<dataset>/race_date=.../track=.../,
+# which bris_handicapper.archive can query with partition/predicate pushdown.
+ARCHIVE_DIR = ARCHIVE_DIR
+ARCHIVE_CARDS = False
 
 # Aliases expected by data-processing modules
 PARSED_RACE_DATA = PARSED_RACE_DATA_FILE
@@ -1,7 +1,9 @@
 import pandas as pd
+import pyarrow.feather as feather
 from pathlib import Path
 # Use a relative import to access the centralized path configuration
 from ..config.paths import RAW_DATA_DIR
+from ..bris_handicapper.data_processing.projection import is_arrow_file
 
 def load_parquet_data(file_name: str) -> pd.DataFrame:
     """
@@ -23,7 +25,11 @@ def load_parquet_data(file_name: str) -> pd.DataFrame:
         raise FileNotFoundError(f"Parquet file not found at: {data_file_path}")
 
     try:
-        df = pd.read_parquet(data_file_path)
+        if is_arrow_file(data_file_path):
+            # Uncompressed Arrow IPC: memory-map instead of reading a private copy
+            df = feather.read_feather(data_file_path, memory_map=True)
+        else:
+            df = pd.read_parquet(data_file_path)
         print(f"Successfully loaded {file_name} from {data_file_path}")
         return df
     except Exception as e: